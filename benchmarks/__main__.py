@@ -0,0 +1,227 @@
+"""
+Benchmark suite for yaclog. Run with ``python -m benchmarks --help`` from the repository root.
+"""
+
+#  yaclog: yet another changelog tool
+#  Copyright (c) 2024. Andrew Cassidy
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import click
+
+import yaclog
+from benchmarks.generate import generate as generate_changelog, pathological as pathological_lines, shapes
+from benchmarks.scenarios import scenarios
+
+
+def shape_options(func):
+    """Add options for choosing the shape of a generated changelog"""
+    options = [
+        click.option('--shape', type=click.Choice(list(shapes)), default='medium', show_default=True,
+                     help='Preset changelog shape. Other shape options override the preset.'),
+        click.option('--versions', type=int, help='Number of versions.'),
+        click.option('--sections', type=int, help='Number of sections per version.'),
+        click.option('--entries', type=int, help='Number of entries per section.'),
+        click.option('--code-blocks', type=float, help='Probability of an entry being a code block.'),
+        click.option('--setext', type=float, help='Probability of a version header being setext-style.'),
+        click.option('--links/--no-links', default=None, help='Generate a link table.'),
+        click.option('--size', type=int, help='Approximate size in bytes, overrides --versions.'),
+        click.option('--seed', type=int, default=0, show_default=True, help='Random seed.'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def make_shape(shape, **overrides):
+    return {**shapes[shape], **{k: v for k, v in overrides.items() if v is not None}}
+
+
+@click.group()
+def main():
+    """Benchmark yaclog on large synthetic changelogs."""
+
+
+@main.command()
+@shape_options
+@click.argument('output', type=click.Path(dir_okay=False, writable=True))
+def generate(output, shape, **overrides):
+    """Generate a synthetic changelog and save it to OUTPUT."""
+    text = generate_changelog(**make_shape(shape, **overrides))
+    with open(output, 'w') as fp:
+        fp.write(text)
+    click.echo(f'Wrote {len(text)} bytes to {output}')
+
+
+def measure(func, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    # memory is measured separately, since tracing slows everything down
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'min': min(times), 'median': statistics.median(times), 'repeat': repeat, 'peak_memory': peak}
+
+
+@main.command()
+@shape_options
+@click.option('--repeat', '-r', type=int, default=5, show_default=True, help='Number of timed runs per scenario.')
+@click.option('--scenario', '-s', 'selected', multiple=True, type=click.Choice(list(scenarios)),
+              help='Scenario to run. Can be given multiple times. Defaults to all scenarios.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True), help='Save results as JSON.')
+def run(shape, repeat, selected, output, **overrides):
+    """Run benchmark scenarios."""
+    shape_args = make_shape(shape, **overrides)
+
+    with tempfile.TemporaryDirectory() as td:
+        path = os.path.join(td, 'CHANGELOG.md')
+        text = generate_changelog(**shape_args)
+        with open(path, 'w') as fp:
+            fp.write(text)
+
+        results = {}
+        for name in selected or scenarios:
+            result = results[name] = measure(scenarios[name](path), repeat)
+            click.echo(f"{name:20} {result['min'] * 1000:10.2f} ms {result['peak_memory'] / 1024:12.0f} KiB")
+
+    report = {
+        'meta': {
+            'python': sys.version,
+            'platform': platform.platform(),
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'shape': shape_args,
+            'bytes': len(text),
+        },
+        'results': results,
+    }
+
+    if output:
+        with open(output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+
+
+@main.command()
+@shape_options
+def memory(shape, **overrides):
+    """Measure the memory used by a fully parsed changelog, per entry."""
+    text = generate_changelog(**make_shape(shape, **overrides))
+
+    with tempfile.TemporaryDirectory() as td:
+        path = os.path.join(td, 'CHANGELOG.md')
+        with open(path, 'w') as fp:
+            fp.write(text)
+
+        for name, options in {'default': {}, 'compact': {'compact': True}}.items():
+            tracemalloc.start()
+            changelog = yaclog.read(path, **options)
+            retained, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            entries = sum(len(entries) for version in changelog.versions for entries in version.sections.values())
+            click.echo(f"{name:20} {retained / 1024:12.0f} KiB {retained / entries:10.1f} bytes/entry")
+            del changelog
+
+
+@main.command()
+@click.option('--length', '-n', type=int, default=1000, show_default=True,
+              help='Number of repetitions in the shortest adversarial line.')
+@click.option('--steps', type=int, default=5, show_default=True, help='Number of times to double the length.')
+@click.option('--repeat', '-r', type=int, default=5, show_default=True, help='Number of timed runs per length.')
+@click.option('--max-exponent', type=float, default=1.5, show_default=True,
+              help='Largest allowed growth rate, where 1 is linear and 2 is quadratic.')
+def pathological(length, steps, repeat, max_exponent):
+    """
+    Read changelogs containing adversarial header and link lines of increasing length.
+    Exits with an error if reading time grows faster than linearly in the length of the line.
+    """
+    failures = 0
+    with tempfile.TemporaryDirectory() as td:
+        path = os.path.join(td, 'CHANGELOG.md')
+
+        for name, make_line in pathological_lines.items():
+            times = []
+            for step in range(steps + 1):
+                with open(path, 'w') as fp:
+                    fp.write(f'# Changelog\n\n{make_line(length * 2 ** step)}\n')
+                times.append(measure(lambda: yaclog.read(path), repeat)['min'])
+
+            # time is proportional to length ** exponent
+            exponent = math.log2(times[-1] / times[0]) / steps
+            line = f"{name:20} {times[0] * 1000:10.2f} ms -> {times[-1] * 1000:10.2f} ms " \
+                   f"({2 ** steps}x longer, exponent {exponent:.2f})"
+
+            if exponent > max_exponent:
+                failures += 1
+                click.secho(line, fg='red')
+            else:
+                click.echo(line)
+
+    if failures:
+        raise click.ClickException(f'{failures} input(s) took superlinear time')
+
+
+@main.command()
+@click.argument('before', type=click.File('r'))
+@click.argument('after', type=click.File('r'))
+@click.option('--threshold', '-t', type=float, default=0.1, show_default=True,
+              help='Relative slowdown to report as a regression.')
+def compare(before, after, threshold):
+    """Compare two sets of results saved with `run --output`. Exits with an error if any scenario regressed."""
+    before = json.load(before)
+    after = json.load(after)
+
+    if before['meta']['shape'] != after['meta']['shape']:
+        click.secho('Warning: results were measured with different changelog shapes', fg='yellow', err=True)
+
+    regressions = 0
+    for name, new in after['results'].items():
+        if not (old := before['results'].get(name)):
+            continue
+
+        ratio = new['min'] / old['min']
+        memory_ratio = new['peak_memory'] / max(old['peak_memory'], 1)
+        line = f"{name:20} {old['min'] * 1000:10.2f} ms -> {new['min'] * 1000:10.2f} ms ({ratio:6.2f}x)  " \
+               f"memory {memory_ratio:6.2f}x"
+
+        if ratio > 1 + threshold:
+            regressions += 1
+            click.secho(line, fg='red')
+        elif ratio < 1 - threshold:
+            click.secho(line, fg='green')
+        else:
+            click.echo(line)
+
+    if regressions:
+        raise click.ClickException(f'{regressions} scenario(s) regressed by more than {threshold:.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Deterministic generator for large synthetic changelogs, used by the benchmark suite.
+"""
+
+#  yaclog: yet another changelog tool
+#  Copyright (c) 2024. Andrew Cassidy
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import random
+from typing import Callable, Dict, Iterator
+
+section_names = ['Added', 'Changed', 'Deprecated', 'Removed', 'Fixed', 'Security']
+
+words = ['parser', 'changelog', 'version', 'release', 'header', 'entry', 'section', 'markdown', 'cache', 'token',
+         'fixed', 'added', 'removed', 'improved', 'support', 'for', 'the', 'a', 'when', 'with', 'crash', 'option',
+         'command', 'output', 'file', 'link', 'tag', 'date', 'format', 'performance', 'memory', 'startup']
+
+shapes: Dict[str, Dict] = {
+    'small': dict(versions=50),
+    'medium': dict(versions=1000),
+    'large': dict(versions=10000),
+    'huge': dict(size=100 * 1024 * 1024),
+}
+"""Named changelog shapes that can be passed to :py:func:`generate`"""
+
+
+pathological: Dict[str, Callable[[int], str]] = {
+    'version-tags': lambda n: '## 1.0.0' + ' [tag]' * n + ' x',
+    'version-spaces': lambda n: '## 1.0.0' + ' ' * n + 'x',
+    'header-spaces': lambda n: '#' + ' ' * n + '#x',
+    'link-literal': lambda n: '## [1.0.0' + '](' * n,
+    'link-id': lambda n: '## [1.0.0' + '][' * n + 'x',
+}
+"""Adversarial lines that are slow to parse with backtracking regular expressions, by name.
+Each is a function taking a number of repetitions of the line's pattern, and returning the line"""
+
+
+def _sentence(rng: random.Random, length: int) -> str:
+    return ' '.join(rng.choice(words) for _ in range(length)).capitalize()
+
+
+def _version_name(index: int, count: int) -> str:
+    # count down from the newest version so names are unique and in descending order
+    n = count - index
+    return f'{n // 100}.{n // 10 % 10}.{n % 10}'
+
+
+def iter_changelog(versions: int = 100, sections: int = 3, entries: int = 5, code_blocks: float = 0.1,
+                   setext: float = 0.1, links: bool = True, unreleased: bool = True, seed: int = 0) -> Iterator[str]:
+    """
+    Generate a synthetic changelog one block at a time
+
+    :param versions: How many versions to generate
+    :param sections: How many sections each version has
+    :param entries: How many entries each section has
+    :param code_blocks: The probability of each entry being a code block
+    :param setext: The probability of each version header being a setext-style header
+    :param links: If each version should be linked in a link table at the end of the file
+    :param unreleased: If an unreleased version should be added to the top
+    :param seed: Random seed, the output is identical for the same seed and shape
+    :return: An iterator over blocks of markdown, which should be joined with blank lines
+    """
+
+    rng = random.Random(seed)
+    date = datetime.date(2024, 1, 1)
+
+    yield '# Changelog\n\nAll notable changes to this project will be documented in this file'
+
+    names = []
+    for index in range(versions):
+        if index == 0 and unreleased:
+            name = 'Unreleased'
+            header = name
+        else:
+            name = _version_name(index, versions)
+            date -= datetime.timedelta(days=rng.randint(1, 30))
+            header = f'{name} - {date.isoformat()}'
+            if rng.random() < 0.05:
+                header += ' [YANKED]'
+        names.append(name)
+
+        if links and name != 'Unreleased':
+            header = f'[{name}]' + header[len(name):]
+
+        if rng.random() < setext:
+            yield header + '\n' + '-' * len(header)
+        else:
+            yield '## ' + header
+
+        for section in rng.sample(section_names, min(sections, len(section_names))):
+            yield '### ' + section
+
+            for _ in range(entries):
+                roll = rng.random()
+                if roll < code_blocks:
+                    yield '```python\n' + '\n'.join(_sentence(rng, 6) for _ in range(rng.randint(1, 5))) + '\n```'
+                elif roll < 0.2:
+                    yield '\n'.join(_sentence(rng, 10) for _ in range(rng.randint(1, 3)))
+                else:
+                    yield '- ' + _sentence(rng, rng.randint(4, 12))
+
+    if links:
+        for name in names:
+            if name != 'Unreleased':
+                yield f'[{name}]: https://example.com/project/releases/tag/{name}'
+
+
+def generate(size: int = None, **shape) -> str:
+    """
+    Generate a synthetic changelog
+
+    :param size: Approximate size of the changelog in bytes. If given, the number of versions is chosen to match.
+    :param shape: Keyword arguments to :py:func:`iter_changelog`
+    :return: The changelog text
+    """
+
+    if size is not None:
+        sample_shape = {**shape, 'versions': 100}
+        sample_size = len('\n\n'.join(iter_changelog(**sample_shape)))
+        shape['versions'] = max(1, round(100 * size / sample_size))
+
+    return '\n\n'.join(iter_changelog(**shape)) + '\n'
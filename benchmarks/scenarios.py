@@ -0,0 +1,193 @@
+"""
+Benchmark scenarios. Each scenario is a function taking the path of a generated changelog,
+and returning a function to time. Scenarios that modify the changelog work on their own copy of the file.
+"""
+
+#  yaclog: yet another changelog tool
+#  Copyright (c) 2024. Andrew Cassidy
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import shutil
+from typing import Callable, Dict
+from unittest import mock
+
+from click.testing import CliRunner
+
+import yaclog
+import yaclog.markdown
+from yaclog.changelog import VersionEntry
+from yaclog.cli.__main__ import cli
+
+scenarios: Dict[str, Callable[[str], Callable[[], object]]] = {}
+"""All registered scenarios, by name"""
+
+
+def scenario(func):
+    """Register a benchmark scenario"""
+    scenarios[func.__name__.replace('_', '-')] = func
+    return func
+
+
+def _copy(path: str) -> str:
+    copy_path = path + '.copy.md'
+    shutil.copyfile(path, copy_path)
+    return copy_path
+
+
+def _invoke(args):
+    result = CliRunner().invoke(cli, args)
+    if result.exit_code != 0:
+        raise RuntimeError(f'yaclog {" ".join(args)} failed: {result.output}') from result.exception
+    return result
+
+
+@scenario
+def tokenize(path):
+    with open(path) as fp:
+        text = fp.read()
+    return lambda: yaclog.markdown.tokenize(text)
+
+
+@scenario
+def iter_tokens(path):
+    def run():
+        with open(path) as fp:
+            for _ in yaclog.markdown.iter_tokens(fp):
+                pass
+
+    return run
+
+
+@scenario
+def from_header(path):
+    headers = []
+    with open(path) as fp:
+        for line in fp:
+            if line.startswith('## '):
+                headers.append(line.rstrip('\n'))
+
+    def run():
+        for header in headers:
+            VersionEntry.from_header(header)
+
+    return run
+
+
+@scenario
+def read(path):
+    return lambda: yaclog.read(path)
+
+
+@scenario
+def read_lazy(path):
+    return lambda: yaclog.read(path, lazy=True)
+
+
+@scenario
+def read_compact(path):
+    return lambda: yaclog.read(path, compact=True)
+
+
+@scenario
+def read_parallel(path):
+    return lambda: yaclog.read(path, workers=os.cpu_count() or 1)
+
+
+@scenario
+def read_cached(path):
+    # a cache hit, which should be faster than read-lazy since the headers don't need to be found and parsed
+    cache_dir = path + '.cache'
+
+    def run():
+        with mock.patch.dict(os.environ, {'YACLOG_CACHE_DIR': cache_dir}):
+            return yaclog.read(path, lazy=True, cache=True)
+
+    run()  # fill the cache
+    return run
+
+
+@scenario
+def lookup(path):
+    changelog = yaclog.read(path, lazy=True)
+    names = [version.name for version in changelog.versions]
+    return lambda: [changelog.get_version(name) for name in names]
+
+
+@scenario
+def write(path):
+    changelog = yaclog.read(path)
+    out_path = path + '.out.md'
+    return lambda: changelog.write(out_path, incremental=False)
+
+
+@scenario
+def render(path):
+    # showing versions again from a changelog kept in memory, like the server does
+    changelog = yaclog.read(path)
+    return lambda: [version.text(color=True) for version in changelog.versions]
+
+
+@scenario
+def write_incremental(path):
+    changelog = yaclog.read(path, lazy=True)
+    changelog.versions[0].add_entry('- benchmark entry')
+    out_path = path + '.out.md'
+    return lambda: changelog.write(out_path)
+
+
+@scenario
+def round_trip(path):
+    out_path = path + '.out.md'
+    return lambda: yaclog.read(path).write(out_path, incremental=False)
+
+
+@scenario
+def diff(path):
+    # comparing against a revision with one new entry, like a typical pull request
+    changed_path = path + '.changed.md'
+    changed = yaclog.read(path, lazy=True)
+    changed.versions[0].add_entry('- benchmark entry')
+    changed.write(changed_path)
+    return lambda: yaclog.read(path, lazy=True).diff(yaclog.read(changed_path, lazy=True))
+
+
+@scenario
+def cli_show(path):
+    return lambda: _invoke(['--path', path, 'show'])
+
+
+@scenario
+def cli_show_all(path):
+    return lambda: _invoke(['--path', path, 'show', '--all'])
+
+
+@scenario
+def cli_entry(path):
+    copy_path = _copy(path)
+    return lambda: _invoke(['--path', copy_path, 'entry', '-b', 'benchmark entry', 'added'])
+
+
+@scenario
+def cli_release(path):
+    # each run increments the patch number of the top version again
+    copy_path = _copy(path)
+    return lambda: _invoke(['--path', copy_path, 'release', '-p', '-y'])
+
+
+@scenario
+def cli_entry_fragment(path):
+    fragments = path + '.fragments'
+    return lambda: _invoke(['--path', path, '--fragments', fragments, 'entry', '-b', 'benchmark entry', 'added'])
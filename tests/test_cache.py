@@ -0,0 +1,114 @@
+import contextlib
+import os.path
+import tempfile
+import unittest
+from unittest import mock
+
+from click.testing import CliRunner
+
+import yaclog
+import yaclog.cache
+from tests.common import log_text
+from tests.test_cli import check_result
+from yaclog.changelog import CompactEntries
+from yaclog.cli.__main__ import cli
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        self.path = os.path.join(self.temp_dir.name, 'changelog.md')
+        with open(self.path, 'w') as fd:
+            fd.write(log_text)
+
+        patcher = mock.patch.dict(os.environ, {'YACLOG_CACHE_DIR': self.cache_dir})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def written(self, changelog):
+        out_path = os.path.join(self.temp_dir.name, 'out.md')
+        changelog.write(out_path)
+        with open(out_path) as fd:
+            return fd.read()
+
+    def test_round_trip(self):
+        """Test that a cached changelog is identical to a parsed one"""
+        expected = yaclog.read(self.path)
+
+        first = yaclog.read(self.path, cache=True)
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+
+        with mock.patch.object(yaclog.Changelog, 'read', side_effect=AssertionError('cache was not used')):
+            cached = yaclog.read(self.path, cache=True)
+
+        self.assertEqual(expected.path, cached.path)
+        self.assertEqual(expected.links, cached.links)
+        self.assertEqual([v.sections for v in expected.versions], [v.sections for v in cached.versions])
+        self.assertEqual(self.written(first), self.written(cached))
+
+    def test_lazy(self):
+        """Test that only headers are cached, and bodies are parsed from the file the same way as without a cache"""
+        yaclog.read(self.path, cache=True)
+
+        cached = yaclog.read(self.path, lazy=True, cache=True)
+        self.assertTrue(all(v._source is not None for v in cached.versions))
+        self.assertEqual([v.sections for v in yaclog.read(self.path).versions], [v.sections for v in cached.versions])
+
+        compact = yaclog.read(self.path, compact=True, cache=True)
+        self.assertIsInstance(compact.versions[0].sections['Bullet Points'], CompactEntries)
+        self.assertFalse(any(v.modified for v in compact.versions))
+
+    def test_invalidation(self):
+        """Test that modifying the file invalidates its cache entry"""
+        yaclog.read(self.path, cache=True)
+
+        with open(self.path, 'a') as fd:
+            fd.write('\n\n## New Version\n\n- new entry')
+
+        cached = yaclog.read(self.path, cache=True)
+        self.assertEqual('New Version', cached.versions[-1].name)
+        self.assertEqual(['- new entry'], cached.versions[-1].sections[''])
+
+    def test_eviction(self):
+        """Test that the cache stays under its size limit"""
+        with mock.patch.dict(os.environ, {'YACLOG_CACHE_SIZE': '1'}):
+            yaclog.read(self.path, cache=True)
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def test_read_only(self):
+        """Test that an unwritable cache directory is ignored"""
+        os.makedirs(self.cache_dir)
+        os.chmod(self.cache_dir, 0o555)
+        self.addCleanup(os.chmod, self.cache_dir, 0o755)
+
+        with contextlib.ExitStack() as stack:
+            if os.access(self.cache_dir, os.W_OK):  # such as when running as root
+                stack.enter_context(mock.patch('tempfile.mkstemp', side_effect=PermissionError('read-only')))
+
+            cached = yaclog.read(self.path, cache=True)
+        self.assertEqual([v.name for v in yaclog.read(self.path).versions], [v.name for v in cached.versions])
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def test_evict_removed(self):
+        """Test evicting entries that were removed by another process"""
+        yaclog.read(self.path, cache=True)
+        entries = yaclog.cache._entries()
+        yaclog.cache.clear()
+
+        with mock.patch.object(yaclog.cache, '_entries', return_value=entries):
+            yaclog.cache._evict(0)
+
+    def test_clear(self):
+        """Test clearing the cache from the command line"""
+        runner = CliRunner()
+        yaclog.read(self.path, cache=True)
+
+        check_result(self, result := runner.invoke(cli, ['cache', 'clear']))
+        self.assertIn('Removed 1 entry', result.output)
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,15 @@
+import asyncio
 import datetime
 import os.path
 import tempfile
 import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
 
 import yaclog
+import yaclog.atomic
 from tests.common import log, log_segments, log_text
-from yaclog.changelog import VersionEntry
+from yaclog.changelog import CompactEntries, Entry, VersionEntry
 
 
 class TestParser(unittest.TestCase):
@@ -42,6 +46,408 @@ class TestParser(unittest.TestCase):
         """Test the change entries"""
         self.assertEqual(log.versions[0].sections, self.log.versions[0].sections)
 
+    def test_from_text(self):
+        """Test parsing a changelog from text"""
+        changelog = yaclog.Changelog.from_text(log_text, 'changelog.md')
+        self.assertEqual(os.path.abspath('changelog.md'), changelog.path)
+        self.assertEqual(self.log.preamble, changelog.preamble)
+        self.assertEqual(self.log.links, changelog.links)
+        self.assertEqual([v.sections for v in self.log.versions], [v.sections for v in changelog.versions])
+
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, 'changelog.md')
+            with open(path, 'w') as fd:
+                fd.write(log_text)
+
+            # the text is the base for detecting changes by other processes
+            changelog = yaclog.Changelog.from_text(log_text, path)
+            changelog.versions[0].add_entry('- new entry')
+            changelog.write()
+            self.assertEqual(['- new entry'], yaclog.read(path).versions[0].sections[''][-1:])
+
+            changelog = yaclog.Changelog.from_text(log_text.replace('Tests', 'Other'), path)
+            self.assertRaises(yaclog.atomic.ConflictError, changelog.write)
+
+
+class TestLazyParser(TestParser):
+
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as td:
+            cls.path = os.path.join(td, 'changelog.md')
+            with open(cls.path, 'w') as fd:
+                fd.write(log_text)
+            cls.log = yaclog.read(cls.path, lazy=True)
+
+    def test_deferred(self):
+        """Test that version bodies are not parsed until they are accessed"""
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, 'changelog.md')
+            with open(path, 'w') as fd:
+                fd.write(log_text)
+            lazy_log = yaclog.read(path, lazy=True)
+
+        self.assertEqual(['[Tests]', 'FullVersion', 'Long Version Name'], [v.name for v in lazy_log.versions])
+        self.assertTrue(all(v._source is not None for v in lazy_log.versions))
+        self.assertEqual(log.versions[0].sections, lazy_log.versions[0].sections)
+        self.assertIsNone(lazy_log.versions[0]._source)
+        self.assertIsNotNone(lazy_log.versions[1]._source)
+
+    def test_write(self):
+        """Test that lazy and eager changelogs write identical files"""
+        for name in ['Test-Changelog.md', 'Test-Changelog-Unreleased.md']:
+            with self.subTest(name), tempfile.TemporaryDirectory() as td:
+                source = os.path.join(os.path.dirname(__file__), name)
+                eager_path = os.path.join(td, 'eager.md')
+                lazy_path = os.path.join(td, 'lazy.md')
+
+                yaclog.read(source).write(eager_path, incremental=False)
+                yaclog.read(source, lazy=True).write(lazy_path, incremental=False)
+
+                with open(eager_path) as eager_fd, open(lazy_path) as lazy_fd:
+                    self.assertEqual(eager_fd.read(), lazy_fd.read())
+
+
+class TestCompactParser(TestParser):
+
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as td:
+            cls.path = os.path.join(td, 'changelog.md')
+            with open(cls.path, 'w') as fd:
+                fd.write(log_text)
+            cls.log = yaclog.read(cls.path, compact=True)
+
+    def test_compact(self):
+        """Test that entries are stored compactly until they are modified"""
+        entries = self.log.versions[0].sections['Bullet Points']
+        self.assertIsInstance(entries, CompactEntries)
+        self.assertEqual(log.versions[0].sections['Bullet Points'], entries)
+        self.assertEqual(log.versions[0].sections['Bullet Points'][-1], entries[-1])
+        self.assertEqual(log.versions[0].sections['Bullet Points'][1:], entries[1:])
+
+    def test_write(self):
+        """Test that compact entries can be modified and written"""
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, 'changelog.md')
+            with open(path, 'w') as fd:
+                fd.write(log_text)
+
+            compact_log = yaclog.read(path, compact=True)
+            compact_log.versions[0].add_entry('- new entry', 'Bullet Points')
+            compact_log.write()
+            self.assertEqual(log.versions[0].sections['Bullet Points'] + ['- new entry'],
+                             compact_log.versions[0].sections['Bullet Points'])
+
+            compact_log.versions[1].add_entry('- another entry')
+            compact_log.write()
+            self.assertEqual([v.sections for v in yaclog.read(path).versions],
+                             [v.sections for v in compact_log.versions])
+
+    def test_setext(self):
+        """Test that entries containing converted setext underlines read the same as in other modes"""
+        text = '# Changelog\n\n## 1.0.0\n\n```yaml\nname: x\n---\n```\n\n- entry\n'
+
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, 'changelog.md')
+            with open(path, 'w') as fd:
+                fd.write(text)
+
+            eager, lazy, compact = (yaclog.read(path, **options).versions[0].sections
+                                    for options in [{}, {'lazy': True}, {'compact': True}])
+
+        self.assertEqual(eager, lazy)
+        self.assertEqual(eager, compact)
+
+
+class TestParallelParser(TestParser):
+
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as td:
+            cls.path = os.path.join(td, 'changelog.md')
+            with open(cls.path, 'w') as fd:
+                fd.write(log_text)
+            with mock.patch.object(yaclog, 'parallel_threshold', 0):
+                cls.log = yaclog.read(cls.path, workers=3)
+
+    def test_parallel(self):
+        """Test that parsing in parallel gives the same result as parsing in one process"""
+        # code blocks containing version headers, and setext headers at the start of each part
+        text = '\n\n'.join(['# Changelog', *(f'## {i}.0.0\n\n- entry\n\n```\n## fake\n```' if i % 2 else
+                                             f'{i}.0.0 - 2024-01-01\n---\n\n- entry' for i in range(20, 0, -1))])
+
+        with tempfile.TemporaryDirectory() as td, mock.patch.object(yaclog, 'parallel_threshold', 0):
+            path = os.path.join(td, 'changelog.md')
+
+            for lazy, compact in [(False, False), (True, False), (False, True)]:
+                with self.subTest(lazy=lazy, compact=compact):
+                    with open(path, 'w') as fd:
+                        fd.write(text + '\n\n[19.0.0]: http://endless.horse\n')
+
+                    single = yaclog.read(path, lazy=lazy, compact=compact)
+                    parallel = yaclog.read(path, lazy=lazy, compact=compact, workers=4)
+
+                    self.assertEqual(single.preamble, parallel.preamble)
+                    self.assertEqual(single.links, parallel.links)
+                    self.assertEqual([(v.name, v.date, v.link, v.line_no, v.span, v.sections) for v in single.versions],
+                                     [(v.name, v.date, v.link, v.line_no, v.span, v.sections)
+                                      for v in parallel.versions])
+
+                    parallel.versions[3].add_entry('- new entry')
+                    parallel.write()
+                    self.assertEqual([*single.versions[3].sections[''], '- new entry'],
+                                     yaclog.read(path).versions[3].sections[''])
+
+
+class TestIncrementalWriter(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, 'changelog.md')
+        # a changelog that isn't formatted the same way yaclog would write it
+        self.text = log_text.replace('### Bullet Points', '### Bullet Points ###') + '\n'
+        with open(self.path, 'w') as fd:
+            fd.write(self.text)
+
+    def read_text(self):
+        with open(self.path) as fd:
+            return fd.read()
+
+    def test_unmodified(self):
+        """Test that writing an unmodified changelog leaves the file untouched"""
+        changelog = yaclog.read(self.path, lazy=True)
+        self.assertFalse(any(v.modified for v in changelog.versions))
+        changelog.write()
+        self.assertEqual(self.text, self.read_text())
+
+    def test_modified(self):
+        """Test that only modified versions are rewritten"""
+        changelog = yaclog.read(self.path, lazy=True)
+        changelog.versions[1].add_entry('- new entry', 'added')
+        self.assertTrue(changelog.versions[1].modified)
+        self.assertIsNotNone(changelog.versions[0]._source, 'unmodified version was parsed')
+        changelog.write()
+
+        text = self.read_text()
+        self.assertIn('### Bullet Points ###', text)
+        self.assertIn('## [FullVersion] - 1969-07-20 [TAG1] [TAG2]\n\n### Added\n\n- new entry\n', text)
+        self.assertNotIn('-----', text)
+
+        self.assertEqual(['- new entry'], yaclog.read(self.path).versions[1].sections['Added'])
+
+    def test_new_version(self):
+        """Test adding a new version to the top of the changelog"""
+        changelog = yaclog.read(self.path, lazy=True)
+        changelog.add_version(name='1.0.0').add_entry('- new entry')
+        changelog.write()
+
+        text = self.read_text()
+        self.assertIn(log_segments[1] + '\n\n## 1.0.0\n\n- new entry\n\n\n## [Tests]', text)
+        self.assertTrue(text.endswith(self.text[self.text.index('## [Tests]'):]))
+
+        # writing again should not change anything
+        changelog.write()
+        self.assertEqual(text, self.read_text())
+
+    def test_full(self):
+        """Test rewriting the entire changelog"""
+        changelog = yaclog.read(self.path, lazy=True)
+        changelog.write(incremental=False)
+        self.assertNotIn('### Bullet Points ###', self.read_text())
+
+    def test_other_file(self):
+        """Test that writing to another file doesn't change what is copied from the changelog's own file"""
+        changelog = yaclog.read(self.path, lazy=True)
+        changelog.write(os.path.join(self.temp_dir.name, 'copy.md'), incremental=False)
+        changelog.versions[1].add_entry('- new entry', 'added')
+        changelog.write()
+        self.assertIn('### Bullet Points ###', self.read_text())
+
+
+class TestTransaction(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, 'changelog.md')
+        with open(self.path, 'w') as fd:
+            fd.write(log_text)
+
+    def read_text(self):
+        with open(self.path) as fd:
+            return fd.read()
+
+    def test_commit(self):
+        """Test that writes in a transaction are deferred until it ends"""
+        changelog = yaclog.read(self.path, lazy=True)
+
+        with changelog.transaction():
+            changelog.versions[0].add_entry('- new entry')
+            changelog.write()
+            self.assertEqual(log_text, self.read_text())
+
+            changelog.versions[1].tags.append('NEW')
+            changelog.write()
+
+        self.assertEqual([v.sections for v in changelog.versions],
+                         [v.sections for v in yaclog.read(self.path).versions])
+        self.assertEqual(['TAG1', 'TAG2', 'NEW'], yaclog.read(self.path).versions[1].tags)
+
+    def test_rollback(self):
+        """Test that an exception in a transaction undoes its changes"""
+        changelog = yaclog.read(self.path, lazy=True)
+        expected = [(v.name, v.tags, v.sections) for v in yaclog.read(self.path).versions]
+
+        with self.assertRaises(KeyError):
+            with changelog.transaction():
+                changelog.versions[0].add_entry('- new entry')
+                changelog.versions[1].name = 'Renamed'
+                changelog.versions[1].tags.append('NEW')
+                changelog.add_version(name='New Version')
+                changelog.write()
+                changelog.get_version('Missing')
+
+        self.assertEqual(log_text, self.read_text())
+        self.assertEqual(expected, [(v.name, v.tags, v.sections) for v in changelog.versions])
+        self.assertEqual('FullVersion', changelog['FullVersion'].name)
+        self.assertFalse(any(v.modified for v in changelog.versions))
+
+
+class TestAtomicWrite(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, 'changelog.md')
+        with open(self.path, 'w') as fd:
+            fd.write(log_text)
+
+    def test_conflict(self):
+        """Test that writing over another process's changes fails"""
+        changelog = yaclog.read(self.path, lazy=True)
+        other = yaclog.read(self.path, lazy=True)
+
+        other.versions[0].add_entry('- other entry')
+        other.write()
+        with open(self.path) as fd:
+            expected = fd.read()
+
+        changelog.versions[0].add_entry('- new entry')
+        with self.assertRaises(yaclog.atomic.ConflictError):
+            changelog.write()
+        with open(self.path) as fd:
+            self.assertEqual(expected, fd.read())
+        self.assertEqual([os.path.basename(self.path)], os.listdir(self.temp_dir.name), 'temporary file left behind')
+
+        other.versions[0].add_entry('- another entry')
+        other.write()  # other's own writes don't conflict
+        changelog.write(os.path.join(self.temp_dir.name, 'copy.md'))  # and neither do writes to other files
+
+    def test_lock(self):
+        """Test that writers wait for the lock"""
+        changelog = yaclog.read(self.path, lazy=True)
+        changelog.versions[0].add_entry('- new entry')
+
+        with yaclog.atomic.lock(self.path):
+            with self.assertRaises(TimeoutError):
+                with yaclog.atomic.lock(self.path, timeout=0.05):
+                    pass
+
+        changelog.write()
+        self.assertEqual(['- new entry'], yaclog.read(self.path).versions[0].sections[''][-1:])
+
+        with yaclog.atomic.lock(self.path):
+            with yaclog.atomic.lock(os.path.join(self.temp_dir.name, 'other.md'), timeout=0.05):
+                pass  # files in the same directory are locked separately
+
+    def test_mode(self):
+        """Test that new files get the default permissions without changing the umask"""
+        path = os.path.join(self.temp_dir.name, 'new.md')
+        with mock.patch('os.umask', side_effect=AssertionError('umask was changed')):
+            yaclog.atomic.write(path, log_text)
+
+        if os.name == 'posix':
+            self.assertEqual(0o666 & ~yaclog.atomic._umask, os.stat(path).st_mode & 0o777)
+
+
+class TestAsync(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, 'changelog.md')
+        with open(self.path, 'w') as fd:
+            fd.write(log_text)
+
+    def test_read(self):
+        """Test reading changelogs concurrently in threads and processes"""
+        expected = [v.sections for v in yaclog.read(self.path).versions]
+
+        async def read_all():
+            with ProcessPoolExecutor(2) as executor:
+                changelog = yaclog.Changelog(self.path)
+                changelog.versions = []
+                return await asyncio.gather(yaclog.aread(self.path), yaclog.aread(self.path, lazy=True),
+                                            yaclog.aread(self.path, executor=executor),
+                                            changelog.aread(executor=executor)), changelog
+
+        results, changelog = asyncio.run(read_all())
+        for result in results[:3]:
+            self.assertEqual(expected, [v.sections for v in result.versions])
+        self.assertEqual(expected, [v.sections for v in changelog.versions])
+        self.assertEqual('FullVersion', changelog['FullVersion'].name)
+
+    def test_write(self):
+        """Test writing a changelog, and cancelling a write"""
+        changelog = yaclog.read(self.path)
+
+        async def write():
+            changelog.versions[0].add_entry('- new entry')
+            await changelog.awrite()
+
+            changelog.versions[0].add_entry('- cancelled entry')
+            task = asyncio.ensure_future(changelog.awrite())
+            await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+            with ProcessPoolExecutor(1) as executor, self.assertRaises(TypeError):
+                await changelog.awrite(executor=executor)
+
+        asyncio.run(write())
+        # the cancelled write finished before the task stopped, so there is no half-written changelog
+        self.assertEqual(['- new entry', '- cancelled entry'], yaclog.read(self.path).versions[0].sections[''][-2:])
+        self.assertFalse(changelog.versions[0].modified)
+
+
+class TestDiff(unittest.TestCase):
+    def test_diff(self):
+        """Test comparing two revisions of a changelog"""
+        old = yaclog.Changelog()
+        old._parse(log_text, lazy=True)
+        new = yaclog.Changelog()
+        new._parse(log_text.replace('### Bullet Points', '### Bullet Points ###') + '\n\n', lazy=True)
+        self.assertEqual([], old.diff(new))
+        self.assertIsNone(new.versions[0]._source)  # formatted differently, so parsed to compare the entries
+        self.assertIsNotNone(new.versions[1]._source)  # read from identical lines, so not parsed
+
+        new.versions[0].add_entry('- new entry', 'Bullet Points')
+        new.versions[0].sections['Blocks'].reverse()
+        new.versions[1].date = datetime.date(2024, 1, 1)
+        new.versions[2].name = '2.0.0'
+        del new.versions[0].sections['']
+
+        diffs = {version_diff.name: version_diff for version_diff in old.diff(new)}
+        self.assertEqual(['[Tests]', 'FullVersion', '2.0.0', 'Long Version Name'], list(diffs))
+        self.assertEqual(['modified', 'modified', 'added', 'removed'], [d.status for d in diffs.values()])
+
+        self.assertEqual({'': ([], ['- bullet point with no section']), 'Bullet Points': (['- new entry'], []),
+                          'Blocks': ([], [])}, diffs['[Tests]'].sections)
+        self.assertFalse(diffs['[Tests]'].header_changed)
+        self.assertTrue(diffs['FullVersion'].header_changed)
+        self.assertEqual({}, diffs['FullVersion'].sections)
+        self.assertNotEqual(old.versions[1].digest, new.versions[1].digest)
+        self.assertEqual(old.versions[1].section_digests, new.versions[1].section_digests)
+
 
 class TestWriter(unittest.TestCase):
 
@@ -79,6 +485,79 @@ class TestWriter(unittest.TestCase):
         self.assertEqual(log_segments[7:14], self.log_segments[7:14])
 
 
+class TestLookup(unittest.TestCase):
+    def setUp(self):
+        self.log = yaclog.Changelog()
+        for name in ['Unreleased', '1.0.10', '1.0.1', '1.0.0']:
+            self.log.versions.append(VersionEntry(name))
+        self.log.versions[2].link_id = 'Stable'
+
+    def test_lookup(self):
+        """Test finding versions by name"""
+        lookups = {
+            'exact': ('1.0.1', '1.0.1'),
+            'normalized': ('v1.0', '1.0.0'),
+            'link id': ('stable', '1.0.1'),
+            'substring': ('Unrel', 'Unreleased'),
+            'short version': ('1.0', '1.0.0'),
+            'first substring, not a version': ('.0.1', '1.0.10'),
+        }
+
+        for c, (name, expected) in lookups.items():
+            with self.subTest(c, name=name):
+                self.assertEqual(expected, self.log.get_version(name).name)
+
+        self.assertIs(self.log.versions[0], self.log.get_version())
+        self.assertRaises(KeyError, self.log.get_version, '2.0.0')
+
+    def test_consistency(self):
+        """Test that lookups stay correct when versions are renamed, added, or reordered"""
+        self.assertEqual('1.0.1', self.log['1.0.1'].name)
+
+        self.log.get_version('Unreleased').name = '1.1.0'
+        self.assertIs(self.log.versions[0], self.log['1.1.0'])
+        self.assertRaises(KeyError, self.log.get_version, 'Unreleased')
+
+        new = self.log.add_version(name='1.0.1')
+        self.assertIs(new, self.log['1.0.1'])
+
+        self.log.versions.reverse()
+        self.assertIsNot(new, self.log['1.0.1'])
+
+        self.log.versions = [new]
+        self.assertIs(new, self.log['1.0.1'])
+        self.assertRaises(KeyError, self.log.get_version, '1.0.0')
+
+    def test_independent(self):
+        """Test that modifying versions only discards the index of the changelog they are in"""
+        index = self.log._get_index()
+
+        other = yaclog.Changelog()
+        other.add_version(name='2.0.0').tags.append('YANKED')
+        other.versions[0].name = '2.0.1'
+        self.assertIs(other.versions[0], other['2.0.1'])
+        yaclog.Changelog.from_text(log_text)
+        self.assertIs(index, self.log._get_index())
+
+        self.log.versions[1].tags.append('YANKED')
+        self.assertIsNot(index, self.log._get_index())
+
+    def test_query(self):
+        """Test finding versions with queries, and that they stay correct when versions are modified"""
+        self.assertEqual(['1.0.10', '1.0.1'], [v.name for v in self.log.query(['1.0.1..'])])
+        self.assertEqual(['1.0.1', '1.0.0'], [v.name for v in self.log.query(['..1.0.1', '1.0.0'])])
+        self.assertEqual([], self.log.query(tags=['YANKED']))
+        self.assertRaises(ValueError, self.log.query, ['1.0.0..latest'])
+        self.assertRaises(KeyError, self.log.query, ['1.0.1', '2.0.0'])
+        self.assertEqual(['1.0.1'], [v.name for v in self.log.query(['1.0.1', '2.0.0'], missing_ok=True)])
+
+        self.log.versions[1].tags.append('YANKED')
+        self.log.versions[3].date = datetime.date(2024, 1, 1)
+        self.assertEqual([self.log.versions[1]], self.log.query(tags=['yanked']))
+        self.assertEqual([self.log.versions[3]], self.log.query(since=datetime.date(2023, 1, 1)))
+        self.assertEqual([], self.log.query(['1.0.1..'], since=datetime.date(2023, 1, 1)))
+
+
 class TestVersionEntry(unittest.TestCase):
     def test_header_name(self):
         """Test reading version names from headers"""
@@ -161,6 +640,112 @@ class TestVersionEntry(unittest.TestCase):
                 self.assertIsNone(version.link)
                 self.assertIsNone(version.link_id)
 
+    def test_header_ambiguous(self):
+        """Test reading headers where the name could end in more than one place"""
+        headers = {
+            'tag in name': ('## Test [Foo] x [Bar]', 'Test [Foo] x', None, ['BAR']),
+            'bracket in tag': ('## Test [Foo [Bar]', 'Test', None, ['FOO [BAR']),
+            'space in tag': ('## Test [Foo Bar] [Baz]', 'Test', None, ['FOO BAR', 'BAZ']),
+            'date in name': ('## Test - 2021-04-19 - 2021-04-20', 'Test - 2021-04-19',
+                             datetime.date.fromisoformat('2021-04-20'), []),
+            'dash only': ('## Test - - [Foo]', 'Test -', None, ['FOO']),
+            'failing tags': ('## Test' + ' [Foo]' * 1000 + ' x', 'Test' + ' [Foo]' * 1000 + ' x', None, []),
+        }
+
+        for c, (h, name, date, tags) in headers.items():
+            with self.subTest(c, h=h):
+                version = VersionEntry.from_header(h)
+                self.assertEqual(name, version.name)
+                self.assertEqual(date, version.date)
+                self.assertEqual(tags, version.tags)
+
+    def test_version(self):
+        """Test that version numbers are re-parsed when the version is renamed"""
+        version = VersionEntry('Unreleased')
+        self.assertIsNone(version.version)
+        self.assertFalse(version.released)
+
+        version.name = '1.2.0rc1'
+        self.assertEqual('1.2.0rc1', str(version.version))
+        self.assertFalse(version.released)
+
+        version.name = 'Version 1.2.0'
+        self.assertEqual('1.2.0', str(version.version))
+        self.assertTrue(version.released)
+
+    def test_entries(self):
+        """Test that entries know what kind of block they are, however they were read or added"""
+        expected = [['li'], ['li', 'li', 'li'], ['h4', 'h5', 'h6', 'li', 'p', 'code', 'p']]
+
+        with tempfile.TemporaryDirectory() as td, mock.patch.object(yaclog, 'parallel_threshold', 0):
+            path = os.path.join(td, 'changelog.md')
+            with open(path, 'w') as fd:
+                fd.write(log_text)
+
+            for options in [{}, {'lazy': True}, {'compact': True}, {'compact': True, 'workers': 2}, {'cache': True}]:
+                with self.subTest(**options), mock.patch.dict(os.environ, {'YACLOG_CACHE_DIR': td}):
+                    for _ in range(1 + options.get('cache', False)):  # the second read is from the cache
+                        sections = yaclog.read(path, **options).versions[0].sections
+                        self.assertEqual(expected, [[entry.kind for entry in entries] for entries in sections.values()])
+                        self.assertEqual(log.versions[0].sections, sections)
+
+        version = VersionEntry()
+        version.add_entry('- bullet\n  1. nested\n     more\n     - deeper\n  2. nested')
+        version.add_entry('```\ncode\n```')
+        version.add_entry(Entry('- not a bullet', 'p'))
+        version.sections['Fixed'] = ['#### Header']
+        version.sections['Fixed'].append('plain string')
+
+        self.assertEqual(['li', 'code', 'p'], [entry.kind for entry in version.sections['']])
+        self.assertEqual('h4', version.sections['Fixed'][0].kind)
+        self.assertEqual(['1. nested\n   more\n   - deeper', '2. nested'], version.sections[''][0].children)
+        self.assertEqual(['- deeper'], version.sections[''][0].children[0].children)
+        self.assertEqual([], version.sections[''][1].children)
+        self.assertIn('#### Header\n\nplain string', version.text())
+
+    def test_render_cache(self):
+        """Test that rendered text is reused until the version is modified"""
+        version = VersionEntry('1.0.0', tags=['Foo'])
+        version.add_entry('- first', 'Added')
+
+        mutations = {
+            'name': lambda v: setattr(v, 'name', '1.0.1'),
+            'date': lambda v: setattr(v, 'date', datetime.date(2024, 1, 1)),
+            'link': lambda v: setattr(v, 'link', 'https://example.com'),
+            'tags': lambda v: v.tags.append('BAR'),
+            'sections': lambda v: v.sections.pop('Added'),
+            'new section': lambda v: v.sections.__setitem__('Fixed', ['- fix']),
+            'entries': lambda v: v.sections['Fixed'].append('- second'),
+            'assigned entries': lambda v: v.sections.setdefault('Removed', []).append('- gone'),
+            'add_entry': lambda v: v.add_entry('- third', 'Changed'),
+        }
+
+        for name, mutate in mutations.items():
+            with self.subTest(name):
+                text = version.text(color=True)
+                self.assertIs(text, version.text(color=True))
+                self.assertIs(version.body(md=False, sections=['Fixed']), version.body(md=False, sections=['FIXED']))
+
+                mutate(version)
+                self.assertNotEqual(text, version.text(color=True))
+                self.assertEqual(version._render_text(True, True, None), version.text(color=True))
+
+    def test_render_cache_compact(self):
+        """Test that rendered text is reused until compact entries are modified, including in parallel reads"""
+        with tempfile.TemporaryDirectory() as td, mock.patch.object(yaclog, 'parallel_threshold', 0):
+            path = os.path.join(td, 'changelog.md')
+            with open(path, 'w') as fd:
+                fd.write(log_text)
+
+            versions = [yaclog.read(path, compact=True, workers=workers).versions[0] for workers in (1, 3)]
+
+        for workers, version in zip((1, 3), versions):
+            with self.subTest(workers=workers):
+                text = version.text()
+                self.assertIs(text, version.text())
+                version.sections['Bullet Points'][0] = '- replaced'
+                self.assertIn('- replaced', version.text())
+
 
 if __name__ == '__main__':
     unittest.main()
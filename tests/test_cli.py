@@ -1,7 +1,16 @@
+import datetime
+import json
 import os.path
+import pstats
+import socket
+import subprocess
+import sys
+import tempfile
 import unittest
 import traceback
+from unittest import mock
 
+import click
 import git
 from click.testing import CliRunner
 
@@ -294,6 +303,10 @@ class TestShow(unittest.TestCase):
                     self.assertEqual(t[2].join([t[1](v, {'md': True}) for v in self.log.versions]),
                                      result.output.strip(), 'incorrect markdown output')
 
+                    check_result(self, result := self.runner.invoke(cli, ['show', '-a', '--pager'] + t[0]))
+                    self.assertEqual(t[2].join([t[1](v, {'md': False}) for v in self.log.versions]),
+                                     result.output.strip(), 'incorrect paged output')
+
     def test_show_version(self):
         with self.runner.isolated_filesystem():
             self.log.write(self.location)
@@ -318,6 +331,551 @@ class TestShow(unittest.TestCase):
                         self.assertEqual(t[1](version, {'md': True}),
                                          result.output.strip(), 'incorrect markdown output')
 
+    def test_show_no_version(self):
+        """Test showing the version number when none can be inferred"""
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            runner.invoke(cli, ['init'])
+            runner.invoke(cli, ['entry', '-b', 'entry'])
+
+            result = runner.invoke(cli, ['show', '--version'])
+            check_result(self, result, False)
+            self.assertIn('no release before it', result.output)
+
+            check_result(self, result := runner.invoke(cli, ['show', '--json']))
+            self.assertIsNone(json.loads(result.output)[0]['inferred_version'])
+
+            check_result(self, result := runner.invoke(cli, ['show', '---gh-actions']))
+            self.assertIn('version=\n', result.output)
+
+    def test_show_query(self):
+        """Test showing versions matching ranges and filters"""
+        for version, day in zip(self.log.versions, [datetime.date(2024, 3, 1), None,
+                                                    datetime.date(2024, 2, 1), datetime.date(2024, 1, 1)]):
+            version.date = day
+
+        queries = {
+            'range': (['1.0.0..3.0.0'], ['Version 2.0.0', '1.0.0']),
+            'open range': (['2.0.0..'], ['4.0.0 "Euclid"', 'Version 2.0.0']),
+            'range and name': (['..1.0', 'Three'], ['Three Point Oh', '1.0.0']),
+            'tag': (['--tag', 'tagged'], ['4.0.0 "Euclid"']),
+            'since': (['--since', '2024-02-01'], ['4.0.0 "Euclid"', 'Version 2.0.0']),
+            'until': (['--until', '2024-01-31'], ['1.0.0']),
+            'since and range': (['--since', '2024-02-01', '..3.0.0'], ['Version 2.0.0']),
+            'section': (['--section', 'ADDED'], ['Version 2.0.0']),
+            'no matches': (['--tag', 'missing'], []),
+        }
+
+        with self.runner.isolated_filesystem():
+            self.log.write(self.location)
+
+            for c, (args, expected) in queries.items():
+                with self.subTest(c, args=args):
+                    check_result(self, result := self.runner.invoke(cli, ['show', '-n'] + args))
+                    self.assertEqual(expected, result.output.splitlines())
+
+            check_result(self, result := self.runner.invoke(cli, ['show', '--section', 'added']))
+            self.assertEqual(self.log.versions[2].text(md=False, sections=['Added']), result.output.strip())
+            self.assertNotIn('entry number 1', result.output)
+
+            check_result(self, self.runner.invoke(cli, ['show', 'one..2.0.0']), False)
+
+    def test_show_json(self):
+        """Test showing versions as JSON"""
+        with self.runner.isolated_filesystem():
+            self.log.write(self.location)
+
+            check_result(self, result := self.runner.invoke(cli, ['show', '--json', '--all']))
+            records = json.loads(result.output)
+            self.assertEqual([v.name for v in self.log.versions], [r['name'] for r in records])
+
+            check_result(self, result := self.runner.invoke(cli, ['show', '--ndjson', '--all']))
+            self.assertEqual(records, [json.loads(line) for line in result.output.splitlines()])
+
+            version = self.log.versions[2]
+            record = records[2]
+            self.assertEqual('2.0.0', record['version'])
+            self.assertTrue(record['released'])
+            self.assertEqual(version.sections, record['sections'])
+            self.assertEqual(version.header(md=True), record['header']['md'])
+            self.assertEqual(version.body(md=False), record['body']['txt'])
+            self.assertEqual(['TAGGED'], records[0]['tags'])
+            self.assertEqual('2.0.1', records[1]['inferred_version'])
+
+            check_result(self, result := self.runner.invoke(cli, ['show', '--json', '--tag', 'missing']))
+            self.assertEqual([], json.loads(result.output))
+
+            check_result(self, result := self.runner.invoke(cli, ['show', '---gh-actions']))
+            outputs = dict(line.split('=', 1) for line in result.output.splitlines())
+            self.assertEqual(records[0]['name'], outputs['name'])
+            self.assertEqual(records[0], json.loads(outputs['json']))
+            with open(outputs['body-file']) as fd:
+                self.assertEqual(records[0]['body']['txt'], fd.read())
+            os.remove(outputs['body-file'])
+
+    def test_broken_pipe(self):
+        """Test that showing a long changelog stops quietly when the reader closes the pipe"""
+        for i in range(2000):
+            self.log.add_version(len(self.log.versions), name=f'0.0.{i}').add_entry(f'- entry number {i}' * 10)
+
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, self.location)
+            self.log.write(path)
+
+            process = subprocess.Popen([sys.executable, '-m', 'yaclog.cli', '--path', path, 'show', '--all'],
+                                       cwd=os.path.dirname(os.path.dirname(__file__)),
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            self.assertEqual('4.0.0 "Euclid" - [TAGGED]\n', process.stdout.readline())
+            process.stdout.close()
+            process.wait()
+
+            self.assertEqual('', process.stderr.read())
+            process.stderr.close()
+            self.assertEqual(1, process.returncode)
+
+
+class TestBatch(unittest.TestCase):
+    def test_batch(self):
+        """Test running several commands at once"""
+        runner = CliRunner()
+        script = '\n'.join([
+            'entry -b "entry number 1" added',
+            '# a comment',
+            '',
+            '["entry", "-p", "entry number 2"]',
+            'tag beta',
+            'release 1.0.0 -y',
+        ])
+
+        with runner.isolated_filesystem():
+            runner.invoke(cli, ['init'])
+            check_result(self, runner.invoke(cli, ['batch'], input=script))
+
+            in_log = yaclog.read('CHANGELOG.md')
+            self.assertEqual('1.0.0', in_log.versions[0].name)
+            self.assertEqual(['BETA'], in_log.versions[0].tags)
+            self.assertEqual({'': ['entry number 2'], 'Added': ['- entry number 1']}, in_log.versions[0].sections)
+
+            with open('script.txt', 'w') as fd:
+                fd.write('entry -b "entry number 3"\ntag alpha 9.9.9')
+
+            with open('CHANGELOG.md') as fd:
+                before = fd.read()
+            check_result(self, result := runner.invoke(cli, ['batch', 'script.txt']), False)
+            self.assertIn('Line 2', result.output)
+            with open('CHANGELOG.md') as fd:
+                self.assertEqual(before, fd.read(), 'failed batch modified the changelog')
+
+            for line in ['init', 'release -c 2.0.0', '{"command": "entry"}']:
+                with self.subTest(line=line):
+                    check_result(self, runner.invoke(cli, ['batch'], input=line), False)
+
+    def test_retry(self):
+        """Test that output is only shown once when a batch is run again after a conflict"""
+        runner = CliRunner()
+
+        with runner.isolated_filesystem():
+            runner.invoke(cli, ['init'])
+            file_digest = yaclog.atomic.file_digest
+            digests = [lambda path: 'changed by another process', file_digest]
+
+            with mock.patch.object(yaclog.atomic, 'file_digest', side_effect=lambda path: digests.pop(0)(path)):
+                result = runner.invoke(cli, ['batch'], input='entry -b "entry number 1"\nshow -b')
+            check_result(self, result)
+            self.assertEqual([], digests, 'the batch was not run again')
+            self.assertEqual('Created 1 entry\n- entry number 1\n', result.output)
+
+
+class TestConcurrency(unittest.TestCase):
+    def test_concurrent_entries(self):
+        """Test that processes adding entries at the same time don't lose each other's changes"""
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, 'CHANGELOG.md')
+            yaclog.Changelog(path).write()
+
+            processes = [subprocess.Popen([sys.executable, '-m', 'yaclog.cli', '--path', path,
+                                           'entry', '-b', f'entry number {i}'],
+                                          cwd=os.path.dirname(os.path.dirname(__file__)),
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+                         for i in range(8)]
+            for process in processes:
+                _, stderr = process.communicate()
+                self.assertEqual(0, process.returncode, stderr)
+
+            entries = yaclog.read(path).versions[0].sections['']
+            self.assertEqual({f'- entry number {i}' for i in range(8)}, set(entries))
+            self.assertEqual(['CHANGELOG.md'], os.listdir(td))
+
+
+class TestScan(unittest.TestCase):
+    def test_scan(self):
+        """Test showing versions from many changelogs at once"""
+        runner = CliRunner()
+
+        with runner.isolated_filesystem():
+            for i, package in enumerate(['b', 'a', 'c/d', '.hidden']):
+                path = os.path.join(package, 'CHANGELOG.md')
+                os.makedirs(package)
+                runner.invoke(cli, ['--path', path, 'init'])
+                runner.invoke(cli, ['--path', path, 'entry', '-b', f'entry in {package}', 'added'])
+                if i % 2:
+                    runner.invoke(cli, ['--path', path, 'release', '1.0.0'])
+
+            check_result(self, result := runner.invoke(cli, ['scan', '-n']))
+            self.assertEqual('a/CHANGELOG.md: 1.0.0\nb/CHANGELOG.md: Unreleased\nc/d/CHANGELOG.md: Unreleased\n',
+                             result.output)
+
+            check_result(self, result := runner.invoke(cli, ['scan', '-r', 'c', '-b']))
+            self.assertEqual('d/CHANGELOG.md\n\nADDED\n\n- entry in c/d\n', result.output)
+
+            check_result(self, result := runner.invoke(cli, ['scan', '--ndjson', '1.0.0']))
+            records = [json.loads(line) for line in result.output.splitlines()]
+            self.assertEqual([('a/CHANGELOG.md', '1.0.0')], [(r['changelog'], r['name']) for r in records])
+
+            # changelogs with only some of the versions show the ones they have
+            check_result(self, result := runner.invoke(cli, ['scan', '-n', '1.0.0', 'Unreleased']))
+            self.assertEqual('a/CHANGELOG.md: 1.0.0\nb/CHANGELOG.md: Unreleased\nc/d/CHANGELOG.md: Unreleased\n',
+                             result.output)
+
+            check_result(self, runner.invoke(cli, ['scan', '1..2..3']), False)
+
+            paths = ['a/CHANGELOG.md', 'b/CHANGELOG.md', 'c/d/CHANGELOG.md'] * 4
+            with mock.patch.object(yaclog, 'parallel_threshold', 0):
+                changelogs = yaclog.read_many(paths, workers=2)
+            self.assertEqual([c.path for c in map(yaclog.Changelog, paths)], [c.path for c in changelogs])
+            self.assertEqual(['- entry in a'], changelogs[0]['1.0.0'].sections['Added'])
+
+
+class TestDiff(unittest.TestCase):
+    def test_diff(self):
+        """Test showing changes between git revisions"""
+        runner = CliRunner()
+
+        with runner.isolated_filesystem():
+            repo = git.Repo.init(os.curdir)
+            with repo.config_writer() as cw:
+                cw.set_value('user', 'email', 'unit-tester@example.com')
+                cw.set_value('user', 'name', 'unit-tester')
+            repo.index.commit('initial commit')
+
+            runner.invoke(cli, ['init'])
+            runner.invoke(cli, ['entry', '-b', 'first entry', 'added'])
+            runner.invoke(cli, ['release', '1.0.0', '-y'])
+            repo.index.add('CHANGELOG.md')
+            repo.index.commit('release')
+
+            result = runner.invoke(cli, ['diff', 'HEAD~1', 'HEAD'])
+            check_result(self, result)
+            self.assertIn('Added 1.0.0', result.output)
+            self.assertIn('+ - first entry', result.output)
+
+            runner.invoke(cli, ['entry', '-b', 'second entry', 'fixed'])
+            result = runner.invoke(cli, ['diff'])
+            check_result(self, result)
+            self.assertIn('Added Unreleased', result.output)
+            self.assertNotIn('1.0.0', result.output)
+
+            runner.invoke(cli, ['tag', 'yanked', '1.0.0'])
+            result = runner.invoke(cli, ['diff'])
+            self.assertEqual(3, result.exit_code, result.output)
+            self.assertIn('Modified 1.0.0 (released)', result.output)
+            self.assertIn('tags: none -> [YANKED]', result.output)
+
+            result = runner.invoke(cli, ['diff', 'not-a-revision'])
+            check_result(self, result, False)
+            self.assertIn('Unknown revision', result.output)
+
+    def test_diff_path(self):
+        """Test finding the changelog in git revisions through symlinks"""
+        runner = CliRunner()
+
+        with runner.isolated_filesystem():
+            os.mkdir('repo')
+            os.symlink('repo', 'link')
+            repo = git.Repo.init('repo')
+            with repo.config_writer() as cw:
+                cw.set_value('user', 'email', 'unit-tester@example.com')
+                cw.set_value('user', 'name', 'unit-tester')
+
+            linked_path = os.path.abspath(os.path.join('link', 'CHANGELOG.md'))
+            os.chdir('repo')
+            runner.invoke(cli, ['init'])
+            runner.invoke(cli, ['entry', '-b', 'first entry', 'added'])
+            repo.index.add('CHANGELOG.md')
+            repo.index.commit('initial commit')
+
+            result = runner.invoke(cli, ['--path', linked_path, 'diff'])
+            check_result(self, result)
+            self.assertEqual('', result.output)
+
+            result = runner.invoke(cli, ['--path', os.path.join(os.pardir, 'CHANGELOG.md'), 'diff'])
+            check_result(self, result, False)
+            self.assertIn('is not in the git repo', result.output)
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'Unix sockets are not available')
+class TestDaemon(unittest.TestCase):
+    def test_daemon(self):
+        """Test running commands in a server"""
+        runner = CliRunner()
+
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, 'CHANGELOG.md')
+            env = {'YACLOG_SOCKET': os.path.join(td, 'yaclog.sock'), 'YACLOG_PATH': path}
+            runner.invoke(cli, ['init'], env=env)
+
+            # with no server, commands run as usual
+            check_result(self, runner.invoke(cli, ['--daemon', 'entry', '-b', 'entry number 1'], env=env))
+
+            server = subprocess.Popen([sys.executable, '-m', 'yaclog.cli', 'serve'], env={**os.environ, **env},
+                                      cwd=os.path.dirname(os.path.dirname(__file__)), stderr=subprocess.PIPE)
+            self.addCleanup(server.wait)
+            self.addCleanup(server.kill)
+            server.stderr.readline()  # wait for it to start
+
+            with mock.patch.object(yaclog.changelog.Changelog, 'read', side_effect=AssertionError('not in server')):
+                check_result(self, runner.invoke(cli, ['--daemon', 'entry', '-b', 'entry number 2'], env=env))
+                check_result(self, result := runner.invoke(cli, ['--daemon', 'show', '-b'], env=env))
+                self.assertEqual('- entry number 1\n- entry number 2\n', result.output)
+
+                with open(path, 'a') as fd:
+                    fd.write('\n- entry number 3\n')
+                check_result(self, result := runner.invoke(cli, ['--daemon', 'show', '-b'], env=env))
+                self.assertIn('- entry number 3', result.output)
+
+                check_result(self, result := runner.invoke(cli, ['--daemon', 'show', '9.9.9'], env=env), False)
+                self.assertIn('not found', result.output)
+
+            check_result(self, runner.invoke(cli, ['serve', '--stop'], env=env))
+            self.assertEqual(0, server.wait(5))
+            check_result(self, runner.invoke(cli, ['serve', '--stop'], env=env), False)
+
+    def test_unresponsive(self):
+        """Test that commands run as usual if the server doesn't answer"""
+        from yaclog.cli import daemon
+
+        with tempfile.TemporaryDirectory() as td, socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            socket_path = os.path.join(td, 'yaclog.sock')
+            server.bind(socket_path)
+            server.listen()
+
+            with mock.patch.object(daemon, 'response_timeout', 0.05):
+                self.assertIsNone(daemon.request(['show'], socket_path, read_only=True))
+                # the server may have run the command anyway, so it isn't run again
+                with self.assertRaises(click.ClickException):
+                    daemon.request(['entry', '-b', 'entry'], socket_path)
+
+            # other users' servers aren't sent anything
+            with mock.patch('os.getuid', return_value=os.getuid() + 1):
+                self.assertIsNone(daemon.request(['show'], socket_path, read_only=True))
+
+
+class TestWatch(unittest.TestCase):
+    def test_update(self):
+        """Test that only the files of versions that changed are rewritten"""
+        from yaclog.cli.__main__ import _version_record
+        from yaclog.cli.watch import Watcher
+
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, 'CHANGELOG.md')
+            with open(os.path.join(os.path.dirname(__file__), 'Test-Changelog.md')) as fd:
+                text = fd.read()
+            with open(path, 'w') as fd:
+                fd.write(text)
+
+            out = os.path.join(td, 'out')
+            watcher = Watcher(path, out, ['md', 'json'], _version_record)
+            self.assertEqual(len(yaclog.read(path).versions) * 2, len(watcher.update()))
+            self.assertEqual([], watcher.update())
+
+            with open(os.path.join(out, '0.12.0-Intrepid.json')) as fd:
+                self.assertEqual('0.12.0 "Intrepid"', json.load(fd)['name'])
+
+            log = yaclog.read(path)
+            log.get_version('0.12.0').add_entry('- new entry')
+            log.versions.remove(log.get_version('0.11.0'))
+            log.write()
+
+            self.assertEqual({'0.12.0-Intrepid.md', '0.12.0-Intrepid.json', '0.11.0-Eagle.md', '0.11.0-Eagle.json'},
+                             {os.path.basename(p) for p in watcher.update()})
+            self.assertFalse(os.path.exists(os.path.join(out, '0.11.0-Eagle.md')))
+            with open(os.path.join(out, '0.12.0-Intrepid.md')) as fd:
+                self.assertIn('- new entry', fd.read())
+
+    def test_errors(self):
+        """Test that the watcher keeps running if an update fails"""
+        from yaclog.cli.__main__ import _version_record
+        from yaclog.cli.watch import Watcher
+
+        class Stop(Exception):
+            pass
+
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, 'CHANGELOG.md')
+            with open(path, 'w') as fd:
+                fd.write('## 1.0.0\n\npara\n# h1\ntext')  # a file the tokenizer fails on
+
+            def fix():
+                with open(path, 'w') as fd:
+                    fd.write('# Changelog\n\n## 1.0.0\n\n- entry\n')
+
+            def stop():
+                raise Stop()
+
+            steps = [fix, lambda: None, stop]  # the interval, the debounce, and then the next interval
+            errors, updates = [], []
+            watcher = Watcher(path, os.path.join(td, 'out'), ['md'], _version_record)
+            with mock.patch('time.sleep', side_effect=lambda _: steps.pop(0)()), self.assertRaises(Stop):
+                watcher.watch(0, 0, updates.append, errors.append)
+
+            self.assertEqual(1, len(errors))
+            self.assertEqual([[os.path.join(td, 'out', '1.0.0.md')]], updates)
+
+    def test_once(self):
+        """Test writing version files from the command line"""
+        runner = CliRunner()
+
+        with runner.isolated_filesystem():
+            runner.invoke(cli, ['init'])
+            runner.invoke(cli, ['entry', '-b', 'entry number 1'])
+            check_result(self, result := runner.invoke(cli, ['watch', '--once', '-o', 'out', '-f', 'txt']))
+            self.assertIn('Updated 1 file', result.output)
+            with open(os.path.join('out', 'Unreleased.txt')) as fd:
+                self.assertEqual('Unreleased\n\n- entry number 1\n', fd.read())
+
+
+class TestFragments(unittest.TestCase):
+    def test_fragments(self):
+        """Test adding entries as fragments and folding them into the changelog"""
+        runner = CliRunner()
+
+        with runner.isolated_filesystem():
+            runner.invoke(cli, ['init'])
+            runner.invoke(cli, ['entry', '-b', 'entry 0'])
+            runner.invoke(cli, ['release', '1.0.0'])
+            with open('CHANGELOG.md') as fd:
+                before = fd.read()
+
+            with mock.patch.object(yaclog.Changelog, 'read', side_effect=AssertionError('changelog was read')):
+                check_result(self, runner.invoke(cli, ['--fragments', 'changes', 'entry', '-b', 'entry 1', 'added']))
+                check_result(self, runner.invoke(cli, ['--fragments', 'changes', 'entry', '-p', 'entry 2']))
+                check_result(self, runner.invoke(cli, ['--fragments', 'changes', 'entry', '-b', 'entry 3', 'added']))
+
+            self.assertEqual(3, len(os.listdir('changes')))
+            with open('CHANGELOG.md') as fd:
+                self.assertEqual(before, fd.read(), 'adding a fragment modified the changelog')
+
+            check_result(self, result := runner.invoke(cli, ['--fragments', 'changes', 'show', '-b']))
+            self.assertEqual('entry 2\n\nADDED\n\n- entry 1\n- entry 3\n', result.output)
+            self.assertEqual(3, len(os.listdir('changes')), 'show removed fragments')
+
+            for args in [['tag', 'foo', '1.0.0'], ['format'], ['entry', '-b', 'entry 4', 'added', '1.0.0'],
+                         ['batch']]:
+                with self.subTest(args[0]):
+                    result = runner.invoke(cli, ['--fragments', 'changes', *args], input='show\ntag bar 1.0.0\n')
+                    check_result(self, result)
+                    self.assertEqual(3, len(os.listdir('changes')), f'{args[0]} removed fragments')
+                    self.assertNotIn('entry 1', yaclog.read('CHANGELOG.md').versions[0].text())
+
+            check_result(self, runner.invoke(cli, ['--fragments', 'changes', 'release', '1.1.0']))
+            self.assertEqual([], os.listdir('changes'))
+
+            in_log = yaclog.read('CHANGELOG.md')
+            self.assertEqual(['1.1.0', '1.0.0'], [v.name for v in in_log.versions])
+            self.assertEqual({'': ['entry 2'], 'Added': ['- entry 1', '- entry 3']}, in_log.versions[0].sections)
+
+    def test_fragment_links(self):
+        """Test that fragments with link definitions are rejected instead of losing the links"""
+        runner = CliRunner()
+
+        with runner.isolated_filesystem():
+            runner.invoke(cli, ['init'])
+            os.mkdir('changes')
+            with open(os.path.join('changes', 'link.md'), 'w') as fd:
+                fd.write('- fixed [a bug][1]\n\n[1]: http://endless.horse\n')
+
+            result = runner.invoke(cli, ['--fragments', 'changes', 'release', '1.0.0'])
+            check_result(self, result, False)
+            self.assertIn('contains link definitions', result.output)
+            self.assertEqual(['link.md'], os.listdir('changes'))
+
+    def test_fragment_headers(self):
+        """Test that fragments with headers that would become versions are rejected"""
+        runner = CliRunner()
+
+        with runner.isolated_filesystem():
+            runner.invoke(cli, ['init'])
+            os.mkdir('changes')
+            for header in ['## Oops heading', 'Oops heading\n---', '# Oops heading']:
+                with self.subTest(header):
+                    with open(os.path.join('changes', 'header.md'), 'w') as fd:
+                        fd.write(f'- entry\n\n{header}\n\n- another entry\n')
+
+                    result = runner.invoke(cli, ['--fragments', 'changes', 'release', '1.0.0'])
+                    check_result(self, result, False)
+                    self.assertIn('header on line 3', result.output)
+                    self.assertEqual(['header.md'], os.listdir('changes'))
+                    self.assertEqual([], yaclog.read('CHANGELOG.md').versions)
+
+
+class TestProfile(unittest.TestCase):
+    def test_profile(self):
+        """Test printing and saving profiles"""
+        runner = CliRunner()
+
+        with runner.isolated_filesystem():
+            runner.invoke(cli, ['init'])
+            runner.invoke(cli, ['entry', '-b', 'entry number 1'])
+
+            check_result(self, result := runner.invoke(cli, ['--profile', 'show']))
+            self.assertIn('load', result.output)
+            self.assertIn('total', result.output)
+
+            check_result(self, runner.invoke(cli, ['--profile-output', 'trace.json', 'entry', '-b', 'entry 2']))
+            with open('trace.json') as fp:
+                names = {event['name'] for event in json.load(fp)['traceEvents']}
+            self.assertLessEqual({'load', 'read', 'write'}, names)
+
+            check_result(self, runner.invoke(cli, ['--profile-output', 'profile.pstats', 'show']))
+            self.assertGreater(pstats.Stats('profile.pstats').total_calls, 0)
+
+
+class TestStartup(unittest.TestCase):
+    import_budget = 0.25
+    """Generous limit on the time in seconds to import everything needed to print the help text"""
+
+    def test_import_time(self):
+        """Test that starting the CLI doesn't import more than it needs to"""
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'yaclog.cli', '--help'],
+                                capture_output=True, text=True, check=True)
+
+        imported = set()
+        total = 0
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line.split('|')
+            imported.add(name.strip())
+            if not name.startswith('  '):  # only count top-level imports, they include the time of their children
+                total += int(cumulative) / 1e6
+
+        for module in ['git', 'packaging', 'tomlkit']:
+            self.assertNotIn(module, imported, f'{module} was imported at startup')
+        self.assertLess(total, self.import_budget, 'importing the CLI took too long')
+
+    def test_deferred_load(self):
+        """Test that the changelog is only read by commands that need it"""
+        runner = CliRunner()
+
+        with runner.isolated_filesystem():
+            with mock.patch('yaclog.read', side_effect=AssertionError('changelog was read')):
+                check_result(self, runner.invoke(cli, ['show', '--help']))
+                check_result(self, runner.invoke(cli, ['init']))
+
+            check_result(self, runner.invoke(cli, ['entry', '-b', 'entry number 1']))
+            check_result(self, result := runner.invoke(cli, ['show', '--name']))
+            self.assertEqual('Unreleased', result.output.strip())
+
 
 if __name__ == '__main__':
     unittest.main()
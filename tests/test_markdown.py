@@ -0,0 +1,102 @@
+import io
+import os.path
+import unittest
+
+import yaclog.markdown as markdown
+from tests.common import log_text
+from yaclog.changelog import Entry
+
+
+class TestTokenizer(unittest.TestCase):
+    def assertTokensEqual(self, expected, actual):
+        self.assertEqual([(t.line_no, t.kind, t.lines) for t in expected],
+                         [(t.line_no, t.kind, t.lines) for t in actual])
+
+    def test_iter_tokens(self):
+        """Test that the streaming tokenizer matches the string tokenizer"""
+        tokens, links = markdown.tokenize(log_text)
+
+        for c, fp in {'file': io.StringIO(log_text), 'lines': log_text.split('\n')}.items():
+            with self.subTest(c):
+                stream_links = {}
+                self.assertTokensEqual(tokens, list(markdown.iter_tokens(fp, stream_links)))
+                self.assertEqual(links, stream_links)
+
+    def test_iter_tokens_file(self):
+        """Test the streaming tokenizer on a real changelog file"""
+        path = os.path.join(os.path.dirname(__file__), 'Test-Changelog.md')
+        with open(path) as fp:
+            tokens, links = markdown.tokenize(fp.read())
+        with open(path) as fp:
+            self.assertTokensEqual(tokens, list(markdown.iter_tokens(fp)))
+
+    def test_iter_setext(self):
+        """Test that streaming setext conversion matches the regex conversion"""
+        texts = {
+            'h1': 'Preamble\nTitle\n=====\n\nbody',
+            'h2': 'Preamble\nTitle\n-----\n\nbody',
+            'first line': 'Title\n=====\n',
+            'last line': 'Preamble\nTitle\n-----',
+            'trailing newline': 'Preamble\nTitle\n-----\n',
+            'stacked': 'Preamble\nTitle\n=====\n-----\nTitle 2\n---\n',
+            'underline after first line': 'Title\n===\n---\n',
+            'trailing space': 'Preamble\nTitle\n---  \n',
+        }
+
+        for c, text in texts.items():
+            with self.subTest(c, text=text):
+                self.assertEqual(markdown.convert_setext(text).split('\n'),
+                                 list(markdown.iter_setext(markdown.iter_lines(io.StringIO(text)))))
+
+
+class TestBlocks(unittest.TestCase):
+    def test_block_kind(self):
+        """Test that blocks are classified the same as by the tokenizer"""
+        blocks = ['- bullet', '* bullet\n  - nested', '1. numbered', '```\ncode\n```', '#### Header', '#NotHeader',
+                  'paragraph\n- not a bullet', '-not a bullet', '']
+
+        for block in blocks:
+            with self.subTest(block=block):
+                tokens, _ = markdown.tokenize(block)
+                self.assertEqual(tokens[0].kind if tokens else 'p', markdown.block_kind(block))
+
+    def test_join(self):
+        """Test that segments with a kind are joined the same as plain strings"""
+        segments = ['- a', '- b', '1. c', '2. d', 'paragraph', '+ e', '```\n- code\n```', '* f']
+        kinds = ['li', 'li', 'li', 'li', 'p', 'li', 'code', 'li']
+        expected = '- a\n- b\n\n1. c\n2. d\n\nparagraph\n\n+ e\n\n```\n- code\n```\n\n* f'
+
+        self.assertEqual(expected, markdown.join(segments))
+        self.assertEqual(expected, markdown.join([Entry(s, k) for s, k in zip(segments, kinds)]))
+
+
+class TestScanner(unittest.TestCase):
+    def test_parse_header(self):
+        """Test that headers are parsed the same as by the regex"""
+        lines = ['# Title', '## Title ##', '### Title', '#Title', '# ', '#  ', '#   #', '# Title#', '# Title #x',
+                 '# a # b', '####', '## \t Title \t', 'Title', '#' + ' ' * 50 + '#x']
+
+        for line in lines:
+            with self.subTest(line=line):
+                match = markdown.header_regex.match(line)
+                self.assertEqual((len(match['hashes']), match['contents']) if match else None,
+                                 markdown.parse_header(line))
+
+    def test_strip_link(self):
+        """Test that links are parsed the same as by the regexes"""
+        texts = ['Name', '[Name]', '[Name](url)', '[Name][ID]', '[a](b)(c)', '[a](b](c)', '[a][b][c]', '[][]', '[]()',
+                 '[a](b', '[a][b', 'a](b)', '[a]\n(b)', '[' + '](' * 1000]
+
+        for text in texts:
+            with self.subTest(text=text):
+                if literal := markdown.link_lit_regex.fullmatch(text):
+                    expected = literal['text'], literal['link'], None
+                elif deferred := markdown.link_def_regex.fullmatch(text):
+                    expected = deferred['text'], None, deferred['link_id'].lower()
+                else:
+                    expected = text, None, None
+                self.assertEqual(expected, markdown.strip_link(text))
+
+
+if __name__ == '__main__':
+    unittest.main()
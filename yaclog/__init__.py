@@ -1,11 +1,73 @@
+import functools
 import os
+from typing import Iterable, List, Optional
+
 from yaclog.changelog import Changelog
 
+parallel_threshold = 1024 * 1024
+"""Minimum total size in bytes of the changelogs passed to :py:func:`read_many`, or of a single changelog read with
+more than one worker, before they are read in parallel. Starting worker processes takes longer than parsing a few
+small changelogs"""
+
 
-def read(path):
+def read(path, lazy: bool = False, cache: bool = False, compact: bool = False, workers: int = 1):
     """
     Create a new Changelog object from the given path
     :param path: a path to a markdown changelog file
+    :param lazy: if version bodies should only be parsed when they are first accessed
+    :param cache: if the parsed changelog should be loaded from and saved to the on-disk cache in `yaclog.cache`
+    :param compact: if entries should be stored compactly, see :py:meth:`Changelog.read`
+    :param workers: how many processes to parse a very large changelog with, see :py:meth:`Changelog.read`.
+        This has no effect if the changelog is loaded from the cache
     :return: a parsed Changelog object
     """
-    return Changelog(path)
+    if cache:
+        import yaclog.cache
+        return yaclog.cache.read(path, lazy=lazy, compact=compact, workers=workers)
+    return Changelog(path, lazy=lazy, compact=compact, workers=workers)
+
+
+def read_many(paths: Iterable, workers: Optional[int] = None, compact: bool = False) -> List[Changelog]:
+    """
+    Read many changelogs at once, parsing them in parallel in a pool of worker processes
+    :param paths: the paths of the markdown changelog files
+    :param workers: how many processes to use. Defaults to the number of CPUs, and 1 reads every changelog in the
+        current process. Changelogs are also read in the current process if their total size is less than
+        :py:data:`parallel_threshold`
+    :param compact: if entries should be stored compactly, see :py:meth:`Changelog.read`
+    :return: a list of parsed Changelog objects, in the same order as ``paths``
+    """
+    paths = list(paths)
+    read_one = functools.partial(Changelog, compact=compact)
+
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers > 1:
+        size = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+        if size < parallel_threshold:
+            workers = 1
+
+    if workers <= 1:
+        return [read_one(path) for path in paths]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(workers) as executor:
+        # send paths in batches, since each changelog is usually quick to parse
+        return list(executor.map(read_one, paths, chunksize=max(1, len(paths) // (workers * 4))))
+
+
+async def aread(path, lazy: bool = False, cache: bool = False, compact: bool = False, executor=None) -> Changelog:
+    """
+    Create a new Changelog object from the given path like :py:func:`read`, without blocking the event loop
+    :param path: a path to a markdown changelog file
+    :param lazy: if version bodies should only be parsed when they are first accessed
+    :param cache: if the parsed changelog should be loaded from and saved to the on-disk cache in `yaclog.cache`
+    :param compact: if entries should be stored compactly, see :py:meth:`Changelog.read`
+    :param executor: the :py:class:`concurrent.futures.Executor` to read the changelog in,
+        see :py:meth:`Changelog.aread`
+    :return: a parsed Changelog object
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(read, path, lazy=lazy, cache=cache, compact=compact))
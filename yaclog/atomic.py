@@ -0,0 +1,216 @@
+"""
+Safe file writes for when several yaclog processes share a checkout.
+
+Files are written to a temporary file in the same directory and renamed over the original, so other processes only
+ever see the old or new contents and never a partially written file. Writers hold an advisory :py:func:`lock` while
+they check for and replace the file, so two processes can't overwrite each other's changes. The lock timeout is
+``$YACLOG_LOCK_TIMEOUT`` seconds, or :py:data:`default_timeout` by default.
+"""
+
+#  yaclog: yet another changelog tool
+#  Copyright (c) 2024. Andrew Cassidy
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import hashlib
+import os
+import stat
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+    import msvcrt
+
+
+def _read_umask() -> int:
+    # the umask can only be read by setting it, which would also apply to files created by other threads in the
+    # meantime. so where possible it's read from /proc instead, and otherwise only once, when this is imported
+    try:
+        with open('/proc/self/status') as fp:
+            for line in fp:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+_umask = _read_umask()  # the permissions new files shouldn't have
+
+default_timeout = 10.0
+"""Default number of seconds to wait for a lock before giving up"""
+
+
+class ConflictError(RuntimeError):
+    """Raised when writing a file that has been changed by another process since it was read"""
+
+
+def lock_timeout() -> float:
+    """
+    Get how long to wait for a lock
+
+    :return: ``$YACLOG_LOCK_TIMEOUT`` if set, otherwise :py:data:`default_timeout`
+    """
+    return float(os.environ.get('YACLOG_LOCK_TIMEOUT', default_timeout))
+
+
+def digest(text: str) -> str:
+    """
+    Hash the contents of a file
+
+    :param text: The file's contents
+    :return: A short hex digest
+    """
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def file_digest(path) -> Optional[str]:
+    """
+    Hash the current contents of a file on disk
+
+    :param path: The file's path
+    :return: The :py:func:`digest` of the file's contents, or `None` if it doesn't exist
+    """
+    try:
+        with open(path, 'r') as fp:
+            return digest(fp.read())
+    except FileNotFoundError:
+        return None
+
+
+def lock_path(path) -> str:
+    """
+    Get the path of the file that :py:func:`lock` locks for writing a file. It is created next to the file,
+    hidden like the temporary files used by :py:func:`write`, and removed again when the lock is released
+    except on Windows.
+
+    :param path: The path of the file to lock
+    :return: The path of the lock file
+    """
+    directory, name = os.path.split(os.path.realpath(path))
+    return os.path.join(directory, f'.{name}.lock')
+
+
+@contextlib.contextmanager
+def lock(path, timeout: Optional[float] = None):
+    """
+    Hold an advisory lock for writing a file. Locks are only respected by other callers of this function,
+    and are released automatically if the process exits. Each file has its own lock, see :py:func:`lock_path`
+
+    :param path: The path of the file to lock
+    :param timeout: How many seconds to wait for the lock, defaults to :py:func:`lock_timeout`
+    :raises TimeoutError: If the lock couldn't be acquired in time
+    """
+
+    if timeout is None:
+        timeout = lock_timeout()
+    deadline = time.monotonic() + timeout
+
+    # lock a file next to the target, since the target itself is replaced on every write. Locking the directory
+    # instead would make writes to unrelated files in it wait for each other
+    lock_file = lock_path(path)
+    while True:
+        fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            while True:
+                try:
+                    if fcntl:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    else:
+                        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f'Timed out after {timeout:g}s waiting for another process to write {path}')
+                    time.sleep(0.01)
+        except BaseException:
+            os.close(fd)
+            raise
+
+        if not fcntl or _is_current(fd, lock_file):
+            break
+        os.close(fd)  # the previous holder removed the file we locked, so lock the current one instead
+
+    try:
+        yield
+    finally:
+        try:
+            if fcntl:
+                # remove the lock file while still holding it, so none are left in the user's checkout
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(lock_file)
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+
+def _is_current(fd: int, path) -> bool:
+    # check if an open file is still the one at a path
+    try:
+        return os.path.samestat(os.fstat(fd), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+def write(path, text: str) -> None:
+    """
+    Replace the contents of a file all at once. The new contents are flushed to disk before replacing the old file,
+    so a crash leaves either the old or new contents. If the file already exists, its permissions are kept.
+    This doesn't lock the file, so use it inside :py:func:`lock` if other processes might write to it too.
+
+    :param path: The path of the file to write
+    :param text: The file's new contents
+    """
+
+    import tempfile
+
+    path = os.path.realpath(path)  # replace the target of a symlink, not the link itself
+    directory, name = os.path.split(path)
+
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_umask
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f'.{name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(text)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_path)
+        raise
+
+    if fcntl:
+        # make sure the rename itself is on disk. Windows can't open directories, but doesn't need to
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
@@ -0,0 +1,227 @@
+"""
+An optional on-disk cache of changelog version headers, so that the versions in unchanged changelog files do not need
+to be found and parsed again. Version bodies are parsed from the file when needed, the same as without the cache.
+
+Entries are stored in ``$YACLOG_CACHE_DIR``, or ``$XDG_CACHE_HOME/yaclog`` by default, and are keyed on the
+changelog's path, size, modification time and content hash. The cache is limited to ``$YACLOG_CACHE_SIZE`` bytes,
+with the least recently used entries removed first.
+"""
+
+#  yaclog: yet another changelog tool
+#  Copyright (c) 2024. Andrew Cassidy
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+from typing import List, Optional
+
+import yaclog.atomic
+from yaclog.changelog import Changelog, VersionEntry
+from yaclog.profiling import phase
+
+cache_format = 4
+"""Version of the cache entry format. Entries written with a different format are ignored"""
+
+default_size = 64 * 1024 * 1024
+"""Default maximum size of the cache in bytes"""
+
+
+def cache_dir() -> str:
+    """
+    Get the directory cache entries are stored in
+
+    :return: ``$YACLOG_CACHE_DIR`` if set, otherwise ``$XDG_CACHE_HOME/yaclog``
+    """
+    if path := os.environ.get('YACLOG_CACHE_DIR'):
+        return path
+    xdg_cache = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(xdg_cache, 'yaclog')
+
+
+def max_size() -> int:
+    """
+    Get the maximum size of the cache
+
+    :return: ``$YACLOG_CACHE_SIZE`` if set, otherwise :py:data:`default_size`
+    """
+    return int(os.environ.get('YACLOG_CACHE_SIZE', default_size))
+
+
+def read(path, lazy: bool = False, compact: bool = False, workers: int = 1) -> Changelog:
+    """
+    Read a changelog, using a cached copy if the file has not changed since it was last read.
+    Only the preamble, links and version headers are cached, and the position of each version in the file,
+    so a cached copy saves finding the versions in the file and parsing their headers. Version bodies are parsed
+    from the file like with :py:meth:`Changelog.read <yaclog.changelog.Changelog.read>`.
+
+    :param path: a path to a markdown changelog file
+    :param lazy: if version bodies should only be parsed when they are first accessed
+    :param compact: if entries should be stored compactly
+    :param workers: how many processes to parse a very large changelog with if it isn't cached
+    :return: a parsed Changelog object
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    with phase('read'):
+        with open(path, 'r') as fp:
+            text = fp.read()
+        digest = yaclog.atomic.digest(text)
+
+    key = {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': digest}
+    entry_path = os.path.join(cache_dir(), hashlib.sha1(path.encode()).hexdigest() + '.json')
+
+    with phase('cache'):
+        entry = _load(entry_path, key)
+
+    if entry:
+        lines = text.split('\n')
+        changelog = _deserialize(entry, lines, lazy, compact)
+    else:
+        changelog = Changelog()
+        changelog._parse(text, lazy, compact, workers)
+        with phase('cache'):
+            _store(entry_path, key, _serialize(changelog))
+
+    changelog.path = path
+    changelog._digest = digest
+    return changelog
+
+
+def clear() -> int:
+    """
+    Remove all entries from the cache
+
+    :return: the number of entries removed
+    """
+    count = 0
+    for entry in _entries():
+        os.remove(entry.path)
+        count += 1
+    return count
+
+
+def _entries():
+    try:
+        return [e for e in os.scandir(cache_dir()) if e.is_file() and e.name.endswith('.json')]
+    except FileNotFoundError:
+        return []
+
+
+def _load(entry_path, key) -> Optional[list]:
+    try:
+        with open(entry_path, 'r') as fp:
+            entry = json.load(fp)
+        if entry['format'] != cache_format or entry['key'] != key:
+            return None
+        data = entry['changelog']
+        _validate(data)
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError, IndexError):
+        # corrupted or incompatible entry
+        with contextlib.suppress(OSError):
+            os.remove(entry_path)
+        return None
+
+    with contextlib.suppress(OSError):
+        os.utime(entry_path)  # mark as recently used
+    return data
+
+
+def _store(entry_path, key, data) -> None:
+    # the cache is only an optimization, so failing to write to it isn't an error
+    directory = os.path.dirname(entry_path)
+    entry = {'format': cache_format, 'key': key, 'changelog': data}
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    except OSError:
+        return
+
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(entry, fp, separators=(',', ':'))
+        os.replace(temp_path, entry_path)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        return
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+    _evict(max_size())
+
+
+def _evict(size: int) -> None:
+    stats = []
+    for entry in _entries():
+        with contextlib.suppress(OSError):  # another process may have already removed it
+            stats.append((entry.stat(), entry.path))
+
+    total = 0
+    for stat, path in sorted(stats, key=lambda s: s[0].st_mtime_ns, reverse=True):
+        total += stat.st_size
+        if total > size:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+
+def _serialize(changelog: Changelog):
+    return [
+        changelog.preamble,
+        changelog.links,
+        changelog._source.link_lines,
+        [[v.name, v.date.isoformat() if v.date else None, v.tags, v.link, v.link_id, v.span]
+         for v in changelog.versions]
+    ]
+
+
+def _validate(data) -> None:
+    # check that an entry has the expected shape, raising one of the errors _load catches if it doesn't
+    preamble, links, link_lines, versions = data
+    if not isinstance(preamble, str) or not isinstance(links, dict):
+        raise TypeError('malformed cache entry')
+    for name, date, tags, link, link_id, (start, end) in versions:
+        if date:
+            datetime.date.fromisoformat(date)
+
+
+def _deserialize(data, lines: List[str], lazy: bool, compact: bool) -> Changelog:
+    preamble, links, link_lines, versions = data
+    changelog = Changelog(preamble=preamble)
+    changelog.links = links
+
+    parsed = []
+    for name, date, tags, link, link_id, span in versions:
+        version = VersionEntry(name, datetime.date.fromisoformat(date) if date else None, tags, link, link_id,
+                               span[0])
+        version.span = start, end = tuple(span)
+        version._compact = compact
+        version._source = lines  # the body is parsed from the file the same way as when reading it lazily
+        if not lazy:
+            version._parse_source(lines, preceded=start > 0, followed=end < len(lines))
+            version._source = None
+        parsed.append(version)
+
+    changelog.versions = parsed
+    # keep the file contents around so that writes only replace modified versions
+    changelog._remember(lines, [v.span for v in parsed], link_lines)
+    return changelog
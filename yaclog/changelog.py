@@ -21,15 +21,198 @@ disk as markdown, as well as the `VersionEntry` class that represents a single v
 
 from __future__ import annotations
 
+import bisect
+import collections
+import contextlib
 import datetime
+import functools
+import itertools
 import os
 import re
-from typing import List, Optional, Dict
-
-import click  # only for styling
+import sys
+from array import array
+from collections.abc import MutableSequence
+from typing import List, Optional, Dict, Iterable, Tuple
 
+import yaclog.atomic
 import yaclog.markdown as markdown
 import yaclog.version
+from yaclog.profiling import phase
+
+
+class Entry(str):
+    """
+    A change entry in a version section. Entries are strings containing their markdown text, so they can be used
+    anywhere a string can, and also know what kind of markdown block they are, so they can be rendered and filtered
+    without being parsed again::
+
+        bullets = [entry for entry in version.sections['Added'] if entry.kind == 'li']
+
+    Entries read from a file get their kind from the tokenizer. Any other string is checked once when it's made into
+    an entry, such as by :py:meth:`VersionEntry.add_entry`. Plain strings can still be added to sections directly.
+    """
+
+    __slots__ = ()
+
+    kind = 'p'
+    """What kind of markdown block the entry is, like :py:attr:`markdown.Token.kind <yaclog.markdown.Token.kind>`.
+    One of ``h[1-6]``, ``p``, ``li`` or ``code``"""
+
+    def __new__(cls, text: str = '', kind: Optional[str] = None):
+        """
+        :param text: The entry's markdown text
+        :param kind: What kind of markdown block the entry is. By default, it's found from the text
+        """
+        if kind is not None:
+            cls = _entry_types[kind]
+        elif cls is Entry:
+            cls = _entry_types[markdown.block_kind(text)]
+        return super().__new__(cls, text)
+
+    @property
+    def children(self) -> List[Entry]:
+        """The list items nested in this entry, with their indentation removed.
+        Items nested more deeply are part of the text of their parent. Empty if the entry isn't a list item"""
+        if self.kind != 'li':
+            return []
+
+        children: List[List[str]] = []
+        indent = None
+        for line in self.split('\n')[1:]:
+            item = line.lstrip()
+            depth = len(line) - len(item)
+            if depth and (indent is None or depth <= indent) and markdown.li_regex.match(item):
+                indent = depth
+                children.append([item])
+            elif children:
+                # a continuation of the last item, or an item nested inside it
+                children[-1].append(line[indent:] if line[:indent].isspace() else item)
+
+        return [Entry('\n'.join(lines), 'li') for lines in children]
+
+    def __reduce__(self):
+        # the classes for each kind can't be found by name
+        return Entry, (str(self), self.kind)
+
+
+# a subclass of Entry for each kind, so entries don't need any space to store it
+_entry_kinds = ('p', 'li', 'code', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+_entry_types = {kind: type('Entry', (Entry,), {'__slots__': (), 'kind': kind}) for kind in _entry_kinds}
+
+
+def _as_entry(entry: str) -> Entry:
+    return entry if isinstance(entry, Entry) else Entry(entry)
+
+
+class CompactEntries(MutableSequence):
+    """
+    A list of entries in a version section, stored as line ranges in the file they were read from instead of as
+    separate strings. It behaves like a list of strings, and switches to storing one the first time it is modified.
+
+    Used for the values of :py:attr:`VersionEntry.sections` when a changelog is read with ``compact=True``.
+    """
+
+    __slots__ = ('_lines', '_ranges', '_kinds', '_items', '_owner')
+
+    def __init__(self, lines: List[str]):
+        """
+        :param lines: The lines of the file the entries are in. This is shared with the changelog and every other
+            version read from the same file, so it costs nothing extra to keep around.
+        """
+        self._lines = lines
+        self._ranges = array('I')  # flattened (first, last) line number pairs
+        self._kinds = bytearray()  # the kind of each entry, as an index into `_entry_kinds`
+        self._items: Optional[List[str]] = None
+        self._owner: Optional[VersionEntry] = None  # the version whose rendered text to discard when modified
+
+    def _append_range(self, first: int, last: int, kind: str) -> None:
+        self._ranges.append(first)
+        self._ranges.append(last)
+        self._kinds.append(_entry_kinds.index(kind))
+
+    def _rebase(self, lines: List[str], offset: int) -> None:
+        # point at a new copy of the file, where the entries are moved by `offset` lines
+        self._lines = lines
+        self._ranges = array('I', (line_no + offset for line_no in self._ranges))
+
+    def _materialize(self) -> List[str]:
+        if self._items is None:
+            self._items = list(self)
+            self._lines = self._ranges = self._kinds = None
+        return self._items
+
+    def __len__(self) -> int:
+        return len(self._items) if self._items is not None else len(self._ranges) // 2
+
+    def __getitem__(self, index):
+        if self._items is not None:
+            return self._items[index]
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('list index out of range')
+        text = '\n'.join(self._lines[self._ranges[2 * index]:self._ranges[2 * index + 1]])
+        return _entry_types[_entry_kinds[self._kinds[index]]](text)
+
+    def __iter__(self):
+        if self._items is not None:
+            return iter(self._items)
+        ranges = iter(self._ranges)
+        return (_entry_types[_entry_kinds[kind]]('\n'.join(self._lines[first:last]))
+                for (first, last), kind in zip(zip(ranges, ranges), self._kinds))
+
+    def copy(self):
+        """
+        Get a shallow copy of the entries
+
+        :return: A new :py:class:`CompactEntries` if this hasn't been modified yet, otherwise a list
+        """
+        if self._items is not None:
+            return list(self._items)
+        clone = CompactEntries(self._lines)
+        clone._ranges = array('I', self._ranges)
+        clone._kinds = bytearray(self._kinds)
+        return clone
+
+    def _modified(self) -> List[str]:
+        if self._owner is not None:
+            self._owner._renders = None
+        return self._materialize()
+
+    def __setitem__(self, index, value):
+        self._modified()[index] = value
+
+    def __delitem__(self, index):
+        del self._modified()[index]
+
+    def insert(self, index, value):
+        self._modified().insert(index, value)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, CompactEntries)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __reduce__(self):
+        # arrays are pickled as a list of numbers, which is slow to send back from parallel reads
+        ranges = self._ranges.tobytes() if self._ranges is not None else None
+        return _unpickle_entries, (self._lines, ranges, self._kinds, self._items)
+
+
+def _unpickle_entries(lines: Optional[List[str]], ranges: Optional[bytes], kinds: Optional[bytearray],
+                      items: Optional[List[str]]):
+    entries = CompactEntries(lines)
+    entries._ranges = array('I', ranges) if ranges is not None else None
+    entries._kinds = kinds
+    entries._items = items
+    return entries
 
 
 class VersionEntry:
@@ -38,10 +221,10 @@ class VersionEntry:
     containing the changes made since the previous version
     """
 
-    _header_regex = re.compile(  # THE LANGUAGE OF THE GODS
-        r"##\s+(?P<name>.*?)(?:\s+-)?(?:\s+(?P<date>\d{4}-\d{2}-\d{2}))?(?P<tags>(?:\s+\[[^]]*?])*)\s*$")
+    _word_regex = re.compile(r'\S+')
 
-    _tag_regex = re.compile(r'\[(?P<tag>[^]]*?)]')
+    __slots__ = ('_name', '_date', '_tags', '_link', '_link_id', 'line_no', 'span', '_sections', '_source', '_compact',
+                 '_original_header', '_original_body', '_version_name', '_version', '_renders', '_changelog')
 
     def __init__(self, name: str = 'Unreleased',
                  date: Optional[datetime.date] = None, tags: Optional[List[str]] = None,
@@ -55,29 +238,175 @@ class VersionEntry:
         :param line_no: What line in the original file the version starts on
         """
 
-        self.name: str = name
+        self._changelog: Optional[Changelog] = None  # the changelog whose lookup index includes the version
+        self.name = name
+        self.date = date
+        self.tags = tags if tags else []
+        self.link = link
+        self.link_id = link_id
+
+        self.line_no: Optional[int] = line_no
+        """What line the version occurs at in the file, or `None` if the version was not read from a file. 
+        This is not guaranteed to be correct after the changelog has been modified, 
+        and it has no effect on the written file"""
+
+        self.span: Optional[Tuple[int, int]] = None
+        """The range of lines ``(start, end)`` the version's header and contents occupy in the original file,
+        or `None` if the version was not read from a file. Trailing blank lines and link definitions are excluded.
+        This is updated each time the changelog is written"""
+
+        self._sections: Dict[str, List[str]] = _owned(_Sections, self, {'': _owned(_EntryList, self, ())})
+        self._source: Optional[List[str]] = None  # lines of the original file, if the body has not been parsed yet
+        self._compact = False  # if the body should be parsed into CompactEntries
+        self._original_header = None  # snapshots of the version as it was read, to detect modifications
+        self._original_body = None
+        self._version_name = None  # the name self._version was parsed from, so it can be re-parsed after renaming
+        self._version = None
+        self._renders: Optional[Dict[tuple, str]] = None  # rendered text and digests, until the version is modified
+
+    @property
+    def name(self) -> str:
         """The version's name"""
+        return self._name
 
-        self.date: Optional[datetime.date] = date
+    @name.setter
+    def name(self, value: str):
+        self._name = value
+        self._renders = None
+        self._changed()
+
+    @property
+    def date(self) -> Optional[datetime.date]:
         """When the version was released"""
+        return self._date
 
-        self.tags: List[str] = tags if tags else []
+    @date.setter
+    def date(self, value: Optional[datetime.date]):
+        self._date = value
+        self._renders = None
+        self._changed()
+
+    @property
+    def tags(self) -> List[str]:
         """The version's tags"""
+        return self._tags
 
-        self.link: Optional[str] = link
+    @tags.setter
+    def tags(self, value: List[str]):
+        self._tags = _owned(_TagList, self, value)
+        self._renders = None
+        self._changed()
+
+    @property
+    def link(self) -> Optional[str]:
         """The version's URL"""
+        return self._link
 
-        self.link_id: Optional[str] = link_id
+    @link.setter
+    def link(self, value: Optional[str]):
+        self._link = value
+        self._renders = None
+
+    @property
+    def link_id(self) -> Optional[str]:
         """The version's link ID, uses the version name by default when writing"""
+        return self._link_id
 
-        self.line_no: Optional[int] = line_no
-        """What line the version occurs at in the file, or `None` if the version was not read from a file. 
-        This is not guaranteed to be correct after the changelog has been modified, 
-        and it has no effect on the written file"""
+    @link_id.setter
+    def link_id(self, value: Optional[str]):
+        self._link_id = value
+        self._changed()
 
-        self.sections: Dict[str, List[str]] = {'': []}
-        """The dictionary of change entries in the version, organized by section. 
-        Uncategorized changes have a section of an empty string."""
+    @property
+    def sections(self) -> Dict[str, List[str]]:
+        """The dictionary of change entries in the version, organized by section.
+        Uncategorized changes have a section of an empty string.
+        If the version was read lazily, its body is parsed the first time this is accessed."""
+
+        if self._source is not None:
+            lines, self._source = self._source, None
+            start, end = self.span
+            self._parse_source(lines, preceded=start > 0, followed=end < len(lines))
+        return self._sections
+
+    @sections.setter
+    def sections(self, value: Dict[str, List[str]]):
+        self._source = None
+        self._sections = _own_sections(self, value)
+        self._renders = None
+
+    @property
+    def modified(self) -> bool:
+        """If the version has been changed since it was read from or written to a file.
+        Versions that were not read from a file are always considered modified."""
+
+        if self._original_header is None or self._snapshot_header() != self._original_header:
+            return True
+        if self._source is not None:
+            return False  # the body hasn't even been parsed yet
+        return self._snapshot_body() != self._original_body
+
+    @property
+    def digest(self) -> str:
+        """A hash of the version's name, date, tags, link and entries, which changes whenever any of them do.
+        How the version is formatted in the file, such as blank lines or the style of its headers, doesn't matter.
+        It is kept until the version is modified, so comparing the digests of unchanged versions is quick."""
+        return self._cached(('digest',), self._hash)
+
+    @property
+    def section_digests(self) -> Dict[str, str]:
+        """A hash of each section's name and entries, like :py:attr:`digest`"""
+        return {section: self._cached(('digest', section), self._hash_section, section) for section in self.sections}
+
+    def _hash(self) -> str:
+        import json  # imported lazily to keep startup fast
+        header = [self.name, self.date.isoformat() if self.date else None, list(self.tags), self.link]
+        return yaclog.atomic.digest(json.dumps([header, self.section_digests]))
+
+    def _hash_section(self, section: str) -> str:
+        import json
+        return yaclog.atomic.digest(json.dumps([section, *self.sections[section]]))
+
+    def _changed(self) -> None:
+        # discard the lookup index of the changelog the version is in, if it has been indexed
+        if self._changelog is not None:
+            self._changelog._index = None
+
+    def __getstate__(self):
+        # the changelog is left out, so pickling a version doesn't pickle everything else with it
+        return None, {**{slot: getattr(self, slot) for slot in self.__slots__}, '_changelog': None}
+
+    def _rebase_entries(self, lines: List[str], span: Tuple[int, int]) -> None:
+        # keep compact entries pointing at the current copy of the file, so old copies can be freed
+        (old_start, old_end), (start, end) = self.span, span
+        for entries in self._sections.values():
+            if isinstance(entries, CompactEntries) and entries._items is None and entries._lines is not lines:
+                if entries._lines[old_start:old_end] == lines[start:end]:
+                    entries._rebase(lines, start - old_start)
+                else:
+                    entries._materialize()
+
+    def _checkpoint(self) -> dict:
+        # everything needed to undo changes to the version made after this
+        state = {slot: getattr(self, slot) for slot in self.__slots__}
+        state['_tags'] = list(self._tags)
+        state['_sections'] = {section: entries.copy() for section, entries in self._sections.items()}
+        return state
+
+    def _restore(self, state: dict) -> None:
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        self.tags = state['_tags']  # also invalidates lookup indexes
+        self._sections = _own_sections(self, state['_sections'])
+        self._renders = None
+
+    def _snapshot_header(self):
+        return self.name, self.date, tuple(self.tags), self.link, self.link_id
+
+    def _snapshot_body(self):
+        # compact entries are unmodified until they switch to storing strings, so they can be compared by identity
+        return tuple((section, entries if isinstance(entries, CompactEntries) and entries._items is None
+                      else tuple(entries)) for section, entries in self._sections.items())
 
     @classmethod
     def from_header(cls, header: str, line_no: Optional[int] = None) -> VersionEntry:
@@ -90,48 +419,160 @@ class VersionEntry:
         """
         version = cls(line_no=line_no)
 
-        match = cls._header_regex.match(header)
-        assert match, f'failed to parse version header: "{header}"'
+        parts = cls._split_header(header)
+        assert parts, f'failed to parse version header: "{header}"'
+        name, date, tags = parts
 
-        version.name, version.link, version.link_id = markdown.strip_link(match['name'])
+        version.name, version.link, version.link_id = markdown.strip_link(name)
 
-        if match['date']:
+        if date:
             try:
-                version.date = datetime.date.fromisoformat(match['date'])
+                version.date = datetime.date.fromisoformat(date)
             except ValueError:
                 return cls(name=header.lstrip('#').strip(), line_no=line_no)
 
-        if match['tags']:
-            version.tags = [m['tag'].upper() for m in cls._tag_regex.finditer(match['tags'])]
+        if tags:
+            version.tags = [sys.intern(tag.upper()) for tag in tags]
 
         return version
 
+    @classmethod
+    def _split_header(cls, header: str) -> Optional[Tuple[str, Optional[str], List[str]]]:
+        # split a version header into its name, date and tags. A header is written as
+        #     ## name[ -][ YYYY-MM-DD][ [tag]...]
+        # where the name is as short as possible, so anything after it that could be a date or tags is one.
+        # words are checked once each from right to left, so this takes linear time even for adversarial headers
+
+        if not header.startswith('##') or not header[2:3].isspace():
+            return None
+
+        body = header[2:].strip()
+        words = body.split()
+        if not words or '[' not in body[len(words[0]):]:
+            # there are no tags, so only a dash and a date can come after the name
+            date = None
+            if len(words) > 1 and _is_date(words[-1]):
+                date = words.pop()
+                body = body[:-len(date)].rstrip()
+            if len(words) > 1 and words[-1] == '-':
+                body = body[:-1].rstrip()
+            return body, date, []
+
+        words = [(match.start(), match.end()) for match in cls._word_regex.finditer(header)][1:]
+        count = len(words)
+
+        # for the whitespace before each word, or the end of the header at index `count`:
+        tags = [False] * count + [True]  # if only tags follow
+        dated = [False] * (count + 1)  # if a date and then only tags follow
+        suffix = [False] * count + [True]  # if an optional dash, an optional date, and then only tags follow
+        tag_next = [count] * count  # for words starting a tag, the word after the tag
+        close, close_word = -1, count  # the first ']' at or after the current word, and the word it's in
+
+        for index in range(count - 1, -1, -1):
+            start, end = words[index]
+            if (bracket := header.find(']', start, end)) >= 0:
+                close, close_word = bracket, index
+
+            # a tag starts a word, and ends at the first ']' after that, which must also end a word
+            if header[start] == '[' and close_word < count and close + 1 == words[close_word][1]:
+                tags[index] = tags[close_word + 1]
+                tag_next[index] = close_word + 1
+
+            word = header[start:end]
+            dated[index] = tags[index + 1] and _is_date(word)
+            suffix[index] = ((word == '-' and (dated[index + 1] or tags[index + 1]))
+                             or dated[index] or tags[index])
+
+        # the name ends before the first word where the suffix can start
+        index = next(index for index in range(1, count + 1) if suffix[index])
+        name = header[words[0][0]:words[index - 1][1]]
+
+        if not (dated[index] or tags[index]):
+            index += 1  # skip the dash
+        date = None
+        if dated[index]:
+            date = header[words[index][0]:words[index][1]]
+            index += 1
+
+        tag_names = []
+        while index < count:
+            tag_names.append(header[words[index][0] + 1:words[tag_next[index] - 1][1] - 1])
+            index = tag_next[index]
+
+        return name, date, tag_names
+
+    def _parse_source(self, lines: List[str], preceded: bool, followed: bool) -> None:
+        # parse the version from the lines in its span, which may be part of a larger file
+        start, end = self.span
+        with phase('parse'):
+            tokens = markdown.iter_tokens(lines[start:end], line_no=start, preceded=preceded, followed=followed)
+            next(tokens)  # skip the version header
+            self._parse_body(tokens, lines if self._compact else None)
+        self._original_body = self._snapshot_body()
+
+    def _parse_body(self, tokens: Iterable[markdown.Token], lines: Optional[List[str]] = None) -> None:
+        """
+        Add the contents of a version body to the version
+
+        :param tokens: The tokens making up the version body, not including the version header
+        :param lines: The lines of the file the tokens were read from, to store entries as :py:class:`CompactEntries`
+        """
+        section = ''
+        if lines:
+            self._sections[section] = CompactEntries(lines)
+
+        for token in tokens:
+            if token.kind == 'h3':
+                # start of a version section
+                section = sys.intern('\n'.join(token.lines).strip('#').strip())
+                if section not in self._sections.keys():
+                    self._sections[section] = CompactEntries(lines) if lines else []
+
+            else:
+                # change log entry
+                entries = self._sections[section]
+                end = token.line_no + len(token.lines)
+                if lines and entries._items is None and token.lines == lines[token.line_no:end]:
+                    # the entry is exactly as it appears in the file, so only store where it is.
+                    # any line may differ if setext headers were converted
+                    entries._append_range(token.line_no, end, token.kind)
+                else:
+                    entries.append(_entry_types[token.kind]('\n'.join(token.lines)))
+
     def add_entry(self, contents: str, section: str = '') -> None:
         """
         Add a new entry to the version
 
-        :param contents: The contents string to add
+        :param contents: The entry to add. Strings are made into an :py:class:`Entry`
         :param section: Which section to add to.
         """
 
-        section = section.title()
+        section = sys.intern(section.title())
         if section not in self.sections.keys():
             self.sections[section] = []
 
-        self.sections[section].append(contents)
+        self.sections[section].append(_as_entry(contents))
 
-    def body(self, md: bool = True, color: bool = False) -> str:
+    def body(self, md: bool = True, color: bool = False, sections: Optional[Iterable[str]] = None) -> str:
         """
         Get the version's body as a string
 
         :param md: Format headings as markdown
         :param color: Add color codes to the string for display in a terminal
+        :param sections: If given, only include sections with these names, ignoring case
         :return: The formatted version body, without the version header
         """
 
-        segments = []
+        if sections is not None:
+            sections = frozenset(section.lower() for section in sections)
+        return self._cached(('body', md, color, sections), self._render_body, md, color, sections)
 
+    def _render_body(self, md: bool, color: bool, sections: Optional[frozenset]) -> str:
+        segments = []
         for section, entries in self.sections.items():
+            if sections is not None and section.lower() not in sections:
+                continue
+
             if section:
                 if md:
                     prefix = '### '
@@ -141,10 +582,11 @@ class VersionEntry:
                     title = section.upper()
 
                 if color:
+                    import click  # only for styling, imported lazily to keep startup fast
                     prefix = click.style(prefix, fg='bright_black')
                     title = click.style(title, fg='cyan', bold=True)
 
-                segments.append(prefix + title)
+                segments.append(Entry(prefix + title, 'h3'))
 
             if len(entries) > 0:
                 segments += entries
@@ -160,6 +602,9 @@ class VersionEntry:
         :return: The formatted version header
         """
 
+        return self._cached(('header', md, color), self._render_header, md, color)
+
+    def _render_header(self, md: bool, color: bool) -> str:
         if md:
             prefix = '## '
         else:
@@ -183,52 +628,428 @@ class VersionEntry:
         title = ' '.join(segments)
 
         if color:
+            import click  # only for styling, imported lazily to keep startup fast
             prefix = click.style(prefix, fg='bright_black')
             title = click.style(title, fg='blue', bold=True)
 
         return prefix + title
 
-    def text(self, md: bool = True, color: bool = False) -> str:
+    def text(self, md: bool = True, color: bool = False, sections: Optional[Iterable[str]] = None) -> str:
         """
         Get the version's contents as a string
 
         :param md: Format headings as markdown
         :param color: Add color codes to the string for display in a terminal
+        :param sections: If given, only include sections with these names, ignoring case
         :return: The formatted version header and body
         """
 
-        contents = self.header(md, color)
-        body = self.body(md, color)
+        if sections is not None:
+            sections = frozenset(section.lower() for section in sections)
+        return self._cached(('text', md, color, sections), self._render_text, md, color, sections)
+
+    def _render_text(self, md: bool, color: bool, sections: Optional[frozenset]) -> str:
+        contents = self._render_header(md, color)
+        body = self._render_body(md, color, sections)
         if body:
             contents += '\n\n' + body
         return contents
 
+    def _cached(self, key: tuple, render, *args) -> str:
+        # rendered text and digests are kept until the version is modified, which sets `_renders` to None
+        if self._renders is not None and (text := self._renders.get(key)) is not None:
+            return text
+        text = render(*args)  # may parse the body, which counts as modifying it
+        if self._renders is None:
+            self._renders = {}
+        self._renders[key] = text
+        return text
+
     @property
     def released(self) -> bool:
         """Returns true if a PEP440 version number is present in the version name, and has no prerelease segments"""
-        return yaclog.version.is_release(self.name)
+        version = self.version
+        return version is not None and not (version.is_devrelease or version.is_prerelease)
 
     @property
     def version(self):
         """Returns the PEP440 version number from the version name, or `None` if none is found"""
-        return yaclog.version.extract_version(self.name)[0]
+        if self._version_name != self.name:
+            self._version = yaclog.version.extract_version(self.name)[0]
+            self._version_name = self.name
+        return self._version
 
     def __str__(self) -> str:
         return self.header(False)
 
 
+class VersionDiff:
+    """How a version differs between two revisions of a changelog, as found by :py:meth:`Changelog.diff`"""
+
+    __slots__ = ('old', 'new', 'sections')
+
+    def __init__(self, old: Optional[VersionEntry], new: Optional[VersionEntry]):
+        """
+        :param old: The version in the old changelog, or `None` if it was added
+        :param new: The version in the new changelog, or `None` if it was removed
+        """
+
+        self.old = old
+        """The version in the old changelog, or `None` if it was added"""
+
+        self.new = new
+        """The version in the new changelog, or `None` if it was removed"""
+
+        self.sections: Dict[str, Tuple[List[str], List[str]]] = {}
+        """The entries ``(added, removed)`` in each section that changed. Sections whose entries were only
+        reordered are included with no entries added or removed"""
+
+        old_sections = old.sections if old else {}
+        new_sections = new.sections if new else {}
+        old_digests = old.section_digests if old else {}
+        new_digests = new.section_digests if new else {}
+
+        for section in {**new_sections, **old_sections}:
+            if section in old_digests and old_digests[section] == new_digests.get(section):
+                continue
+
+            old_entries = old_sections.get(section, [])
+            new_entries = new_sections.get(section, [])
+            added = _subtract(new_entries, old_entries)
+            removed = _subtract(old_entries, new_entries)
+            if added or removed or (old_entries and new_entries):
+                self.sections[section] = added, removed
+
+    @property
+    def name(self) -> str:
+        """The version's name"""
+        return (self.new or self.old).name
+
+    @property
+    def status(self) -> str:
+        """If the version was ``added``, ``removed`` or ``modified``"""
+        if self.old is None:
+            return 'added'
+        return 'removed' if self.new is None else 'modified'
+
+    @property
+    def released(self) -> bool:
+        """If the version was already released in the old changelog, so changing it rewrites history"""
+        return self.old is not None and self.old.released
+
+    @property
+    def header_changed(self) -> bool:
+        """If the version's date, tags or link changed"""
+        return (self.old is not None and self.new is not None and
+                self.old._snapshot_header()[1:4] != self.new._snapshot_header()[1:4])
+
+
+def _subtract(entries: List[str], other: List[str]) -> List[str]:
+    # the entries that aren't in `other`, counting duplicates
+    remaining = collections.Counter(other)
+    result = []
+    for entry in entries:
+        if remaining[entry]:
+            remaining[entry] -= 1
+        else:
+            result.append(entry)
+    return result
+
+
+def _same_version(old: VersionEntry, new: VersionEntry) -> bool:
+    if old._snapshot_header()[:4] != new._snapshot_header()[:4]:
+        return False
+
+    if old._source is not None and new._source is not None:
+        # both bodies are unparsed, and parse the same way if they were read from the same lines
+        (start, end), (new_start, new_end) = old.span, new.span
+        if ((start > 0) == (new_start > 0) and (end < len(old._source)) == (new_end < len(new._source))
+                and old._source[start:end] == new._source[new_start:new_end]):
+            return True
+
+    return old.digest == new.digest
+
+
+class _TrackedList(list):
+    """A list that calls `_modified` whenever it is modified"""
+
+    __slots__ = ()
+
+    def _modified(self) -> None:
+        pass
+
+
+class _VersionList(_TrackedList):
+    """A changelog's versions, which discard the changelog's lookup index when modified"""
+
+    __slots__ = ('_owner',)
+
+    def _modified(self) -> None:
+        self._owner._index = None
+
+    def __reduce__(self):
+        return _owned, (type(self), self._owner, list(self))
+
+
+class _EntryList(_TrackedList):
+    """The entries in a version section, which discard the version's rendered text when modified"""
+
+    __slots__ = ('_owner',)
+
+    def _modified(self) -> None:
+        self._owner._renders = None
+
+    def __reduce__(self):
+        # the items must be added after the owner is set, so they can't be appended one at a time
+        return _owned, (type(self), self._owner, list(self))
+
+
+class _TagList(_EntryList):
+    """A version's tags, which also invalidate version lookup indexes when modified"""
+
+    __slots__ = ()
+
+    def _modified(self) -> None:
+        self._owner._renders = None
+        self._owner._changed()
+
+
+def _tracked(method):
+    def wrapper(self, *args, **kwargs):
+        self._modified()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+for _method in ['__setitem__', '__delitem__', '__iadd__', '__imul__',
+                'append', 'extend', 'insert', 'pop', 'remove', 'reverse', 'sort', 'clear']:
+    setattr(_TrackedList, _method, _tracked(getattr(list, _method)))
+
+
+class _Sections(dict):
+    """
+    A version's sections, which discard the version's rendered text when modified.
+    Entries are stored as an `_EntryList` or an owned `CompactEntries`, so changes to them are noticed too
+    """
+
+    __slots__ = ('_owner',)
+
+    def __setitem__(self, section, entries):
+        self._owner._renders = None
+        super().__setitem__(section, _own_entries(self._owner, entries))
+
+    def __delitem__(self, section):
+        self._owner._renders = None
+        super().__delitem__(section)
+
+    def pop(self, *args):
+        self._owner._renders = None
+        return super().pop(*args)
+
+    def popitem(self):
+        self._owner._renders = None
+        return super().popitem()
+
+    def clear(self):
+        self._owner._renders = None
+        super().clear()
+
+    def setdefault(self, section, default=None):
+        if section not in self:
+            self[section] = default if default is not None else []
+        return self[section]
+
+    def update(self, *args, **kwargs):
+        for section, entries in dict(*args, **kwargs).items():
+            self[section] = entries
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __reduce__(self):
+        # compact entries don't keep their owner when pickled
+        return _own_sections, (self._owner, dict(self))
+
+
+def _owned(cls, owner, items):
+    # create a tracked container belonging to a version or changelog, without going through its tracked methods
+    container = cls(items)
+    container._owner = owner
+    return container
+
+
+def _own_entries(owner: VersionEntry, entries):
+    # get entries to store in one of the version's sections, copying them into an `_EntryList` if needed
+    if isinstance(entries, CompactEntries):
+        entries._owner = owner
+        return entries
+    if isinstance(entries, _EntryList) and entries._owner is owner:
+        return entries
+    return _owned(_EntryList, owner, [_as_entry(entry) for entry in entries])
+
+
+def _own_sections(owner: VersionEntry, sections) -> _Sections:
+    return _owned(_Sections, owner, {section: _own_entries(owner, entries) for section, entries in sections.items()})
+
+
+class _VersionIndex:
+    """Lookup tables for finding versions, which are rebuilt whenever versions are renamed, reordered, or retagged"""
+
+    def __init__(self, versions: List[VersionEntry]):
+        self.versions = versions
+        self.names: Dict[str, VersionEntry] = {}
+        self.link_ids: Dict[str, VersionEntry] = {}
+        self.positions: Dict[int, int] = {}  # position of each version in the changelog, by id
+
+        # built the first time they're needed, since they require parsing every version number
+        self.numbers: Optional[Dict[object, VersionEntry]] = None
+        self.number_keys = None  # every version number in ascending order
+        self.number_positions = None  # the position of the version with each number in `number_keys`
+
+        # also built the first time they're needed
+        self.date_keys = None  # every date in ascending order
+        self.date_positions = None  # the position of the version with each date in `date_keys`
+        self.tags: Optional[Dict[str, List[int]]] = None  # the position of each version with each tag
+
+        for position, version in reversed(list(enumerate(versions))):  # so earlier versions take precedence
+            self.names[version.name] = version
+            if version.link_id:
+                self.link_ids[version.link_id.lower()] = version
+            self.positions[id(version)] = position
+
+    def get(self, name: str) -> Optional[VersionEntry]:
+        if version := self.names.get(name) or self.link_ids.get(name.lower()):
+            return version
+
+        number = _parse_number(name)
+        if number is None:
+            return None
+
+        if self.numbers is None:
+            self.numbers = {version.version: version for version in reversed(self.versions) if version.version}
+        return self.numbers.get(number)
+
+    def number_range(self, low, high) -> List[int]:
+        if self.number_keys is None:
+            numbered = sorted((version.version, position)
+                              for position, version in enumerate(self.versions) if version.version)
+            self.number_keys = [number for number, _ in numbered]
+            self.number_positions = [position for _, position in numbered]
+
+        start = bisect.bisect_left(self.number_keys, low) if low is not None else 0
+        end = bisect.bisect_right(self.number_keys, high) if high is not None else len(self.number_keys)
+        return self.number_positions[start:end]
+
+    def date_range(self, low: Optional[datetime.date], high: Optional[datetime.date]) -> List[int]:
+        if self.date_keys is None:
+            dated = sorted((version.date, position) for position, version in enumerate(self.versions) if version.date)
+            self.date_keys = [date for date, _ in dated]
+            self.date_positions = [position for _, position in dated]
+
+        start = bisect.bisect_left(self.date_keys, low) if low is not None else 0
+        end = bisect.bisect_right(self.date_keys, high) if high is not None else len(self.date_keys)
+        return self.date_positions[start:end]
+
+    def tagged(self, tag: str) -> List[int]:
+        if self.tags is None:
+            self.tags = {}
+            for position, version in enumerate(self.versions):
+                for t in version.tags:
+                    self.tags.setdefault(t.upper(), []).append(position)
+
+        return self.tags.get(tag.upper(), [])
+
+
+def _is_date(word: str) -> bool:
+    # equivalent to matching r'\d{4}-\d{2}-\d{2}'
+    return len(word) == 10 and word[4] == word[7] == '-' and (word[:4] + word[5:7] + word[8:]).isdecimal()
+
+
+def _parse_number(name: str):
+    # parse a string that is only a PEP 440 version number
+    number, start, end = yaclog.version.extract_version(name)
+    if number is None or start != 0 or end != len(name):
+        return None
+    return number
+
+
+def _parse_range(name: str):
+    # parse a range of version numbers like '1.0.0..2.0.0', where either end can be empty
+    bounds = []
+    for bound in name.split('..', 1):
+        number = _parse_number(bound.strip()) if bound.strip() else None
+        if bound.strip() and number is None:
+            raise ValueError(f'{bound} in version range {name} is not a PEP 440 version number')
+        bounds.append(number)
+    return bounds
+
+
+class _Source:
+    """The contents of a changelog file as it was last read or written"""
+
+    def __init__(self, lines: List[str], preamble: str, links: Dict[str, str],
+                 versions: List[VersionEntry], link_lines: List[int]):
+        self.lines = lines
+        self.preamble = preamble
+        self.links = links
+        self.versions = versions
+        self.link_lines = link_lines
+
+
+def _read_detached(path, lazy: bool, compact: bool) -> Changelog:
+    # read a changelog without touching any existing object, so it can be done in another thread or process
+    changelog = Changelog()
+    changelog.path = os.path.abspath(path)
+    changelog.read(path, lazy, compact)
+    return changelog
+
+
+def _parse_versions(lines: List[str], offset: int, length: int, lazy: bool, compact: bool):
+    # parse the versions in `lines`, which start at line `offset` of a file `length` lines long.
+    # spans and line numbers are returned relative to the whole file, but each version's own span and entries are
+    # relative to `lines` until Changelog._remember moves them
+    with phase('index'):
+        headers, links, link_lines = markdown.index_headers(lines, preceded=offset > 0,
+                                                            followed=offset + len(lines) < length)
+
+    versions = []
+    for start, end, header in headers:
+        version = VersionEntry.from_header(header, line_no=start)
+        version.span = (start, end)
+        version._compact = compact
+        if not lazy:
+            version._parse_source(lines, preceded=offset + start > 0, followed=offset + end < length)
+        versions.append(version)
+
+    spans = [(start + offset, end + offset) for start, end, _ in headers]
+    return versions, spans, links, [line_no + offset for line_no in link_lines]
+
+
+def _parse_chunk(text: str, offset: int, length: int, lazy: bool, compact: bool):
+    # _parse_versions in a worker process. Sending one string is much faster than sending a list of lines
+    return _parse_versions(text.split('\n'), offset, length, lazy, compact)
+
+
 class Changelog:
     """
     A serialized representation of a Markdown changelog made up of a preamble, multiple versions, and a link table.
     """
 
     def __init__(self, path=None,
-                 preamble: str = "# Changelog\n\nAll notable changes to this project will be documented in this file"):
+                 preamble: str = "# Changelog\n\nAll notable changes to this project will be documented in this file",
+                 lazy: bool = False, compact: bool = False, workers: int = 1):
         """
         Contents will be automatically read from disk if the file exists
 
         :param path: The changelog's path on disk.
         :param str preamble: The changelog preamble to use if the file does not exist.
+        :param lazy: If version bodies should only be parsed when they are first accessed. See :py:meth:`read`
+        :param compact: If entries should be stored compactly. See :py:meth:`read`
+        :param workers: How many processes to parse the file with. See :py:meth:`read`
         """
         self.path = os.path.abspath(path) if path else None
         """The path of the changelog's file on disk"""
@@ -238,57 +1059,120 @@ class Changelog:
         It can contain the title, an explanation of the file's purpose, as well as any general machine-readable 
         information for use with other tools."""
 
-        self.versions: List[VersionEntry] = []
-        """A list of versions in the changelog, with the most recent version first"""
+        self.versions = []
 
         self.links: Dict[str, str] = {}
         """Link definitions at the end of the changelog, as a dictionary of ``{id: url}``"""
 
+        self._source: Optional[_Source] = None
+        self._index: Optional[_VersionIndex] = None
+        self._pending_writes: Optional[Dict[str, bool]] = None  # writes deferred by a transaction, by path
+        self._fragments: List[str] = []  # fragment files folded into the changelog, deleted once it is written
+        self._digest: Optional[str] = None  # hash of the file at self.path when it was read, or None if it didn't exist
+
         if path and os.path.exists(path):
-            self.read()
+            self.read(lazy=lazy, compact=compact, workers=workers)
 
-    def read(self, path=None) -> None:
+    @classmethod
+    def from_text(cls, text: str, path=None, lazy: bool = False, compact: bool = False,
+                  workers: int = 1) -> Changelog:
+        """
+        Create a new changelog from markdown text, such as a file's contents from somewhere other than disk
+
+        :param text: The markdown text to parse
+        :param path: The changelog's path on disk. The file is not read, and is only written to by :py:meth:`write`.
+            The text counts as the file's contents when it was read, so :py:meth:`write` raises a
+            :py:class:`~yaclog.atomic.ConflictError` if the file exists with different contents
+        :param lazy: If version bodies should only be parsed when they are first accessed. See :py:meth:`read`
+        :param compact: If entries should be stored compactly. See :py:meth:`read`
+        :param workers: How many processes to parse the text with. See :py:meth:`read`
+        :return: a new Changelog with the text's contents
+        """
+        changelog = cls()
+        if path:
+            changelog.path = os.path.abspath(path)
+            changelog._digest = yaclog.atomic.digest(text)
+        changelog._parse(text, lazy, compact, workers)
+        return changelog
+
+    @property
+    def versions(self) -> List[VersionEntry]:
+        """A list of versions in the changelog, with the most recent version first"""
+        return self._versions
+
+    @versions.setter
+    def versions(self, value: List[VersionEntry]):
+        self._versions = _owned(_VersionList, self, value)
+        self._index = None
+
+    def read(self, path=None, lazy: bool = False, compact: bool = False, workers: int = 1) -> None:
         """
         Read a markdown changelog file from disk. The object's contents will be overwritten by the file contents if
         reading is successful.
 
         :param path: The changelog's path on disk. By default, :py:attr:`~Changelog.path` is used
+        :param lazy: If true, only the preamble, link table and version headers are parsed up front.
+            Each version's body is parsed the first time its :py:attr:`~VersionEntry.sections` are accessed.
+            This is much faster for long changelogs when only the most recent versions are needed.
+        :param compact: If true, entries are stored as :py:class:`CompactEntries` referring to the file's text
+            instead of as separate strings, which uses less memory for long changelogs that are kept around.
+        :param workers: How many processes to parse the file with. Very large files are split between versions,
+            and each part is parsed in a separate worker process. The result is the same as parsing the whole file
+            in this process, which is always done for files smaller than :py:data:`yaclog.parallel_threshold`
         """
 
         if not path:
             # use the object path if none was provided
             path = self.path
 
-        # Read file
-        with open(path, 'r') as fp:
-            tokens, links = markdown.tokenize(fp.read())
+        with phase('read'):
+            with open(path, 'r') as fp:
+                text = fp.read()
+            if os.path.abspath(path) == self.path:
+                self._digest = yaclog.atomic.digest(text)
+            self._parse(text, lazy, compact, workers)
 
-        section = ''
-        versions = []
-        preamble_segments = []
+    async def aread(self, path=None, lazy: bool = False, compact: bool = False, executor=None) -> None:
+        """
+        Read a markdown changelog file from disk like :py:meth:`read`, without blocking the event loop.
+        The file is read and parsed in ``executor``, and the changelog is only updated once that is complete,
+        so it is left as it was if reading fails or is cancelled.
 
-        for token in tokens:
-            text = '\n'.join(token.lines)
+        :param path: The changelog's path on disk. By default, :py:attr:`~Changelog.path` is used
+        :param lazy: If version bodies should only be parsed when they are first accessed. See :py:meth:`read`
+        :param compact: If entries should be stored compactly. See :py:meth:`read`
+        :param executor: The :py:class:`concurrent.futures.Executor` to read the file in. Defaults to the event
+            loop's default executor, which is a thread pool. With a :py:class:`~concurrent.futures.ProcessPoolExecutor`
+            the file is parsed in another process, so parsing large changelogs doesn't hold the GIL. The executor's
+            number of workers limits how many changelogs are read at once.
+        """
+        import asyncio
+
+        if not path:
+            path = self.path
 
-            if token.kind == 'h2':
-                # start of a version
-                versions.append(VersionEntry.from_header(text, line_no=token.line_no))
-                section = ''
+        loop = asyncio.get_running_loop()
+        read = await loop.run_in_executor(executor, functools.partial(_read_detached, path, lazy, compact))
 
-            elif len(versions) == 0:
-                # we haven't encountered any version headers yet,
-                # so its best to just add this line to the preamble
-                preamble_segments.append(text)
+        self.preamble, self.versions, self.links, self._source = read.preamble, read.versions, read.links, read._source
+        if os.path.abspath(path) == self.path:
+            self._digest = read._digest
 
-            elif token.kind == 'h3':
-                # start of a version section
-                section = text.strip('#').strip()
-                if section not in versions[-1].sections.keys():
-                    versions[-1].sections[section] = []
+    def _parse(self, text: str, lazy: bool = False, compact: bool = False, workers: int = 1) -> None:
+        lines = text.split('\n')
+        if workers > 1 and len(text) >= yaclog.parallel_threshold:
+            versions, spans, links, link_lines = self._parse_parallel(text, lines, lazy, compact, workers)
+        else:
+            versions, spans, links, link_lines = _parse_versions(lines, 0, len(lines), lazy, compact)
+        first = spans[0][0] if spans else len(lines)
 
-            else:
-                # change log entry
-                versions[-1].sections[section].append(text)
+        # the preamble is usually short, so parse it immediately
+        tokens = markdown.iter_tokens(lines[:first], followed=first < len(lines))
+        preamble_segments = ['\n'.join(token.lines) for token in tokens]
+
+        if lazy:
+            for version in versions:
+                version._source = lines
 
         # handle links
         for version in versions:
@@ -307,37 +1191,296 @@ class Changelog:
         self.preamble = markdown.join(preamble_segments)
         self.versions = versions
         self.links = links
+        self._remember(lines, spans, link_lines)
+
+    @staticmethod
+    def _parse_parallel(text: str, lines: List[str], lazy: bool, compact: bool, workers: int):
+        # split the file between versions and parse each part in a worker process, giving the same results as
+        # _parse_versions for the whole file
+        from concurrent.futures import ProcessPoolExecutor
+
+        with phase('split'):
+            splits = markdown.split_headers(text, lines, workers)
+        if not splits:
+            return _parse_versions(lines, 0, len(lines), lazy, compact)
+
+        # each part is sent without the newline before the next part
+        starts = [(0, 0), *splits]
+        ends = [offset - 1 for _, offset in splits] + [len(text)]
+
+        versions, spans, links, link_lines = [], [], {}, []
+        with phase('parallel'), ProcessPoolExecutor(len(starts)) as executor:
+            futures = [executor.submit(_parse_chunk, text[offset:end], line_no, len(lines), lazy, compact)
+                       for (line_no, offset), end in zip(starts, ends)]
+            for future in futures:
+                part_versions, part_spans, part_links, part_link_lines = future.result()
+                versions += part_versions
+                spans += part_spans
+                links.update(part_links)  # later definitions replace earlier ones, like in a single pass
+                link_lines += part_link_lines
+
+        return versions, spans, links, link_lines
+
+    def _remember(self, lines: List[str], spans: List[Tuple[int, int]], link_lines: List[int]) -> None:
+        # record the current contents as matching the file contents in `lines`,
+        # so that the next write only needs to replace versions that have been modified since
+        self._source = _Source(lines, self.preamble, self._version_links(), list(self.versions), link_lines)
+
+        for version, span in zip(self.versions, spans):
+            if version._compact and version._source is None:
+                version._rebase_entries(lines, span)
+
+            version.span = span
+            version.line_no = span[0]
+            version._original_header = version._snapshot_header()
+            if version._source is not None:
+                version._source = lines
+            else:
+                version._original_body = version._snapshot_body()
 
-    def write(self, path=None) -> None:
+    def _version_links(self) -> Dict[str, str]:
+        v_links = {**self.links}
+        for version in self.versions:
+            if version.link:
+                v_links[version.name.lower()] = version.link
+        return v_links
+
+    def write(self, path=None, incremental: bool = True) -> None:
         """
         Write a changelog to a Markdown file.
 
         :param path: The changelog's path on disk. By default, :py:attr:`~Changelog.path` is used.
+        :param incremental: If the changelog was read from a file, only re-render versions that have been
+            modified since, and copy everything else from the original file as-is. If the preamble or links have
+            changed, or versions have been removed or reordered, the whole changelog is re-rendered anyway.
+        :raises yaclog.atomic.ConflictError: If writing to :py:attr:`~Changelog.path` and the file has been changed
+            by another process since it was read. Nothing is written, so read it again and redo the changes.
         """
 
         if path is None:
             # use the object path if none was provided
             path = self.path
 
+        if self._pending_writes is not None:
+            # in a transaction, write once at the end instead
+            self._pending_writes[path] = self._pending_writes.get(path, True) and incremental
+            return
+
+        with phase('write'):
+            with phase('render'):
+                spliced = self._splice() if incremental and self._source else None
+
+                if spliced:
+                    lines, spans, link_lines = spliced
+                    text = '\n'.join(lines)
+                else:
+                    text = self._render()
+                    lines = text.split('\n')
+                    headers, _, link_lines = markdown.index_headers(lines)
+                    spans = [(start, end) for start, end, _ in headers]
+
+            with phase('io'), yaclog.atomic.lock(path):
+                own_file = os.path.abspath(path) == self.path
+                if own_file and yaclog.atomic.file_digest(path) != self._digest:
+                    raise yaclog.atomic.ConflictError(
+                        f'Changelog file {path} was modified by another process since it was read')
+
+                yaclog.atomic.write(path, text)
+                if own_file:
+                    self._digest = yaclog.atomic.digest(text)
+
+                if self._fragments and own_file:
+                    # the fragments are part of the changelog file now
+                    for fragment in self._fragments:
+                        with contextlib.suppress(FileNotFoundError):
+                            os.remove(fragment)
+                    self._fragments = []
+
+        if not own_file:
+            return  # later incremental writes still copy from the changelog's own file
+
+        if len(spans) == len(self.versions):
+            self._remember(lines, spans, link_lines)
+        else:
+            # an entry looks like a version header, so the written file can't be mapped back to our versions
+            self._source = None
+
+    async def awrite(self, path=None, incremental: bool = True, executor=None) -> None:
+        """
+        Write a changelog to a Markdown file like :py:meth:`write`, without blocking the event loop.
+        The changelog must not be modified until this returns. Writing can't be interrupted part way, so if this is
+        cancelled it waits for the write to finish before raising :py:exc:`asyncio.CancelledError`.
+
+        :param path: The changelog's path on disk. By default, :py:attr:`~Changelog.path` is used.
+        :param incremental: If only modified versions should be re-rendered. See :py:meth:`write`
+        :param executor: The :py:class:`concurrent.futures.Executor` to write the file in. Defaults to the event
+            loop's default executor, which is a thread pool. The changelog is updated as it is written, so
+            process pools can't be used.
+        :raises yaclog.atomic.ConflictError: If the file has been changed by another process since it was read.
+        """
+        import asyncio
+        from concurrent.futures import ProcessPoolExecutor
+
+        if isinstance(executor, ProcessPoolExecutor):
+            raise TypeError('Changelogs can only be written by an executor in the same process')
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(executor, self.write, path, incremental)
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait([future])
+            if not future.cancelled():
+                future.exception()  # the cancellation is reported instead
+            raise
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Group changes to the changelog so they are written all at once or not at all::
+
+            with changelog.transaction():
+                changelog.current_version(released=False, new_version=True).add_entry('- Fixed a bug', 'Fixed')
+                changelog.current_version().tags.append('YANKED')
+                changelog.write()
+
+        Calls to :py:meth:`write` inside the transaction are deferred, and each file is written once when it ends.
+        If an exception is raised, the changelog is restored to how it was before the transaction, nothing is written,
+        and the exception is re-raised. Nested transactions are merged into the outermost one.
+        """
+
+        if self._pending_writes is not None:
+            yield self  # already in a transaction
+            return
+
+        state = (self.preamble, dict(self.links), list(self.versions), self._source, list(self._fragments),
+                 [(version, version._checkpoint()) for version in self.versions])
+        self._pending_writes = {}
+        try:
+            yield self
+        except BaseException:
+            self.preamble, self.links, self.versions, self._source, self._fragments, versions = state
+            for version, version_state in versions:
+                version._restore(version_state)
+            raise
+        finally:
+            pending, self._pending_writes = self._pending_writes, None
+
+        for path, incremental in pending.items():
+            self.write(path, incremental)
+
+    def _render(self) -> str:
         segments = []
 
         if self.preamble:
             segments.append(self.preamble)
 
-        v_links = {**self.links}
+        for version in self.versions:
+            segments.append(version.text() + '\n')
+
+        segments += [f'[{link_id}]: {link}' for link_id, link in self._version_links().items()]
+
+        return markdown.join(segments)
+
+    def _splice(self) -> Optional[Tuple[List[str], List[Tuple[int, int]], List[int]]]:
+        source = self._source
+        if self.preamble != source.preamble or self._version_links() != source.links:
+            return None
+
+        from_source = {id(version) for version in source.versions}
+        if not from_source or [v for v in self.versions if id(v) in from_source] != source.versions:
+            # versions have been removed or reordered
+            return None
+
+        modified = {id(v) for v in source.versions if v.modified}
+        for version in source.versions:
+            if id(version) in modified:
+                start, end = version.span
+                if bisect.bisect_left(source.link_lines, start) != bisect.bisect_left(source.link_lines, end):
+                    # replacing this version would lose a link definition inside it
+                    return None
+
+        lines = []
+        spans = []
+        link_lines = []
+        pos = 0
+        new_versions = []
+
+        def copy(start, end):
+            # copy lines from the original file, keeping track of where its link definitions end up
+            lo = bisect.bisect_left(source.link_lines, start)
+            hi = bisect.bisect_left(source.link_lines, end)
+            link_lines.extend(n - start + len(lines) for n in source.link_lines[lo:hi])
+            lines.extend(source.lines[start:end])
+
+        def render(version):
+            start = len(lines)
+            lines.extend(version.text().split('\n'))
+            spans.append((start, len(lines)))
+
+        def underline(line_no):
+            # adding lines before the start or after the end of the file
+            # could turn a line like this into a setext header underline
+            line = source.lines[line_no] if 0 <= line_no < len(source.lines) else ''
+            return markdown.setext_h1_underline_regex.fullmatch(line) or \
+                markdown.setext_h2_underline_regex.fullmatch(line)
 
         for version in self.versions:
-            if version.link:
-                v_links[version.name.lower()] = version.link
+            if id(version) not in from_source:
+                new_versions.append(version)
+                continue
+
+            start, end = version.span
+            if new_versions and start == 0 and underline(1):
+                return None
+
+            copy(pos, start)
+            for new_version in new_versions:
+                render(new_version)
+                lines.extend(['', ''])
+            new_versions.clear()
+
+            if id(version) in modified:
+                render(version)
+            else:
+                spans.append((len(lines), len(lines) + end - start))
+                copy(start, end)
+            pos = end
 
-            segments.append(version.text() + '\n')
+        if new_versions and pos == len(source.lines) and underline(pos - 1):
+            return None
 
-        segments += [f'[{link_id}]: {link}' for link_id, link in v_links.items()]
+        for new_version in new_versions:
+            lines.extend(['', ''])
+            render(new_version)
+        copy(pos, len(source.lines))
 
-        text = markdown.join(segments)
+        return lines, spans, link_lines
+
+    def fold_fragments(self, directory) -> int:
+        """
+        Add the entries from every fragment in a directory to the current unreleased version, adding a new
+        unreleased version if there isn't one. The fragments are deleted the next time the changelog is written to
+        :py:attr:`~Changelog.path`. See :py:mod:`yaclog.fragments`
+
+        :param directory: The fragments directory
+        :return: The number of fragments added
+        """
+        import yaclog.fragments
 
-        with open(path, 'w') as fp:
-            fp.write(text)
+        with phase('fragments'):
+            fragments = yaclog.fragments.read(directory)
+            if not fragments:
+                return 0
+
+            version = self.current_version(released=False, new_version=True)
+            for path, sections in fragments:
+                for section, entries in sections.items():
+                    for contents in entries:
+                        version.add_entry(contents, section)
+                self._fragments.append(path)
+
+        return len(fragments)
 
     def add_version(self, index: int = 0, *args, **kwargs) -> VersionEntry:
         """
@@ -379,22 +1522,146 @@ class Changelog:
             else:
                 raise ValueError('Changelog has no current version')
 
+    def infer_version(self, version: Optional[VersionEntry] = None) -> Optional[str]:
+        """
+        Get the version number of a version, inferring one if it doesn't have one yet
+
+        :param version: The version to get the number of. Defaults to the current version
+        :return: The version's :pep:`440` version number. If it doesn't have one, the patch number of the most recent
+            release before it is incremented instead. `None` if there is no release before it either.
+        """
+
+        if version is None:
+            version = self.current_version()
+        if version.version:
+            return str(version.version)
+
+        position = self._get_index().positions[id(version)]
+        for older in itertools.islice(self.versions, position + 1, None):
+            if older.released:
+                return yaclog.version.increment_version(str(older.version), 2, '')
+        return None
+
     def get_version(self, name: Optional[str] = None) -> VersionEntry:
         """
         Get a version from the changelog by name.
 
         :param name: The name of the version to get, or `None` to return the most recent.
-            The first version with this value in its name is returned.
+            The first version with exactly this name, this link ID, or an equivalent :pep:`440` version number is
+            returned. Otherwise, the first version with this value in its name is returned.
         :return: The first version with the selected name
         """
 
-        for version in self.versions:
-            if name in version.name or name is None:
+        if name is None:
+            if self.versions:
+                return self.versions[0]
+        else:
+            if version := self._get_index().get(name):
                 return version
+
+            for version in self.versions:
+                if name in version.name:
+                    return version
+
         raise KeyError(f'Version {name} not found in changelog')
 
+    def query(self, names: Iterable[str] = (), since: Optional[datetime.date] = None,
+              until: Optional[datetime.date] = None, tags: Iterable[str] = (),
+              sections: Iterable[str] = (), missing_ok: bool = False) -> List[VersionEntry]:
+        """
+        Find all versions matching a query. Each kind of criteria that is given must be matched.
+
+        :param names: Names of versions to get as in :py:meth:`get_version`, or inclusive ranges of :pep:`440`
+            version numbers like ``1.2.0..2.0.0``. Either end of a range can be left out to leave it unbounded.
+            If none are given, versions with any name are matched.
+        :param since: Only match versions released on or after this date
+        :param until: Only match versions released on or before this date
+        :param tags: Only match versions with at least one of these tags
+        :param sections: Only match versions with entries in at least one of these sections, ignoring case.
+            This requires parsing the body of every version that matches the other criteria.
+        :param missing_ok: If names that don't match any version are ignored, instead of raising a KeyError
+        :return: A list of matching versions, in the order they appear in the changelog
+        """
+
+        index = self._get_index()
+        matches = None  # a set of positions, or None to match every version
+
+        def narrow(positions):
+            nonlocal matches
+            matches = set(positions) if matches is None else matches.intersection(positions)
+
+        if names:
+            selected = set()
+            for name in names:
+                if '..' in name:
+                    selected.update(index.number_range(*_parse_range(name)))
+                else:
+                    try:
+                        selected.add(index.positions[id(self.get_version(name))])
+                    except KeyError:
+                        if not missing_ok:
+                            raise
+            narrow(selected)
+
+        if since or until:
+            narrow(index.date_range(since, until))
+
+        if tags:
+            narrow(position for tag in tags for position in index.tagged(tag))
+
+        versions = self.versions if matches is None else [self.versions[p] for p in sorted(matches)]
+
+        if sections:
+            sections = {section.lower() for section in sections}
+            versions = [version for version in versions
+                        if any(entries and section.lower() in sections
+                               for section, entries in version.sections.items())]
+
+        return versions
+
+    def diff(self, other: Changelog) -> List[VersionDiff]:
+        """
+        Compare this changelog to another revision of it, such as the same file in a later commit.
+        Versions are matched up by name, and compared by their :py:attr:`~VersionEntry.digest`, so the entries of
+        unchanged versions aren't compared. Lazily read versions with identical lines aren't even parsed.
+
+        :param other: The newer revision of the changelog
+        :return: How each version that was added, removed or modified differs, in the order the versions appear in
+            ``other``, followed by the versions that were removed
+        """
+
+        old_versions: Dict[str, List[VersionEntry]] = {}
+        for version in reversed(self.versions):
+            old_versions.setdefault(version.name, []).append(version)
+
+        diffs = []
+        matched = set()
+        for version in other.versions:
+            if same_name := old_versions.get(version.name):
+                old = same_name.pop()  # versions with the same name are matched up in order
+                matched.add(id(old))
+                if not _same_version(old, version):
+                    diffs.append(VersionDiff(old, version))
+            else:
+                diffs.append(VersionDiff(None, version))
+
+        diffs += [VersionDiff(version, None) for version in self.versions if id(version) not in matched]
+        return diffs
+
+    def _get_index(self) -> _VersionIndex:
+        if self._index is None:
+            # versions discard the index of the changelog that last indexed them when they're changed
+            for version in self.versions:
+                version._changelog = self
+            self._index = _VersionIndex(self.versions)
+        return self._index
+
     def __getitem__(self, item: str) -> VersionEntry:
         return self.get_version(item)
 
     def __len__(self) -> int:
         return len(self.versions)
+
+    def __getstate__(self):
+        # the index refers to versions by id, which isn't preserved when pickling
+        return {**self.__dict__, '_index': None}
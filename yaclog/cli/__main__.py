@@ -14,127 +14,366 @@
 #  You should have received a copy of the GNU Affero General Public License
 #  along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import contextlib
 import datetime
+import functools
+import io
 import os.path
+import sys
 from sys import stdout
 
 import click
 
+import yaclog.atomic
+import yaclog.profiling
 import yaclog.version
-from yaclog.changelog import Changelog
+from yaclog.changelog import Changelog, Entry
 
 
-@click.group()
+class _Group(click.Group):
+    def parse_args(self, ctx, args):
+        ctx.meta['yaclog.args'] = list(args)  # kept to send the whole command to a server, see --daemon
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=_Group)
 @click.option('--path', envvar='YACLOG_PATH', metavar='FILE', default='CHANGELOG.md', show_default=True,
               type=click.Path(dir_okay=False, writable=True, readable=True),
               help='Location of the changelog file.')
+@click.option('--cache/--no-cache', envvar='YACLOG_CACHE', default=False, show_default=True,
+              help='Reuse the parsed changelog from the on-disk cache if the file has not changed.')
+@click.option('--fragments', envvar='YACLOG_FRAGMENTS', metavar='DIR', type=click.Path(file_okay=False),
+              help='Add new entries to DIR as separate fragment files instead of to the changelog, '
+                   'which are folded into the unreleased version by show and release.')
+@click.option('--workers', envvar='YACLOG_WORKERS', metavar='N', type=click.IntRange(min=1), default=1,
+              show_default=True, help='Parse very large changelogs in N processes.')
+@click.option('--profile', envvar='YACLOG_PROFILE', is_flag=True,
+              help='Print how long each phase of the command took to stderr.')
+@click.option('--profile-output', envvar='YACLOG_PROFILE_OUTPUT', metavar='FILE',
+              type=click.Path(dir_okay=False, writable=True),
+              help='Save a profile to FILE, as a JSON trace if it ends in .json or cProfile stats otherwise. '
+                   'Implies --profile.')
+@click.option('--daemon', envvar='YACLOG_DAEMON', is_flag=True,
+              help='Run the command in a server started with yaclog serve, which keeps changelogs in memory. '
+                   'If no server is running, the command is run as usual.')
 @click.version_option()
 @click.pass_context
-def cli(ctx, path):
+def cli(ctx, path, cache, fragments, workers, profile, profile_output, daemon):
     """Manipulate markdown changelog files."""
-    if not (ctx.invoked_subcommand == 'init') and not os.path.exists(path):
-        # file does not exist and this isn't the init command
-        raise click.FileError(f'Changelog file {path} does not exist. Create it by running yaclog init.')
+    if daemon and ctx.invoked_subcommand in _daemon_commands and not (profile or profile_output):
+        from yaclog.cli import daemon as server
+        read_only = ctx.invoked_subcommand in _read_only_commands
+        if not server.serving and (response := server.request(ctx.meta['yaclog.args'], read_only=read_only)):
+            click.echo(response['stdout'], nl=False)
+            click.echo(response['stderr'], nl=False, err=True)
+            ctx.exit(response['exit_code'])
+
+    if profile or profile_output:
+        profiler = yaclog.profiling.Profiler(cprofile=bool(profile_output) and not profile_output.endswith('.json'))
+        profiler.start()
+
+        def finish():
+            profiler.stop()
+            click.echo(profiler.summary(), err=True)
+            if profile_output:
+                profiler.dump(profile_output)
+
+        ctx.call_on_close(finish)
+
+
+def load_changelog(ctx: click.Context, fold: bool = False) -> Changelog:
+    """
+    Get the changelog at the path given to the command group, reading it the first time it is needed
+
+    :param ctx: The current click context
+    :param fold: If pending fragments from ``--fragments`` should be folded into the changelog. Folded fragments are
+        deleted once the changelog is written, so only commands that release or only display the changelog fold them
+    :return: The changelog for this invocation
+    """
+    root = ctx.find_root()
+    if root.obj is None:
+        path = root.params['path']
+        if not os.path.exists(path):
+            raise click.FileError(f'Changelog file {path} does not exist. Create it by running yaclog init.')
+
+        with yaclog.profiling.phase('load'):
+            daemon = sys.modules.get('yaclog.cli.daemon')
+            if daemon and daemon.serving and not root.params['fragments']:
+                root.obj = daemon.load(path)
+            else:
+                root.obj = yaclog.read(path, lazy=True, cache=root.params['cache'], workers=root.params['workers'])
+        root.meta.pop(_folded_key, None)
+
+    if fold and root.params['fragments'] and _folded_key not in root.meta:
+        root.meta[_folded_key] = True
+        try:
+            root.obj.fold_fragments(root.params['fragments'])
+        except ValueError as v:
+            raise click.ClickException(str(v))
+    return root.obj
+
+
+_folded_key = 'yaclog.folded'  # in the root context's meta once fragments are folded, or False if they never should be
+
+
+def _discard_stdout() -> None:
+    try:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, stdout.fileno())
+    except (OSError, ValueError, AttributeError):
+        pass  # not a real file, such as when testing
+
+
+def _version_record(obj: Changelog, version, sections=None) -> dict:
+    """Everything about a version, for JSON output"""
+    section_names = sections and {section.lower() for section in sections}
+    return {
+        'name': version.name,
+        'version': str(version.version) if version.version else None,
+        'inferred_version': obj.infer_version(version),
+        'released': version.released,
+        'date': version.date.isoformat() if version.date else None,
+        'tags': list(version.tags),
+        'link': version.link,
+        'sections': {section: list(entries) for section, entries in version.sections.items()
+                     if not section_names or section.lower() in section_names},
+        'header': {'md': version.header(md=True), 'txt': version.header(md=False)},
+        'body': {'md': version.body(md=True, sections=sections), 'txt': version.body(md=False, sections=sections)},
+    }
+
+
+def _write_json(records, ndjson: bool) -> None:
+    import json
 
-    ctx.obj = yaclog.read(path)
+    if ndjson:
+        for record in records:
+            click.echo(json.dumps(record))
+    else:
+        click.echo('[', nl=False)
+        for i, record in enumerate(records):
+            click.echo((',\n' if i else '\n') + json.dumps(record), nl=False)
+        click.echo('\n]')
+
+
+def _write_gh_actions(obj: Changelog, records, markdown: bool) -> None:
+    # write outputs for the github action, in the format expected by $GITHUB_OUTPUT
+    import json
+    import tempfile
+
+    fmt = 'md' if markdown else 'txt'
+    outputs = {'name': [], 'header': [], 'version': [], 'body': [], 'json': []}
+    for record in records:
+        outputs['json'].append(record)
+        outputs['name'].append(record['name'])
+        outputs['header'].append(record['header'][fmt])
+        outputs['version'].append(record['inferred_version'] or '')
+        outputs['body'].append(record['body'][fmt])
+
+    for key in ['name', 'header', 'version']:
+        click.echo(f'{key}=' + '\n'.join(outputs[key]))
+
+    body_fd, body_file = tempfile.mkstemp(text=True)
+    with os.fdopen(body_fd, 'w') as f:
+        f.write('\n\n'.join(outputs['body']))
+    click.echo(f'body-file={body_file}')
+    click.echo(f'changelog={obj.path}')
+    click.echo('json=' + json.dumps(outputs['json'][0] if len(outputs['json']) == 1 else outputs['json']))
+
+
+def pass_changelog(f=None, *, fold: bool = False):
+    """
+    Similar to :py:func:`click.pass_obj`, but passes the changelog from :py:func:`load_changelog`.
+    Commands that don't use this never read the changelog, which keeps ``--help`` and ``init`` fast.
+
+    :param fold: If pending fragments should be folded into the changelog first. See :py:func:`load_changelog`
+    """
+
+    if f is None:
+        return functools.partial(pass_changelog, fold=fold)
+
+    @click.pass_context
+    def new_func(ctx, *args, **kwargs):
+        return _retry_on_conflict(ctx, lambda: ctx.invoke(f, load_changelog(ctx, fold), *args, **kwargs))
+
+    return functools.update_wrapper(new_func, f)
+
+
+def _retry_on_conflict(ctx: click.Context, func):
+    # if another process changes the changelog before we write it, read it again and redo the command
+    for attempt in range(_conflict_retries):
+        try:
+            return func()
+        except yaclog.atomic.ConflictError as e:
+            if attempt + 1 == _conflict_retries:
+                raise click.ClickException(str(e))
+            ctx.find_root().obj = None
+
+
+_conflict_retries = 5
 
 
 @cli.command()
-@click.pass_obj
-def init(obj: Changelog):
+@click.pass_context
+def init(ctx):
     """Create a new changelog file."""
-    if os.path.exists(obj.path):
-        click.confirm(f'Changelog file {obj.path} already exists. Would you like to overwrite it?', abort=True)
-        os.remove(obj.path)
+    path = ctx.find_root().params['path']
+    if os.path.exists(path):
+        click.confirm(f'Changelog file {path} already exists. Would you like to overwrite it?', abort=True)
+        os.remove(path)
 
-    yaclog.Changelog(obj.path).write()
-    click.echo(f'Created new changelog file at {obj.path}')
+    yaclog.Changelog(path).write()
+    click.echo(f'Created new changelog file at {path}')
 
 
 @cli.command('format')  # don't accidentally hide the `format` python builtin
-@click.pass_obj
+@pass_changelog
 def reformat(obj: Changelog):
     """Reformat the changelog file."""
-    obj.write()
+    obj.write(incremental=False)
     click.echo(f'Reformatted changelog file at {obj.path}')
 
 
+def _show_options(func):
+    """Add the options for choosing and formatting versions shared by show and scan"""
+    options = [
+        click.option('--all', '-a', 'all_versions', is_flag=True, help='Show the entire changelog.'),
+        click.option('--markdown/--txt', '-m/-t', default=False, help='Display as markdown or plain text.'),
+        click.option('--full', '-f', 'mode', flag_value='full', default=True,
+                     help='Show version header and body.'),
+        click.option('--name', '-n', 'mode', flag_value='name',
+                     help='Show only the version name'),
+        click.option('--body', '-b', 'mode', flag_value='body',
+                     help='Show only the version body.'),
+        click.option('--header', '-h', 'mode', flag_value='header',
+                     help='Show only the version header.'),
+        click.option('--version', '-v', 'mode', flag_value='version',
+                     help='Show only the version number. If the current version is unreleased, '
+                          'this is inferred by incrementing the patch number of the last released version'),
+        click.option('--json', 'output_format', flag_value='json',
+                     help='Show everything about each version as a JSON array of objects.'),
+        click.option('--ndjson', 'output_format', flag_value='ndjson',
+                     help='Show everything about each version as JSON objects, one per line.'),
+        click.option('--since', metavar='DATE', type=click.DateTime(['%Y-%m-%d']),
+                     help='Only show versions released on or after DATE.'),
+        click.option('--until', metavar='DATE', type=click.DateTime(['%Y-%m-%d']),
+                     help='Only show versions released on or before DATE.'),
+        click.option('--tag', 'tags', metavar='TAG', multiple=True,
+                     help='Only show versions with TAG. Can be given multiple times.'),
+        click.option('--section', 'sections', metavar='SECTION', multiple=True,
+                     help='Only show SECTION, and versions with entries in it. Can be given multiple times.'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def _select_versions(obj: Changelog, version_names, all_versions, since, until, tags, sections,
+                     missing_ok: bool = False):
+    """The versions chosen by the options in :py:func:`_show_options`"""
+    if (version_names and not all_versions) or since or until or tags or sections:
+        return obj.query(() if all_versions else version_names, since=since and since.date(),
+                         until=until and until.date(), tags=tags, sections=sections, missing_ok=missing_ok)
+    elif all_versions:
+        return obj.versions
+    else:
+        return [obj.current_version()]
+
+
+def _version_formatter(obj: Changelog, mode, markdown, sections):
+    """A function rendering a version the way chosen by the options in :py:func:`_show_options`"""
+    color = click.get_current_context().color
+    kwargs = {'md': markdown, 'color': stdout.isatty() if color is None else color}
+    functions = {
+        'full': (lambda v: v.text(**kwargs, sections=sections)),
+        'name': (lambda v: v.name),
+        'body': (lambda v: v.body(**kwargs, sections=sections)),
+        'header': (lambda v: v.header(**kwargs)),
+        'version': (lambda v: _inferred_version(obj, v)),
+    }
+    return functions[mode]
+
+
+def _inferred_version(obj: Changelog, version) -> str:
+    inferred = obj.infer_version(version)
+    if inferred is None:
+        raise click.ClickException(f'Version {version.name} has no version number, '
+                                   'and there is no release before it to infer one from')
+    return inferred
+
+
+def _echo_chunks(chunks) -> None:
+    try:
+        for chunk in chunks:
+            click.echo(chunk, nl=False)
+    except BrokenPipeError:
+        # the reader went away, such as when piping to `head`. stop rendering, and keep python from
+        # complaining about the pipe again when it flushes stdout on exit
+        _discard_stdout()
+        raise click.exceptions.Exit(1)
+
+
 # noinspection PyShadowingNames
 @cli.command(short_help='Show changes from the changelog file')
-@click.option('--all', '-a', 'all_versions', is_flag=True, help='Show the entire changelog.')
-@click.option('--markdown/--txt', '-m/-t', default=False, help='Display as markdown or plain text.')
-@click.option('--full', '-f', 'mode', flag_value='full', default=True,
-              help='Show version header and body.')
-@click.option('--name', '-n', 'mode', flag_value='name',
-              help='Show only the version name')
-@click.option('--body', '-b', 'mode', flag_value='body',
-              help='Show only the version body.')
-@click.option('--header', '-h', 'mode', flag_value='header',
-              help='Show only the version header.')
-@click.option('--version', '-v', 'mode', flag_value='version', help='Show only the version number. If the current version is unreleased, '
-                                                                    'this is inferred by incrementing the patch number of the last released version')
+@_show_options
+@click.option('--pager/--no-pager', envvar='YACLOG_PAGER', default=False, show_default=True,
+              help='Display the output in a pager.')
 @click.option('---gh-actions', 'gh_actions', is_flag=True, hidden=True)
 @click.argument('version_names', metavar='VERSIONS', type=str, nargs=-1)
-@click.pass_obj
-def show(obj: Changelog, all_versions, markdown, mode, version_names, gh_actions):
+@pass_changelog(fold=True)
+def show(obj: Changelog, all_versions, markdown, mode, output_format, since, until, tags, sections, pager,
+         version_names, gh_actions):
     """
     Show the changes for VERSIONS.
 
     VERSIONS is a list of versions to print. If not given, the most recent version is used.
-    """
+    A range of version numbers like 1.2.0..2.0.0 selects every version in between, inclusive.
+    Either end of a range can be left out.
 
-    functions = {
-        'full': (lambda v, k: v.text(**k)),
-        'name': (lambda v, k: v.name),
-        'body': (lambda v, k: v.body(**k)),
-        'header': (lambda v, k: v.header(**k)),
-        'version': (lambda v, k: latest_version)
-    }
+    With --json or --ndjson, each version is shown as an object with its name, version number, inferred version
+    number, if it is released, date, tags, link, sections, and its header and body rendered as markdown ("md") and
+    plain text ("txt").
+    """
 
-    str_func = functions[mode]
-    kwargs = {'md': markdown, 'color': stdout.isatty()}
-    latest_version = str(obj.versions[0].version)
+    section_filter = sections or None
+    str_func = _version_formatter(obj, mode, markdown, section_filter)
 
     try:
-        if all_versions:
-            versions = obj.versions
-        elif len(version_names) == 0:
-            versions = [obj.current_version()]
-            if ((mode == 'version') or gh_actions) and versions[0].name == 'Unreleased':
-                latest = obj.current_version(released=True).version
-                inferred = yaclog.version.increment_version(str(latest), 2, '')
-                latest_version = inferred
-        else:
-            versions = [obj.get_version(name) for name in version_names]
+        versions = _select_versions(obj, version_names, all_versions, since, until, tags, sections)
     except KeyError as k:
         raise click.BadArgumentUsage(str(k))
     except ValueError as v:
         raise click.ClickException(str(v))
 
+    if output_format or gh_actions:
+        records = (_version_record(obj, v, section_filter) for v in versions)
+        if gh_actions:
+            _write_gh_actions(obj, records, markdown)
+        else:
+            _write_json(records, output_format == 'ndjson')
+        return
+
+    if not versions:
+        return  # nothing matched the filters
+
     sep = '\n\n' if mode == 'body' or mode == 'full' else '\n'
 
-    if gh_actions:
-        import tempfile
-
-        kwargs['color'] = False
-        all_modes = [ 'name', 'header', 'version' ]
-        outputs = [f'{mode}={sep.join([functions[mode](v, kwargs) for v in versions])}' for mode in all_modes]
-        click.echo('\n'.join(outputs))
-        body_fd, body_file = tempfile.mkstemp(text=True)
-        with os.fdopen(body_fd, 'w') as f:
-            f.write(sep.join([functions['body'](v, kwargs) for v in versions]))
-        click.echo(f'body-file={body_file}')
-        click.echo(f'changelog={obj.path}')
-        return
+    def render():
+        # render one version at a time, so output starts right away and the whole thing is never held in memory
+        for i, version in enumerate(versions):
+            yield (sep if i else '') + str_func(version)
+        yield '\n'
 
-    click.echo(sep.join([str_func(v, kwargs) for v in versions]))
+    if pager:
+        click.echo_via_pager(render())
+    else:
+        _echo_chunks(render())
 
 
 @cli.command(short_help='Modify version tags')
 @click.option('--add/--delete', '-a/-d', default=True, is_flag=True, help='Add or delete tags')
 @click.argument('tag_name', metavar='TAG', type=str)
 @click.argument('version_name', metavar='VERSION', type=str, required=False)
-@click.pass_obj
+@pass_changelog
 def tag(obj: Changelog, add, tag_name: str, version_name: str):
     """
     Modify TAG on VERSION.
@@ -168,8 +407,8 @@ def tag(obj: Changelog, add, tag_name: str, version_name: str):
 @click.option('--paragraph', '-p', 'paragraphs', metavar='TEXT', multiple=True, type=str, help='Add a paragraph')
 @click.argument('section_name', metavar='SECTION', type=str, default='', required=False)
 @click.argument('version_name', metavar='VERSION', type=str, default=None, required=False)
-@click.pass_obj
-def entry(obj: Changelog, bullets, paragraphs, section_name, version_name):
+@click.pass_context
+def entry(ctx, bullets, paragraphs, section_name, version_name):
     """
     Add entries to SECTION in VERSION
 
@@ -177,28 +416,45 @@ def entry(obj: Changelog, bullets, paragraphs, section_name, version_name):
 
     VERSION is the name of the version to append to. If not given, the most recent version will be used,
     or a new 'Unreleased' version will be added if the most recent version has been released.
+
+    If --fragments is given and VERSION is not, the entries are written to a new fragment file instead,
+    without reading the changelog.
     """
 
     section_name = section_name.title()
-    try:
-        if version_name:
-            version = obj.get_version(version_name)
-        else:
-            version = obj.current_version(released=False, new_version=True)
-    except KeyError as k:
-        raise click.BadArgumentUsage(str(k))
-
-    for p in paragraphs:
-        version.add_entry(p, section_name)
-
-    for b in bullets:
-        version.add_entry('- ' + b, section_name)
-
-    obj.write()
     count = len(paragraphs) + len(bullets)
     message = f"Created {count} {['entry', 'entries'][min(count - 1, 1)]}"
     if section_name:
         message += f" in section {click.style(section_name, fg='cyan')}"
+
+    root = ctx.find_root()
+    if root.params['fragments'] and not version_name and root.obj is None:
+        import yaclog.fragments
+        with yaclog.profiling.phase('write'):
+            path = yaclog.fragments.add(root.params['fragments'], [*paragraphs, *('- ' + b for b in bullets)],
+                                        section_name)
+        click.echo(message + f" in fragment {click.style(os.path.basename(path), fg='blue')}")
+        return
+
+    def add(obj: Changelog):
+        try:
+            if version_name:
+                version = obj.get_version(version_name)
+            else:
+                version = obj.current_version(released=False, new_version=True)
+        except KeyError as k:
+            raise click.BadArgumentUsage(str(k))
+
+        for p in paragraphs:
+            version.add_entry(p, section_name)
+
+        for b in bullets:
+            version.add_entry(Entry('- ' + b, 'li'), section_name)
+
+        obj.write()
+        return version
+
+    version = _retry_on_conflict(ctx, lambda: add(load_changelog(ctx)))
     if version.name.lower() != 'unreleased':
         message += f" in version {click.style(version.name, fg='blue')}"
     click.echo(message)
@@ -231,7 +487,7 @@ def entry(obj: Changelog, bullets, paragraphs, section_name, version_name):
 @click.option('-n', '--new', is_flag=True,
               help = 'Create a new version instead of renaming an existing one')
 @click.argument('version_name', metavar='VERSION', type=str, default=None, required=False)
-@click.pass_obj
+@pass_changelog(fold=True)
 def release(obj: Changelog, version_name, rel_seg, pre_seg, commit, cargo, yes, new):
     """
     Release VERSION, or a version incremented from the last release.
@@ -285,24 +541,31 @@ def release(obj: Changelog, version_name, rel_seg, pre_seg, commit, cargo, yes,
         short_version = cur_version.name.replace(' ', '-')
 
     if cargo:
-        from ..cli import cargo_toml
-        cargo_toml.set_version("Cargo.toml", str(short_version))
+        with yaclog.profiling.phase('cargo'):
+            from ..cli import cargo_toml
+            cargo_toml.set_version("Cargo.toml", str(short_version))
         click.echo("Updated Cargo.toml")
 
     if commit:
-        import git
-        repo = git.Repo(os.curdir)
+        with yaclog.profiling.phase('git'):
+            import git
+            repo = git.Repo(os.curdir)
+
+            if repo.bare:
+                raise click.BadOptionUsage('commit', f'Directory {os.path.abspath(os.curdir)} is not a git repo')
 
-        if repo.bare:
-            raise click.BadOptionUsage('commit', f'Directory {os.path.abspath(os.curdir)} is not a git repo')
+            repo.index.add(obj.path)
 
-        repo.index.add(obj.path)
+            if cargo:
+                repo.index.add("Cargo.toml")
 
-        if cargo:
-            repo.index.add("Cargo.toml")
+            fragments = click.get_current_context().find_root().params['fragments']
+            if fragments and os.path.isdir(fragments):
+                # stage fragments that were deleted by folding them into the changelog
+                repo.git.add('--update', '--', fragments)
 
-        tracked = len(repo.index.diff(repo.head.commit))
-        untracked = len(repo.index.diff(None))
+            tracked = len(repo.index.diff(repo.head.commit))
+            untracked = len(repo.index.diff(None))
 
         message = [['Create tag', 'Commit and create tag'][min(tracked, 1)], 'for']
 
@@ -319,16 +582,339 @@ def release(obj: Changelog, version_name, rel_seg, pre_seg, commit, cargo, yes,
         if not yes:
             click.confirm(' '.join(message), abort=True)
 
-        if tracked > 0:
-            commit = repo.index.commit(f'Release {cur_version.name}\n\n{cur_version.body()}')
-            click.echo(f"Created commit {click.style(repo.head.commit.hexsha[0:7], fg='green')}")
-        else:
-            commit = repo.head.commit
+        with yaclog.profiling.phase('git'):
+            if tracked > 0:
+                commit = repo.index.commit(f'Release {cur_version.name}\n\n{cur_version.body()}')
+                click.echo(f"Created commit {click.style(repo.head.commit.hexsha[0:7], fg='green')}")
+            else:
+                commit = repo.head.commit
 
-        # noinspection PyTypeChecker
-        repo_tag = repo.create_tag(short_version, ref=commit, message=cur_version.body(False))
+            # noinspection PyTypeChecker
+            repo_tag = repo.create_tag(short_version, ref=commit, message=cur_version.body(False))
         click.echo(f"Created tag {click.style(repo_tag.name, fg='green')}.")
 
 
+@cli.command(short_help='Run many commands at once.')
+@click.argument('script', type=click.File('r'), default='-')
+@click.pass_context
+def batch(ctx, script):
+    """
+    Run the commands in SCRIPT, reading and writing the changelog only once.
+
+    SCRIPT has one command per line, written the same way as on the command line without the leading "yaclog",
+    for example: entry -b "Fixed a bug" fixed. Lines can also be JSON arrays of arguments, for example:
+    ["entry", "-b", "Fixed a bug", "fixed"]. Empty lines and lines starting with # are ignored.
+    If SCRIPT is - or not given, commands are read from standard input.
+
+    If any command fails, the changelog is left unchanged. Only the entry, tag, release, show and format commands
+    can be used, and release can't use --commit or --cargo.
+
+    If another process changes the changelog before it is written, the whole script is run again. Output is held
+    back until the changelog has been written, so it is only shown once.
+    """
+    lines = list(script)  # the script may need to be run again if the changelog is changed by another process
+    _retry_on_conflict(ctx, lambda: _run_batch(ctx, lines))
+
+
+def _run_batch(ctx, lines):
+    import json
+    import shlex
+
+    commands = []
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        try:
+            args = json.loads(line) if line.startswith('[') else shlex.split(line)
+        except ValueError as e:
+            raise click.ClickException(f'Line {line_no}: {e}')
+        if not args or not all(isinstance(arg, str) for arg in args):
+            raise click.ClickException(f'Line {line_no}: expected a command and a list of arguments')
+        if args[0] not in _batch_commands:
+            raise click.ClickException(f'Line {line_no}: {args[0]} can not be used in a batch')
+        commands.append((line_no, *args))
+
+    obj = load_changelog(ctx)
+    if not any(command[1] == 'release' for command in commands):
+        # the whole batch is written at once, so fragments shown by show would be deleted by other commands
+        ctx.find_root().meta.setdefault(_folded_key, False)
+
+    output = _BufferedOutput()
+    try:
+        with contextlib.redirect_stdout(output), obj.transaction():
+            for line_no, name, *args in commands:
+                command = cli.get_command(ctx, name)
+                try:
+                    with command.make_context(name, args, parent=ctx) as command_ctx:
+                        if command_ctx.params.get('commit') or command_ctx.params.get('cargo'):
+                            raise click.UsageError('--commit and --cargo can not be used in a batch')
+                        command.invoke(command_ctx)
+                except click.ClickException as e:
+                    raise click.ClickException(f'Line {line_no}: {e.format_message()}') from e
+    except yaclog.atomic.ConflictError:
+        raise  # the script is run again, which shows its output then
+    except BaseException:
+        click.echo(output.getvalue(), nl=False)
+        raise
+    click.echo(output.getvalue(), nl=False)
+
+
+class _BufferedOutput(io.StringIO):
+    """Output held back until a batch is finished, which is styled the same way as if it was written to stdout"""
+
+    def isatty(self) -> bool:
+        return stdout.isatty()
+
+
+_batch_commands = {'entry', 'tag', 'release', 'show', 'format'}
+
+
+# noinspection PyShadowingNames
+@cli.command(short_help='Show changes from every changelog in a directory.')
+@click.option('--root', '-r', 'root_dir', metavar='DIR', default='.', show_default=True,
+              type=click.Path(exists=True, file_okay=False), help='Directory to search for changelogs.')
+@click.option('--glob', '-g', 'patterns', metavar='PATTERN', multiple=True,
+              help='Pattern matching changelog files in DIR, where ** matches any number of directories. '
+                   'Can be given multiple times.  [default: **/CHANGELOG.md]')
+@click.option('--workers', '-j', metavar='N', type=click.IntRange(min=1),
+              help='Number of processes to read changelogs with. Defaults to the number of CPUs.')
+@_show_options
+@click.argument('version_names', metavar='VERSIONS', type=str, nargs=-1)
+def scan(root_dir, patterns, workers, all_versions, markdown, mode, output_format, since, until, tags, sections,
+         version_names):
+    """
+    Show the changes for VERSIONS in every changelog in DIR.
+
+    Changelogs are found using each PATTERN, read in parallel, and shown in order of their paths. VERSIONS and the
+    other options work the same as for show, but changelogs that don't have any of VERSIONS are skipped.
+
+    Text output starts each changelog with its path, or starts each line with it when showing only names or version
+    numbers. With --json or --ndjson, each object also has the path of its changelog as "changelog".
+    """
+    import glob
+
+    paths = set()
+    for pattern in patterns or ['**/CHANGELOG.md']:
+        paths.update(p for p in glob.glob(os.path.join(glob.escape(root_dir), pattern), recursive=True)
+                     if os.path.isfile(p))
+    paths = sorted(paths)
+
+    with yaclog.profiling.phase('load'):
+        changelogs = yaclog.read_many(paths, workers=workers)
+
+    section_filter = sections or None
+    one_line = mode in ('name', 'version')
+
+    def matches():
+        for path, obj in zip(paths, changelogs):
+            if not obj.versions:
+                continue
+            try:
+                # changelogs are only skipped if they have none of the versions
+                versions = _select_versions(obj, version_names, all_versions, since, until, tags, sections,
+                                            missing_ok=True)
+            except ValueError as v:
+                raise click.ClickException(str(v))
+            if versions:
+                yield os.path.relpath(path, root_dir), obj, versions
+
+    if output_format:
+        records = ({'changelog': path, **_version_record(obj, v, section_filter)}
+                   for path, obj, versions in matches() for v in versions)
+        _write_json(records, output_format == 'ndjson')
+        return
+
+    def render():
+        sep = '\n\n' if mode == 'body' or mode == 'full' else '\n'
+        for i, (path, obj, versions) in enumerate(matches()):
+            str_func = _version_formatter(obj, mode, markdown, section_filter)
+            if one_line:
+                yield ''.join(f'{path}: {str_func(version)}\n' for version in versions)
+            else:
+                yield ('\n' if i else '') + click.style(path, bold=True) + '\n\n'
+                yield sep.join(str_func(version) for version in versions) + '\n'
+
+    _echo_chunks(render())
+
+
+@cli.command(short_help='Show changes to the changelog between git revisions.')
+@click.argument('rev_a', metavar='REV_A', default='HEAD')
+@click.argument('rev_b', metavar='REV_B', required=False)
+@click.pass_context
+def diff(ctx, rev_a, rev_b):
+    """
+    Show which versions, sections and entries in the changelog changed between REV_A and REV_B.
+
+    REV_A and REV_B are git revisions, such as commits, branches or tags. REV_A defaults to HEAD, and if REV_B is
+    not given, the changelog file on disk is used, like git diff. A revision without the changelog file counts as
+    an empty changelog.
+
+    Exits with status 3 if a version that was already released in REV_A was modified or removed.
+    """
+    import git
+
+    path = ctx.find_root().params['path']
+    try:
+        repo = git.Repo(os.curdir, search_parent_directories=True)
+    except (git.InvalidGitRepositoryError, git.NoSuchPathError):
+        raise click.ClickException(f'Directory {os.path.abspath(os.curdir)} is not in a git repo')
+
+    with yaclog.profiling.phase('load'):
+        old = _read_revision(repo, rev_a, path)
+        if rev_b:
+            new = _read_revision(repo, rev_b, path)
+        elif os.path.exists(path):
+            new = load_changelog(ctx)
+        else:
+            new = Changelog()
+
+    with yaclog.profiling.phase('diff'):
+        diffs = old.diff(new)
+
+    for version_diff in diffs:
+        status = version_diff.status
+        line = f"{status.title()} {click.style(version_diff.name, fg='blue')}"
+        if version_diff.released and status != 'added':
+            line += click.style(' (released)', fg='red', bold=True)
+        click.echo(line)
+
+        if version_diff.header_changed:
+            for label, before, after in [('date', version_diff.old.date, version_diff.new.date),
+                                         ('tags', version_diff.old.tags, version_diff.new.tags),
+                                         ('link', version_diff.old.link, version_diff.new.link)]:
+                if before != after:
+                    click.echo(f'  {label}: {_diff_value(before)} -> {_diff_value(after)}')
+
+        for section, (added, removed) in version_diff.sections.items():
+            click.echo('  ' + click.style(section.title() or 'Uncategorized', fg='cyan', bold=True))
+            for sign, color, entries in [('-', 'red', removed), ('+', 'green', added)]:
+                for entry in entries:
+                    click.echo(click.style(f'    {sign} ' + entry.replace('\n', '\n      '), fg=color))
+            if not (added or removed):
+                click.echo('    (reordered)')
+
+    if any(version_diff.released for version_diff in diffs):
+        ctx.exit(3)
+
+
+def _read_revision(repo, rev: str, path) -> Changelog:
+    # read the changelog as it was in a git revision
+    import git
+
+    try:
+        commit = repo.commit(rev)
+    except (git.BadName, ValueError):
+        raise click.BadArgumentUsage(f'Unknown revision {rev}')
+
+    # resolve symlinks on both sides, since git stores paths relative to the real working tree
+    root = os.path.realpath(repo.working_tree_dir)
+    relpath = os.path.relpath(os.path.realpath(path), root)
+    if relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+        raise click.ClickException(f'Changelog {path} is not in the git repo at {root}')
+
+    try:
+        blob = commit.tree / relpath.replace(os.sep, '/')
+    except KeyError:
+        return Changelog()  # the changelog doesn't exist in this revision
+    if blob.type != 'blob':
+        raise click.ClickException(f'Changelog {path} is not a file in revision {rev}')
+
+    return Changelog.from_text(blob.data_stream.read().decode(), lazy=True)
+
+
+def _diff_value(value) -> str:
+    if isinstance(value, list):
+        return ' '.join(f'[{tag}]' for tag in value) or 'none'
+    return str(value) if value else 'none'
+
+
+@cli.command(short_help='Keep a file for each version up to date.')
+@click.option('--output', '-o', 'output_dir', metavar='DIR', required=True, type=click.Path(file_okay=False),
+              help='Directory to write version files to.')
+@click.option('--format', '-f', 'formats', type=click.Choice(['md', 'txt', 'json']), multiple=True,
+              help='Which files to write for each version, as markdown, plain text or JSON like show --json. '
+                   'Can be given multiple times.  [default: md]')
+@click.option('--interval', metavar='SECONDS', type=click.FloatRange(min=0), default=0.5, show_default=True,
+              help='How often to check the changelog for changes.')
+@click.option('--debounce', metavar='SECONDS', type=click.FloatRange(min=0), default=0.2, show_default=True,
+              help='How long the changelog must stay the same before updating, for editors that save files in '
+                   'several steps.')
+@click.option('--once', is_flag=True, help='Write the version files once and exit.')
+@click.pass_context
+def watch(ctx, output_dir, formats, interval, debounce, once):
+    """
+    Write a file for each version in the changelog to DIR, named after the version, and update them whenever
+    the changelog changes. Only the files of versions that changed are rewritten, and the files of versions that
+    were removed from the changelog are deleted.
+
+    Runs until interrupted, unless --once is given.
+    """
+    from yaclog.cli.watch import Watcher
+
+    path = ctx.find_root().params['path']
+    if not os.path.exists(path):
+        raise click.FileError(f'Changelog file {path} does not exist. Create it by running yaclog init.')
+
+    watcher = Watcher(path, output_dir, formats or ['md'], _version_record)
+
+    def report(updated):
+        if updated:
+            click.echo(f"Updated {len(updated)} {['file', 'files'][min(len(updated) - 1, 1)]} in {output_dir}")
+
+    if once:
+        report(watcher.update())
+        return
+
+    def report_error(e):
+        click.echo(f'Failed to update files from {path}, waiting for it to change again: {e!r}', err=True)
+
+    with contextlib.suppress(KeyboardInterrupt):
+        watcher.watch(interval, debounce, report, report_error)
+
+
+@cli.command(short_help='Keep changelogs in memory for faster commands.')
+@click.option('--socket', 'socket_path', metavar='FILE', envvar='YACLOG_SOCKET', type=click.Path(dir_okay=False),
+              help='Where to create the Unix socket clients connect to.  '
+                   '[default: yaclog.sock in $XDG_RUNTIME_DIR or the temporary directory]')
+@click.option('--stop', is_flag=True, help='Stop a running server instead of starting one.')
+def serve(socket_path, stop):
+    """
+    Run a server that keeps changelogs parsed in memory, so that commands run with --daemon don't need to read
+    the changelog again if it hasn't changed since the last command. The show, entry, tag, release, format and
+    scan commands can be run in the server. Prompts can't be answered in the server, and are treated as "no".
+
+    The server runs until it is stopped with yaclog serve --stop or interrupted.
+    """
+    import yaclog.cli.daemon
+
+    if stop:
+        if not yaclog.cli.daemon.stop(socket_path):
+            raise click.ClickException('No yaclog server is running')
+        click.echo('Stopped yaclog server')
+        return
+
+    with contextlib.suppress(KeyboardInterrupt):
+        yaclog.cli.daemon.serve(cli, socket_path)
+
+
+_daemon_commands = {'show', 'entry', 'tag', 'release', 'format', 'scan'}
+_read_only_commands = {'show', 'scan'}  # commands that can be run again if the server fails while running them
+
+
+@cli.group(short_help='Manage the changelog cache.')
+def cache():
+    """Manage the on-disk cache of parsed changelogs used by the --cache option."""
+
+
+@cache.command('clear')
+def cache_clear():
+    """Remove all entries from the changelog cache."""
+    import yaclog.cache
+    count = yaclog.cache.clear()
+    click.echo(f"Removed {count} {['entry', 'entries'][min(count - 1, 1)]} from {yaclog.cache.cache_dir()}")
+
+
 if __name__ == '__main__':
     cli()
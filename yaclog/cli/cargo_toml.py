@@ -17,6 +17,8 @@
 from tomlkit import dumps
 from tomlkit import parse
 
+import yaclog.atomic
+
 
 def set_version(path, version):
     """
@@ -25,9 +27,8 @@ def set_version(path, version):
     :param path: path-like file location
     :param version: version string to overwrite with
     """
-    with open(path, 'r+') as fp:
-        toml = parse(fp.read())
+    with yaclog.atomic.lock(path):
+        with open(path, 'r') as fp:
+            toml = parse(fp.read())
         toml['package']['version'] = version
-        fp.seek(0)
-        fp.write(dumps(toml))
-        fp.truncate()
+        yaclog.atomic.write(path, dumps(toml))
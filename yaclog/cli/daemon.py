@@ -0,0 +1,260 @@
+"""
+A long-running server that keeps changelogs parsed in memory, so that repeated commands don't need to start python
+and parse the changelog again each time.
+
+The server listens on a Unix socket at :py:func:`socket_path`. Each connection sends one request as a line of JSON
+with the command line arguments, working directory and ``YACLOG_*`` environment variables of the client, and receives
+one JSON object with the command's output and exit code. Requests are handled one at a time.
+"""
+
+#  yaclog: yet another changelog tool
+#  Copyright (c) 2024. Andrew Cassidy
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+import click
+
+import yaclog
+import yaclog.atomic
+from yaclog.changelog import Changelog
+
+serving = False
+"""If this process is a server, in which case changelogs are kept in memory by :py:func:`load`"""
+
+connect_timeout = 1.0
+"""Number of seconds clients wait to connect to the server before running commands themselves"""
+
+response_timeout = 30.0
+"""Number of seconds clients wait for the server to answer a request before running the command themselves"""
+
+_loaded: Dict[str, Tuple[Tuple[int, int, int], Changelog]] = {}  # changelogs by path, with the file's stat when used
+
+
+def socket_path() -> str:
+    """
+    Get the default location of the server's socket
+
+    :return: ``$YACLOG_SOCKET`` if set, otherwise ``yaclog.sock`` in ``$XDG_RUNTIME_DIR`` or the temporary directory
+    """
+    if path := os.environ.get('YACLOG_SOCKET'):
+        return path
+    if runtime_dir := os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(runtime_dir, 'yaclog.sock')
+    name = f'yaclog-{os.getuid()}.sock' if hasattr(os, 'getuid') else 'yaclog.sock'
+    return os.path.join(tempfile.gettempdir(), name)
+
+
+def load(path) -> Changelog:
+    """
+    Get a changelog kept in memory, reading it again only if the file has changed since it was last used
+
+    :param path: The path of the changelog file
+    :return: The changelog
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    if path in _loaded:
+        old_key, changelog = _loaded[path]
+        # the file was replaced or touched, but possibly by writing this same changelog
+        if old_key == key or yaclog.atomic.file_digest(path) == changelog._digest:
+            _loaded[path] = key, changelog
+            return changelog
+
+    changelog = yaclog.read(path, lazy=True)
+    _loaded[path] = key, changelog
+    return changelog
+
+
+def request(args: List[str], path: Optional[str] = None, read_only: bool = False) -> Optional[dict]:
+    """
+    Run a command in the server
+
+    :param args: The command line arguments, not including the program name
+    :param path: The location of the server's socket, defaults to :py:func:`socket_path`
+    :param read_only: If the command doesn't modify anything, so it is safe to run it again if the server fails
+        after receiving it
+    :return: The server's response as a dictionary of ``stdout``, ``stderr`` and ``exit_code``,
+        or `None` if no server owned by this user is running. If ``read_only`` is set, also `None` if the server
+        didn't answer within :py:data:`response_timeout`
+    :raises click.ClickException: If the server received a command that isn't read only and didn't answer. It may
+        or may not have been run, so running it again could apply it twice
+    """
+    path = path or socket_path()
+    data = {'args': args, 'cwd': os.getcwd(), 'color': sys.stdout.isatty(),
+            'env': {k: v for k, v in os.environ.items() if k.startswith('YACLOG_')}}
+
+    try:
+        if not _owned(path):
+            return None  # don't send our working directory and environment to another user's server
+        client = _connect(path)
+    except (AttributeError, OSError):  # AF_UNIX is missing on some platforms, timeouts are OSErrors
+        return None
+
+    with client:
+        try:
+            client.sendall(json.dumps(data).encode() + b'\n')
+            client.shutdown(socket.SHUT_WR)
+            return json.loads(_receive(client))
+        except (OSError, ValueError) as e:
+            if read_only:
+                return None
+            raise click.ClickException(f'The server at {path} stopped answering ({e}). The command may or may not '
+                                       'have been run, so check the changelog before running it again')
+
+
+def stop(path: Optional[str] = None) -> bool:
+    """
+    Stop the server
+
+    :param path: The location of the server's socket, defaults to :py:func:`socket_path`
+    :return: If a server was running
+    """
+    try:
+        with _connect(path or socket_path()) as client:
+            client.sendall(json.dumps({'stop': True}).encode() + b'\n')
+            client.shutdown(socket.SHUT_WR)
+            _receive(client)
+            return True
+    except (AttributeError, OSError):
+        return False
+
+
+def serve(cli: click.Command, path: Optional[str] = None) -> None:
+    """
+    Answer requests until stopped
+
+    :param cli: The command to run for each request
+    :param path: Where to create the server's socket, defaults to :py:func:`socket_path`
+    """
+    global serving
+
+    if not hasattr(socket, 'AF_UNIX'):
+        raise click.ClickException('The yaclog server needs Unix sockets, which are not available on this platform')
+
+    path = path or socket_path()
+    try:
+        _connect(path).close()
+        raise click.ClickException(f'A yaclog server is already running at {path}')
+    except OSError:
+        # nothing is listening, so any socket file left behind by a server that crashed can be replaced
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o077)  # only this user can connect
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen()
+    click.echo(f'Serving at {path}', err=True)
+
+    serving = True
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection:
+                try:
+                    data = json.loads(_receive(connection))
+                except ValueError:
+                    continue
+
+                if data.get('stop'):
+                    connection.sendall(b'{}')
+                    break
+
+                with contextlib.suppress(OSError):  # the client went away
+                    connection.sendall(json.dumps(_run(cli, data)).encode())
+    finally:
+        serving = False
+        _loaded.clear()
+        server.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+
+def _run(cli: click.Command, data: dict) -> dict:
+    stdout, stderr = io.StringIO(), io.StringIO()
+    old_cwd, old_stdin = os.getcwd(), sys.stdin
+    old_env = {k: v for k, v in os.environ.items() if k.startswith('YACLOG_')}
+
+    def set_env(env):
+        for k in [k for k in os.environ if k.startswith('YACLOG_')]:
+            del os.environ[k]
+        os.environ.update(env)
+
+    try:
+        os.chdir(data['cwd'])
+        set_env(data['env'])
+        sys.stdin = io.StringIO()  # there's nobody to answer any prompts
+
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                result = cli.main(data['args'], prog_name='yaclog', standalone_mode=False, color=data['color'])
+                exit_code = result if isinstance(result, int) else 0  # exit codes are returned instead of raised
+            except click.ClickException as e:
+                e.show()
+                exit_code = e.exit_code
+            except click.Abort:
+                click.echo('Aborted!', err=True)
+                exit_code = 1
+            except Exception:
+                traceback.print_exc()
+                exit_code = 1
+    finally:
+        os.chdir(old_cwd)
+        set_env(old_env)
+        sys.stdin = old_stdin
+
+    if exit_code:
+        # a failed command may have changed a changelog without writing it
+        _loaded.clear()
+
+    return {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(), 'exit_code': exit_code}
+
+
+def _owned(path: str) -> bool:
+    # if the socket belongs to this user, since the default path is in a directory shared with other users
+    return not hasattr(os, 'getuid') or os.stat(path).st_uid == os.getuid()
+
+
+def _connect(path: str) -> socket.socket:
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(connect_timeout)
+        client.connect(path)
+        client.settimeout(response_timeout)
+    except BaseException:
+        client.close()
+        raise
+    return client
+
+
+def _receive(connection: socket.socket) -> bytes:
+    chunks = []
+    while chunk := connection.recv(65536):
+        chunks.append(chunk)
+    return b''.join(chunks)
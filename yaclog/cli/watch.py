@@ -0,0 +1,154 @@
+#  yaclog: yet another changelog tool
+#  Copyright (c) 2024. Andrew Cassidy
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import re
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import yaclog.atomic
+from yaclog.changelog import Changelog, VersionEntry
+
+
+class Watcher:
+    """Keeps a file for each version of a changelog up to date, only rewriting versions that changed"""
+
+    def __init__(self, path, output_dir, formats: Iterable[str],
+                 record: Callable[[Changelog, VersionEntry], dict]):
+        """
+        :param path: The changelog's path
+        :param output_dir: The directory to write version files to
+        :param formats: Which files to write for each version, out of ``md``, ``txt`` and ``json``
+        :param record: A function getting the JSON object for a version
+        """
+        self.path = os.path.abspath(path)
+        self.output_dir = output_dir
+        self.formats = list(formats)
+        self.record = record
+
+        self._lines: List[str] = []  # lines of the file when it was last read
+        self._written: Dict[str, tuple] = {}  # what was last written for each version, by file name without extension
+
+    def update(self) -> List[str]:
+        """
+        Read the changelog again and update the files for any versions that changed since the last update
+
+        :return: The paths of the files written or removed
+        """
+        with open(self.path, 'r') as fp:
+            text = fp.read()
+        lines = text.split('\n')
+
+        # find the range of lines that changed. Versions entirely outside it have the same contents as before
+        old = self._lines
+        prefix = 0
+        limit = min(len(lines), len(old))
+        while prefix < limit and lines[prefix] == old[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and lines[-1 - suffix] == old[-1 - suffix]:
+            suffix += 1
+        changed_end = len(lines) - suffix
+
+        # version bodies are only tokenized if they are rendered
+        changelog = Changelog.from_text(text, self.path, lazy=True)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        updated = []
+        names = set()
+        for version in changelog.versions:
+            name = _file_name(version.name)
+            while name in names:
+                name += '_'
+            names.add(name)
+
+            start, end = version.span
+            # also check anything that depends on other versions or the link table
+            key = (version.name, version.link, changelog.infer_version(version))
+            if (end <= prefix or start >= changed_end) and self._written.get(name) == key:
+                continue
+
+            for fmt in self.formats:
+                if fmt == 'json':
+                    contents = json.dumps(self.record(changelog, version), indent=2)
+                else:
+                    contents = version.text(md=fmt == 'md')
+                updated.append(path := os.path.join(self.output_dir, f'{name}.{fmt}'))
+                yaclog.atomic.write(path, contents + '\n')
+            self._written[name] = key
+
+        for name in set(self._written) - names:
+            # the version was removed or renamed
+            del self._written[name]
+            for fmt in self.formats:
+                path = os.path.join(self.output_dir, f'{name}.{fmt}')
+                if os.path.exists(path):
+                    os.remove(path)
+                    updated.append(path)
+
+        self._lines = lines
+        return updated
+
+    def watch(self, interval: float, debounce: float, callback: Callable[[List[str]], None],
+              on_error: Callable[[Exception], None]) -> None:
+        """
+        Check the changelog for changes forever, and update the version files when it changes
+
+        :param interval: How often to check the changelog, in seconds
+        :param debounce: How long the changelog must stay the same before updating, in seconds. Some editors save
+            files in several steps, and this waits for them to finish
+        :param callback: A function called with the result of each :py:meth:`update`
+        :param on_error: A function called with the exception if an update fails, such as when the file was saved
+            half-way through an edit. The update is tried again the next time the changelog changes
+        """
+        last = self._stat()
+        self._try_update(callback, on_error)
+
+        while True:
+            time.sleep(interval)
+            if (current := self._stat()) == last:
+                continue
+
+            # wait for the file to stop changing
+            while True:
+                time.sleep(debounce)
+                if (settled := self._stat()) == current:
+                    break
+                current = settled
+
+            last = current
+            if current is not None:
+                self._try_update(callback, on_error)
+
+    def _try_update(self, callback: Callable[[List[str]], None], on_error: Callable[[Exception], None]) -> None:
+        try:
+            updated = self.update()
+        except Exception as e:
+            on_error(e)
+        else:
+            callback(updated)
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None  # the editor may be replacing the file
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def _file_name(version_name: str) -> str:
+    return re.sub(r'[^\w.-]+', '-', version_name).strip('-') or 'version'
@@ -0,0 +1,106 @@
+"""
+Changelog fragments: small files each holding the entries for a single change, kept in a directory next to the
+changelog. Adding a fragment doesn't need to read or rewrite the changelog, so any number of changes can be added at
+the same time without conflicting with each other, such as from parallel branches or CI jobs.
+
+Every ``.md`` file in the directory is a fragment, written the same way as the body of a version::
+
+    ### Fixed
+
+    - Fixed a crash when the changelog is empty
+
+Fragments are folded into the current unreleased version with :py:meth:`Changelog.fold_fragments
+<yaclog.changelog.Changelog.fold_fragments>`, and deleted once the changelog has been written.
+"""
+
+#  yaclog: yet another changelog tool
+#  Copyright (c) 2024. Andrew Cassidy
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import time
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from yaclog import markdown
+from yaclog.changelog import VersionEntry
+
+
+def add(directory, entries: Iterable[str], section: str = '') -> str:
+    """
+    Write a new fragment. The directory is created if it doesn't exist.
+
+    :param directory: The fragments directory
+    :param entries: The entries to add, such as ``'- Fixed a bug'``
+    :param section: Which section to add the entries to
+    :return: The path of the new fragment
+    """
+
+    os.makedirs(directory, exist_ok=True)
+
+    segments = [f'### {section.title()}'] if section else []
+    segments += entries
+
+    # fragments are named so that they sort in the order they were created. Write to a temporary name and rename it
+    # once it's complete, so a release running at the same time never sees half a fragment
+    fd, temp_path = tempfile.mkstemp(prefix=f'{time.time_ns():020d}-', suffix='.tmp', dir=directory)
+    with os.fdopen(fd, 'w') as fp:
+        fp.write(markdown.join(segments) + '\n')
+
+    path = temp_path[:-len('.tmp')] + '.md'
+    os.replace(temp_path, path)
+    return path
+
+
+def read(directory) -> List[Tuple[str, Dict[str, List[str]]]]:
+    """
+    Read every fragment in a directory
+
+    :param directory: The fragments directory
+    :return: A list of ``(path, sections)`` tuples in the order the fragments were created, where ``sections``
+        is a dictionary of ``{section: [entries]}`` like :py:attr:`VersionEntry.sections
+        <yaclog.changelog.VersionEntry.sections>`. If the directory doesn't exist, the list is empty.
+    :raises ValueError: if a fragment contains link definitions like ``[id]: url``, or H1 or H2 headers, which can't
+        be folded into the body of a version
+    """
+
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.md'))
+    except FileNotFoundError:
+        return []
+
+    fragments = []
+    for name in names:
+        path = os.path.join(directory, name)
+        links = {}
+        with open(path) as fp:
+            version = VersionEntry()
+            version._parse_body(_body_tokens(path, markdown.iter_tokens(fp, links)))
+        if links:
+            # links are defined at the end of the changelog, so they would be lost when the fragment is folded
+            raise ValueError(f'Fragment {path} contains link definitions, which are not supported: '
+                             + ', '.join(f'[{link_id}]' for link_id in links))
+        fragments.append((path, {section: entries for section, entries in version.sections.items() if entries}))
+
+    return fragments
+
+
+def _body_tokens(path, tokens: Iterable[markdown.Token]) -> Iterator[markdown.Token]:
+    # H1 and H2 headers would become the changelog title or new versions once the fragment is folded and written
+    for token in tokens:
+        if token.kind in ('h1', 'h2'):
+            raise ValueError(f'Fragment {path} contains an H{token.kind[1]} header on line {token.line_no + 1}, '
+                             'which is not supported: ' + token.lines[0])
+        yield token
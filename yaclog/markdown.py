@@ -18,12 +18,14 @@ Tools for parsing and manipulating markdown, including a very basic tokenizer.
 #  You should have received a copy of the GNU Affero General Public License
 #  along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import bisect
 import re
-from typing import List
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional
 
 bullets = '+-*'
 brackets = '[]'
 code_regex = re.compile(r'^```')
+_fence_regex = re.compile(r'^```', re.MULTILINE)  # code_regex for every line of a file at once
 header_regex = re.compile(r'^(?P<hashes>#+)\s+(?P<contents>[^#]+)(?:\s+#+)?$')
 li_regex = re.compile(r'^[-+*] |\d+\. ')
 numbered_regex = re.compile(r'^\d+\. ')
@@ -34,55 +36,115 @@ link_lit_regex = re.compile(r'\[(?P<text>.*?)]\((?P<link>.*?)\)')  # literal lin
 
 setext_h1_replace_regex = re.compile(r'(?<=\n)(?P<header>[^\n]+?)\n=+[ \t]*(?=\n)')
 setext_h2_replace_regex = re.compile(r'(?<=\n)(?P<header>[^\n]+?)\n-+[ \t]*(?=\n)')
+setext_h1_underline_regex = re.compile(r'=+[ \t]*')
+setext_h2_underline_regex = re.compile(r'-+[ \t]*')
 
 
 def strip_link(text):
     """
-    Parses and removes any links from the input string
+    Parses and removes any links from the input string.
+    The result is the same as matching :py:data:`link_lit_regex` or :py:data:`link_def_regex`, but takes linear time.
 
     :param text: An input string which may be a markdown link, either literal or an ID
     :return: A tuple of (name, url, id). If the input is not a link, it is returned verbatim as the name.
     """
 
-    if link_lit := link_lit_regex.fullmatch(text):
-        # in the form [name](link)
-        return link_lit['text'], link_lit['link'], None
+    # the name ends at the first ']' followed by the opening of the url or id, which ends at the end of the text
+    if text.startswith('[') and '\n' not in text:
+        if text.endswith(')') and (split := text.find('](', 1)) > 0:
+            # in the form [name](link)
+            return text[1:split], text[split + 2:-1], None
 
-    if link_def := link_def_regex.fullmatch(text):
-        # in the form [name][id] where id is hopefully linked somewhere else in the document
-        return link_def['text'], None, link_def['link_id'].lower()
+        if text.endswith(']') and (split := text.find('][', 1)) > 0:
+            # in the form [name][id] where id is hopefully linked somewhere else in the document
+            return text[1:split], None, text[split + 2:-1].lower()
 
     return text, None, None
 
 
+def parse_header(line: str) -> Optional[Tuple[int, str]]:
+    """
+    Parse an ATX-style header. The result is the same as matching :py:data:`header_regex`, but takes linear time
+    for any input, where the regex backtracks heavily on long runs of whitespace followed by a ``#``.
+
+    :param line: A single line of markdown
+    :return: A tuple of ``(level, contents)``, or `None` if the line is not a header
+    """
+
+    rest = line.lstrip('#')
+    level = len(line) - len(rest)
+    if not level or not rest[:1].isspace():
+        return None
+
+    if rest.endswith('#'):
+        # closing hashes must be separated from the contents by whitespace
+        end = len(rest.rstrip('#')) - 1
+        if not rest[end].isspace():
+            return None
+        rest = rest[:end]
+
+    if len(rest) < 2 or '#' in rest:
+        return None
+    return level, rest.lstrip() or rest[-1]  # the contents are at least one character, even if it's whitespace
+
+
+def block_kind(text: str) -> str:
+    """
+    Find what kind of block a string of markdown is, judging by its first line like the tokenizer does
+
+    :param text: The markdown text of a single block
+    :return: The kind of block, like :py:attr:`Token.kind`. One of ``h[1-6]``, ``p``, ``li`` or ``code``
+    """
+
+    if code_regex.match(text):
+        return 'code'
+    if li_regex.match(text):
+        return 'li'
+    if text.startswith('#') and (header := parse_header(text.partition('\n')[0])):
+        return f'h{header[0]}'
+    return 'p'
+
+
 def join(segments: List[str]) -> str:
     """
-    Joins multiple lines of markdown by adding double newlines between them, or a single newline between list items
+    Joins multiple lines of markdown by adding double newlines between them, or a single newline between list items.
+    Segments with a ``kind`` like :py:class:`~yaclog.changelog.Entry` are only checked for list items if they are one
 
     :param segments: A list of strings to join
     :return: A joined markdown string
     """
 
     text: List[str] = []
-    last_segment = ''
+    last_list = None
     for segment in segments:
-        if bullet_regex.match(segment) and bullet_regex.match(last_segment):
-            pass
-        elif numbered_regex.match(segment) and numbered_regex.match(last_segment):
-            pass
-        else:
+        list_type = _list_type(segment)
+        if list_type is None or list_type != last_list:
             text.append('')
 
         text.append(segment)
 
-        last_segment = segment
+        last_list = list_type
 
     return '\n'.join(text).strip()
 
 
+def _list_type(segment: str) -> Optional[str]:
+    # which kind of list the segment is an item of, if any
+    kind = getattr(segment, 'kind', None)
+    if kind is None:
+        if bullet_regex.match(segment):
+            return 'bullet'
+        return 'numbered' if numbered_regex.match(segment) else None
+    if kind != 'li':
+        return None
+    return 'bullet' if segment.startswith(('- ', '+ ', '* ')) else 'numbered'
+
+
 class Token:
     """A single tokenized block of markdown, consisting of one or more lines of text."""
 
+    __slots__ = ('line_no', 'lines', 'kind')
+
     def __init__(self, line_no: int, lines: List[str], kind: str):
         self.line_no = line_no
         """Which line this block appears on in the original file"""
@@ -97,51 +159,238 @@ class Token:
         return f'{self.kind}: {self.lines}'
 
 
-def tokenize(text: str):
+def convert_setext(text: str) -> str:
     """
-    Tokenize a markdown string
-
-    The tokenizer is very basic, and only cares about the highest-level blocks
-    (Headers, top-level list items, links, code blocks, paragraphs).
+    Convert setext-style headers to ATX-style headers.
+    An empty line is left in place of each underline so line numbers are preserved.
 
-    :param text: input text to tokenize
-    :return: A list of tokens and a dictionary of links
+    :param text: input markdown text
+    :return: The converted markdown text
     """
 
-    # convert setext-style headers
-    # The extra newline is to preserve line numbers
     text = setext_h1_replace_regex.sub(r'# \g<header>\n', text)
     text = setext_h2_replace_regex.sub(r'## \g<header>\n', text)
+    return text
+
+
+def iter_lines(fp: Iterable[str]) -> Iterator[str]:
+    """
+    Split a file object or other iterable of lines into individual lines without their line endings.
+    The output is the same as calling ``text.split('\\n')`` on the file's full contents,
+    including the empty line after a trailing newline.
+
+    :param fp: A file object, or any iterable of strings. Each string is treated as a single line
+    :return: An iterator over each line
+    """
+
+    ended = True
+    for line in fp:
+        ended = line.endswith('\n')
+        yield line[:-1] if ended else line
+
+    if ended:
+        yield ''
+
+
+def _iter_setext(lines: Iterable[str], underline_regex, prefix: str,
+                 preceded: bool, followed: bool) -> Iterator[str]:
+    # line-by-line equivalent of a setext_*_replace_regex substitution, using two lines of lookahead
+    lines = iter(lines)
+    end = object()
+    header = next(lines, end)
+    underline = next(lines, end)
+    eligible = preceded  # the first line has no newline before it
+
+    while header is not end:
+        after = next(lines, end) if underline is not end else end
+        if (eligible and header and underline is not end and (after is not end or followed)
+                and underline_regex.fullmatch(underline)):
+            yield prefix + header
+            yield ''
+            header = after
+            underline = next(lines, end) if after is not end else end
+        else:
+            yield header
+            header, underline = underline, after
+        eligible = True
+
+
+def iter_setext(lines: Iterable[str], preceded: bool = False, followed: bool = False) -> Iterator[str]:
+    """
+    Convert setext-style headers to ATX-style headers one line at a time.
+    The output is identical to :py:func:`convert_setext`, but only a few lines are held in memory at once.
+
+    :param lines: An iterable of lines to convert
+    :param preceded: If the first line follows another line not included in ``lines``
+    :param followed: If the last line is followed by another line not included in ``lines``
+    :return: An iterator over the converted lines
+    """
+
+    lines = _iter_setext(lines, setext_h1_underline_regex, '# ', preceded, followed)
+    return _iter_setext(lines, setext_h2_underline_regex, '## ', preceded, followed)
 
-    lines = text.split('\n')
-    tokens: List[Token] = []
+
+def index_headers(lines: List[str], level: int = 2, preceded: bool = False, followed: bool = False) \
+        -> Tuple[List[Tuple[int, int, str]], Dict[str, str], List[int]]:
+    """
+    Quickly scan a file for headers of a given level and link definitions, without building any tokens.
+    The results are identical to what :py:func:`iter_tokens` would find, but only lines that could be a header,
+    a link definition, or a code fence are inspected closely.
+
+    :param lines: A list of lines in the file
+    :param level: The header level to look for
+    :param preceded: If ``lines`` is part of a larger file, and the first line follows another line
+    :param followed: If ``lines`` is part of a larger file, and the last line is followed by another line
+    :return: A tuple of ``(headers, links, link_lines)``. ``headers`` is a list of ``(start, end, header)`` tuples
+        for each matching header, where ``start`` and ``end`` are the span of lines making up the header and the
+        blocks following it. Trailing blank lines and link definitions are not included in a span.
+        ``links`` is a dictionary of links, and ``link_lines`` is a list of lines containing link definitions.
+    """
+
+    headers: List[Tuple[int, int, str]] = []
     links = {}
+    link_lines = []
+    code = False
+    last = 0  # the last line containing a block
+
+    def close_header():
+        if headers:
+            start, _, header = headers[-1]
+            headers[-1] = (start, last + 1, header)
+
+    for line_no, (line, converted) in enumerate(zip(lines, iter_setext(lines, preceded, followed))):
+        if code_regex.match(converted):
+            code = not code
+
+        elif code:
+            pass
+
+        elif converted.startswith('#'):
+            if (header := parse_header(converted)) and header[0] == level:
+                close_header()
+                headers.append((line_no, line_no + 1, converted))
+
+        elif converted.startswith('[') and (match := link_id_regex.match(converted)):
+            links[match['link_id'].lower()] = match['link']
+            link_lines.append(line_no)
+            continue
+
+        elif not line or line.isspace():
+            # setext underlines are converted to blank lines, so check the original line
+            continue
+
+        last = line_no
+
+    close_header()
+
+    return headers, links, link_lines
+
+
+def split_headers(text: str, lines: List[str], parts: int, level: int = 2) -> List[Tuple[int, int]]:
+    """
+    Find where to split a file into roughly equal parts that can be indexed and tokenized separately, such as in
+    parallel. Each part after the first starts with a header of the given level that is not inside a code block,
+    so passing ``preceded`` and ``followed`` to :py:func:`index_headers` or :py:func:`iter_tokens` for each part
+    gives the same results as for the whole file. Only lines that could be a header or a code fence are inspected,
+    so this is much faster than tokenizing the file.
+
+    :param text: The contents of the file
+    :param lines: The lines of the file, as given by ``text.split('\\n')``
+    :param parts: How many parts to split the file into. There may be fewer if there are not enough headers
+    :param level: The header level to split at
+    :return: A sorted list of ``(line_no, offset)`` tuples for where each part after the first starts,
+        with the line number and the position of the start of that line in ``text``
+    """
+
+    position, line_no = 0, 0  # a position in the text, and the line it is on
+
+    def line_at(offset):
+        nonlocal position, line_no
+        line_no += text.count('\n', position, offset)
+        position = offset
+        return line_no
+
+    def converted(index):
+        # how the line appears once setext headers are converted. A line starting with '#' or '`' can't be a
+        # setext underline, so only the lines after it matter
+        return next(iter_setext(lines[index:index + 4], preceded=index > 0, followed=index + 4 < len(lines)))
+
+    fences = []  # lines that open or close a code block
+    for match in _fence_regex.finditer(text):
+        if code_regex.match(converted(index := line_at(match.start()))):
+            fences.append(index)
+
+    splits = []
+    candidate_regex = re.compile(f'^#{{{level}}}(?!#)', re.MULTILINE)
+    position, line_no = 0, 0
+    for part in range(1, parts):
+        target = len(text) * part // parts
+        if target < position:
+            continue  # the last split was already past this part
+        for match in candidate_regex.finditer(text, target):
+            index = line_at(match.start())
+            if index == 0 or (splits and index <= splits[-1][0]):
+                continue
+            if (header := parse_header(converted(index))) and header[0] == level \
+                    and bisect.bisect_left(fences, index) % 2 == 0:
+                splits.append((index, match.start()))
+                break
+
+    return splits
+
+
+def iter_tokens(fp: Iterable[str], links: Optional[Dict[str, str]] = None, line_no: int = 0,
+                preceded: bool = False, followed: bool = False) -> Iterator[Token]:
+    """
+    Tokenize a markdown file incrementally, yielding each token once it is complete.
+    Only the current block is held in memory, so this is suitable for very large files.
+
+    :param fp: A file object, or any iterable of lines
+    :param links: A dictionary to add any link definitions to
+    :param line_no: The line number of the first line, used to offset each token's line number
+    :param preceded: If ``fp`` is part of a larger file, and the first line follows another line
+    :param followed: If ``fp`` is part of a larger file, and the last line is followed by another line
+    :return: An iterator over each token
+    """
+
+    return _iter_blocks(iter_setext(iter_lines(fp), preceded, followed), line_no, links)
+
+
+def _iter_blocks(lines: Iterable[str], line_no: int, links: Optional[Dict[str, str]]) -> Iterator[Token]:
+    if links is None:
+        links = {}
 
     # state variables for parsing
+    token = None
     block = None
 
-    for line_no, line in enumerate(lines):
+    for line_no, line in enumerate(lines, line_no):
         if block == 'code':
             # this is the contents of a code block
-            assert block == tokens[-1].kind, 'block state variable in invalid state!'
-            tokens[-1].lines.append(line)
+            assert block == token.kind, 'block state variable in invalid state!'
+            token.lines.append(line)
             if code_regex.match(line):
                 block = None
 
         elif code_regex.match(line):
             # this is the start of a code block
-            tokens.append(Token(line_no, [line], 'code'))
+            if token:
+                yield token
+            token = Token(line_no, [line], 'code')
             block = 'code'
 
         elif li_regex.match(line):
             # this is a list item
-            tokens.append(Token(line_no, [line], 'li'))
+            if token:
+                yield token
+            token = Token(line_no, [line], 'li')
             block = 'li'
 
-        elif match := header_regex.match(line):
+        elif line.startswith('#') and (header := parse_header(line)):
             # this is a header
-            kind = f'h{len(match["hashes"])}'
-            tokens.append(Token(line_no, [line], kind))
+            if token:
+                yield token
+            token = Token(line_no, [line], f'h{header[0]}')
 
         elif match := link_id_regex.match(line):
             # this is a link definition in the form '[id]: link'
@@ -154,12 +403,30 @@ def tokenize(text: str):
 
         elif block:
             # this is a line to be added to a paragraph or list item
-            assert block == tokens[-1].kind, f'block state variable in invalid state! {block} != {tokens[-1].kind}'
-            tokens[-1].lines.append(line)
+            assert block == token.kind, f'block state variable in invalid state! {block} != {token.kind}'
+            token.lines.append(line)
 
         else:
             # this is a new paragraph
-            tokens.append(Token(line_no, [line], 'p'))
+            if token:
+                yield token
+            token = Token(line_no, [line], 'p')
             block = 'p'
 
-    return tokens, links
+    if token:
+        yield token
+
+
+def tokenize(text: str):
+    """
+    Tokenize a markdown string
+
+    The tokenizer is very basic, and only cares about the highest-level blocks
+    (Headers, top-level list items, links, code blocks, paragraphs).
+
+    :param text: input text to tokenize
+    :return: A list of tokens and a dictionary of links
+    """
+
+    links = {}
+    return list(_iter_blocks(convert_setext(text).split('\n'), 0, links)), links
@@ -0,0 +1,236 @@
+"""
+Lightweight instrumentation for finding where time is spent when reading, writing, and releasing changelogs.
+
+The library marks its major phases (reading, indexing, parsing, rendering, writing, git operations) with
+:py:func:`phase`. These cost almost nothing unless a :py:class:`Profiler` is active::
+
+    with yaclog.profiling.Profiler() as profiler:
+        changelog = yaclog.read('CHANGELOG.md')
+        changelog.write()
+
+    print(profiler.summary())
+"""
+
+#  yaclog: yet another changelog tool
+#  Copyright (c) 2024. Andrew Cassidy
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import sys
+import time
+from typing import List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+_active: Optional['Profiler'] = None
+_null = contextlib.nullcontext()
+
+
+def peak_memory() -> Optional[int]:
+    """
+    Get the peak memory usage of the current process
+
+    :return: The peak resident set size in bytes, or `None` if it can't be measured on this platform
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # linux reports KiB, macOS reports bytes
+
+
+def phase(name: str):
+    """
+    Mark a phase of work to be recorded by the active :py:class:`Profiler`, if there is one
+
+    :param name: The name of the phase
+    :return: A context manager wrapping the phase
+    """
+    return _active.phase(name) if _active else _null
+
+
+class Span:
+    """A single recorded phase"""
+
+    def __init__(self, path: Tuple[str, ...], start: float, wall: float, cpu: float, memory: Optional[int]):
+        self.path = path
+        """The name of the phase, preceded by the names of any phases it is nested in"""
+
+        self.start = start
+        """When the phase started, in seconds since the profiler started"""
+
+        self.wall = wall
+        """Wall-clock time spent in the phase, in seconds"""
+
+        self.cpu = cpu
+        """CPU time spent in the phase, in seconds"""
+
+        self.memory = memory
+        """Peak memory usage of the process at the end of the phase, in bytes"""
+
+
+class Profiler:
+    """
+    Records the time spent in each :py:func:`phase` while it is active.
+    Only one profiler can be active at a time.
+    """
+
+    def __init__(self, cprofile: bool = False):
+        """
+        :param cprofile: Also run :py:mod:`cProfile` while the profiler is active
+        """
+
+        self.spans: List[Span] = []
+        """Every phase recorded so far, in the order they finished"""
+
+        self.startup_cpu: Optional[float] = None
+        """CPU time spent before the profiler was started, including interpreter startup and imports"""
+
+        self.wall: float = 0.0
+        """Total wall-clock time the profiler was active for"""
+
+        self.cpu: float = 0.0
+        """Total CPU time the profiler was active for"""
+
+        self.cprofile = None
+        """The :py:class:`cProfile.Profile` object, if enabled"""
+
+        if cprofile:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+
+        self._stack: List[str] = []
+        self._start_wall = 0.0
+        self._start_cpu = 0.0
+
+    def start(self) -> None:
+        """Start recording phases"""
+        global _active
+        if _active:
+            raise RuntimeError('Another profiler is already active')
+        _active = self
+
+        self.startup_cpu = time.process_time()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = self.startup_cpu
+        if self.cprofile:
+            self.cprofile.enable()
+
+    def stop(self) -> None:
+        """Stop recording phases"""
+        global _active
+        if self.cprofile:
+            self.cprofile.disable()
+        self.wall = time.perf_counter() - self._start_wall
+        self.cpu = time.process_time() - self._start_cpu
+        _active = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """
+        Record a phase of work. Phases can be nested.
+
+        :param name: The name of the phase
+        """
+        self._stack.append(name)
+        path = tuple(self._stack)
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start_wall
+            cpu = time.process_time() - start_cpu
+            self.spans.append(Span(path, start_wall - self._start_wall, wall, cpu, peak_memory()))
+            self._stack.pop()
+
+    def totals(self):
+        """
+        Aggregate recorded phases with the same name and nesting
+
+        :return: A list of ``(path, count, wall, cpu, memory)`` tuples, in the order each phase first started
+        """
+        totals = {}
+        for span in sorted(self.spans, key=lambda s: s.start):
+            count, wall, cpu, memory = totals.get(span.path, (0, 0.0, 0.0, None))
+            if span.memory is not None:
+                memory = max(memory or 0, span.memory)
+            totals[span.path] = (count + 1, wall + span.wall, cpu + span.cpu, memory)
+        return [(path, *values) for path, values in totals.items()]
+
+    def summary(self) -> str:
+        """
+        Get a human-readable summary of the recorded phases
+
+        :return: A table of the time spent in each phase
+        """
+
+        def row(name, count, wall, cpu, memory):
+            wall = f'{wall * 1000:10.2f}' if wall is not None else f'{"-":>10}'
+            memory = f'{memory / 2 ** 20:8.1f} MiB' if memory is not None else f'{"-":>12}'
+            return f'{name:24} {count:>6} {wall} {cpu * 1000:10.2f} {memory}'
+
+        lines = [f'{"phase":24} {"count":>6} {"wall ms":>10} {"cpu ms":>10} {"peak rss":>12}']
+        if self.startup_cpu is not None:
+            lines.append(row('startup', '-', None, self.startup_cpu, None))
+        for path, count, wall, cpu, memory in self.totals():
+            lines.append(row('  ' * (len(path) - 1) + path[-1], count, wall, cpu, memory))
+        lines.append(row('total', '-', self.wall, self.cpu, peak_memory()))
+        return '\n'.join(lines)
+
+    def trace(self):
+        """
+        Get the recorded phases in the Trace Event Format, which can be viewed in ``chrome://tracing`` or Perfetto
+
+        :return: A JSON-serializable dictionary
+        """
+        events = [{
+            'name': span.path[-1],
+            'cat': '/'.join(span.path),
+            'ph': 'X',
+            'ts': span.start * 1e6,
+            'dur': span.wall * 1e6,
+            'pid': 0,
+            'tid': 0,
+            'args': {'cpu_ms': span.cpu * 1000, 'peak_rss': span.memory},
+        } for span in self.spans]
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'startup_cpu_ms': (self.startup_cpu or 0) * 1000}}
+
+    def dump(self, path) -> None:
+        """
+        Save the profile to a file
+
+        :param path: Where to save the profile. If it ends in ``.json``, the phases are saved with :py:meth:`trace`,
+            otherwise :py:mod:`cProfile` statistics are saved for use with :py:mod:`pstats`.
+        """
+        if str(path).endswith('.json'):
+            import json
+            with open(path, 'w') as fp:
+                json.dump(self.trace(), fp)
+        elif self.cprofile:
+            self.cprofile.dump_stats(path)
+        else:
+            raise ValueError('cProfile was not enabled for this profiler')
@@ -19,24 +19,50 @@ meant to augment the `packaging.version` module.
 #  You should have received a copy of the GNU Affero General Public License
 #  along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from __future__ import annotations
+
+import functools
 import re
-from typing import Optional, Tuple
+from typing import Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from packaging.version import Version
+
+# packaging is imported the first time a version is actually parsed, since most commands never need it
+_version_regex: Optional[re.Pattern] = None
+
 
-from packaging.version import Version, VERSION_PATTERN
+def __getattr__(name):
+    if name == 'version_regex':
+        return _get_version_regex()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
-version_regex = re.compile(VERSION_PATTERN, re.VERBOSE | re.IGNORECASE)
 
+def _get_version_regex() -> re.Pattern:
+    global _version_regex
+    if _version_regex is None:
+        from packaging.version import VERSION_PATTERN
+        _version_regex = re.compile(VERSION_PATTERN, re.VERBOSE | re.IGNORECASE)
+    return _version_regex
 
+
+@functools.lru_cache(maxsize=1024)
 def extract_version(version_str: str) -> Tuple[Optional[Version], int, int]:
     """
-    Extracts a :pep:`440` version object from a string which may have other text
+    Extracts a :pep:`440` version object from a string which may have other text.
+    Results are cached, since the same version names are often checked many times.
 
     :param version_str: The input string to extract from
     :return: A tuple of (version, start, end), where start and end are the span of the version in the original string
     """
-    match = version_regex.search(version_str)
+    if not any(c.isdigit() for c in version_str):
+        return None, -1, -1  # every version has a release number, so don't bother loading packaging
+
+    match = _get_version_regex().search(version_str)
     if not match:
         return None, -1, -1
+
+    from packaging.version import Version
     return (Version(match[0]),) + match.span()
 
 